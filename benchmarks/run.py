@@ -0,0 +1,244 @@
+#! /usr/bin/env python
+
+## @package run
+# The benchmarks of the client, run against the mock server.
+#
+#	python benchmarks/run.py [--sizes 100,10000,100000] [--latency 0.001] [--only find_by_title,backup]
+#		[--json results.json] [--compare baseline.json] [--tolerance 20]
+#
+# Each benchmark is run once per size, the mock server holding size streams, users and
+# dashboards. The throughput and the latency percentiles are printed. With --compare,
+# the command fails if a throughput dropped by more than the tolerance in percent.
+#
+
+import getopt, json, os, random, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from mock_server import MockGraylog
+from pygraylog.backup import Backup
+from pygraylog.monitoring import InputCheck, StreamCheck
+from pygraylog.server import Server
+from pygraylog.streams import Stream
+
+## The number of single calls timed by the per-call benchmarks.
+MAX_CALLS = 1000
+
+## The result of one benchmark.
+class Result:
+	## This is the constructor.
+	# @param name the benchmark's name
+	# @param size the number of objects held by the server
+	# @param ops the number of operations
+	# @param seconds the total duration
+	# @param latencies the duration of each operation, if they were timed one by one
+	def __init__(self, name, size, ops, seconds, latencies=None):
+		self.name = name
+		self.size = size
+		self.ops = ops
+		self.seconds = seconds
+		self.latencies = sorted(latencies or [])
+
+	## Returns a latency percentile in milliseconds or None.
+	def percentile(self, p):
+		if len(self.latencies) == 0:
+			return None
+
+		return 1000 * self.latencies[int(round(p / 100.0 * (len(self.latencies) - 1)))]
+
+	## Returns the number of operations per second.
+	def throughput(self):
+		return self.ops / self.seconds if self.seconds > 0 else 0
+
+	def to_dict(self):
+		return { 'name' : self.name, 'size' : self.size, 'ops' : self.ops, 'seconds' : self.seconds, 'throughput' : self.throughput(),
+			'p50_ms' : self.percentile(50), 'p95_ms' : self.percentile(95), 'p99_ms' : self.percentile(99) }
+
+## Returns a logged-in Server.
+def connect(port):
+	server = Server('127.0.0.1', port, pool_maxsize=16)
+	server.auth_by_auth_basic('admin', 'admin')
+
+	return server
+
+## Times a function called once per item.
+def time_calls(func, items):
+	latencies = []
+	start = time.time()
+
+	for item in items:
+		_start = time.time()
+		func(item)
+		latencies.append(time.time() - _start)
+
+	return (time.time() - start, latencies)
+
+def bench_stream_create(port, size):
+	server = connect(port)
+	count = min(size, MAX_CALLS)
+
+	(seconds, latencies) = time_calls(lambda i: Stream(server).create({ 'title' : "bench %i" % i, 'description' : 'bench' }), range(count))
+
+	return Result('stream_create', size, count, seconds, latencies)
+
+def bench_stream_create_many(port, size):
+	server = connect(port)
+	count = min(size, MAX_CALLS)
+
+	start = time.time()
+	Stream.create_many(server, [ { 'title' : "bulk %i" % i, 'description' : 'bench' } for i in range(count) ], workers=16)
+
+	return Result('stream_create_many', size, count, time.time() - start)
+
+def bench_find_by_title(port, size):
+	server = connect(port)
+	titles = [ "stream %i" % random.randrange(size) for i in range(min(size, MAX_CALLS)) ]
+	stream = Stream(server)
+
+	(seconds, latencies) = time_calls(stream.find_by_title, titles)
+
+	return Result('find_by_title', size, len(titles), seconds, latencies)
+
+def bench_get_users(port, size):
+	server = connect(port)
+
+	start = time.time()
+	users = server.get_users()
+
+	return Result('get_users', size, len(users), time.time() - start)
+
+def bench_check_perform(port, size):
+	server = connect(port)
+	checks = [ StreamCheck(None, None, None, None, server=server), InputCheck(None, None, None, None, server=server) ]
+
+	(seconds, latencies) = time_calls(lambda check: check.perform(), checks * 5)
+
+	return Result('check_perform', size, len(latencies), seconds, latencies)
+
+def bench_backup(port, size):
+	server = connect(port)
+	directory = tempfile.mkdtemp()
+
+	try:
+		start = time.time()
+		Backup(server).backup(directory, [ 'streams', 'users', 'dashboards', 'inputs' ])
+		seconds = time.time() - start
+	finally:
+		shutil.rmtree(directory)
+
+	# the mock holds size streams, users and dashboards but at most MAX_CALLS inputs
+	return Result('backup', size, 3 * size + min(size, MAX_CALLS), seconds)
+
+## The benchmarks, in the order they are run.
+BENCHMARKS = [
+	('stream_create', bench_stream_create),
+	('stream_create_many', bench_stream_create_many),
+	('find_by_title', bench_find_by_title),
+	('get_users', bench_get_users),
+	('check_perform', bench_check_perform),
+	('backup', bench_backup),
+]
+
+## Runs the benchmarks.
+# @param sizes the numbers of objects
+# @param names the benchmarks to run or None for all of them
+# @param latency the delay added by the mock server to every call
+# @return a list of Result objects
+def run(sizes, names=None, latency=0):
+	results = []
+
+	for size in sizes:
+		for (name, func) in BENCHMARKS:
+			if names != None and name not in names:
+				continue
+
+			# a fresh server per benchmark, the previous ones added objects
+			mock = MockGraylog(size, size, size, min(size, MAX_CALLS), latency)
+			port = mock.start()
+
+			try:
+				result = func(port, size)
+			finally:
+				mock.stop()
+
+			print_result(result)
+			results.append(result)
+
+	return results
+
+def _ms(value):
+	return "%8.2f" % value if value != None else "%8s" % '-'
+
+## Prints one result.
+def print_result(result):
+	print("%-20s %8i %10.1f ops/s %s %s %s ms" % (result.name, result.size, result.throughput(),
+		_ms(result.percentile(50)), _ms(result.percentile(95)), _ms(result.percentile(99))))
+
+## Compares results to a baseline.
+# @param results a list of Result objects
+# @param baseline a list of dicts, as written with --json
+# @param tolerance the accepted throughput drop in percent
+# @return the list of the regressions' descriptions
+def compare(results, baseline, tolerance):
+	reference = dict([ ((b['name'], b['size']), b['throughput']) for b in baseline ])
+	regressions = []
+
+	for result in results:
+		key = (result.name, result.size)
+
+		if key not in reference or reference[key] == 0:
+			continue
+
+		drop = 100.0 * (1 - result.throughput() / reference[key])
+
+		if drop > tolerance:
+			regressions.append("%s at %i objects: %.1f ops/s instead of %.1f (-%.0f%%)" % (result.name, result.size, result.throughput(), reference[key], drop))
+
+	return regressions
+
+def main(argv):
+	sizes = [ 100, 10000, 100000 ]
+	names = None
+	latency = 0
+	output = None
+	baseline = None
+	tolerance = 20
+
+	options, remainder = getopt.gnu_getopt(argv, '', [ 'sizes=', 'only=', 'latency=', 'json=', 'compare=', 'tolerance=' ])
+
+	for opt, arg in options:
+		if opt == '--sizes':
+			sizes = [ int(s) for s in arg.split(',') ]
+		elif opt == '--only':
+			names = arg.split(',')
+		elif opt == '--latency':
+			latency = float(arg)
+		elif opt == '--json':
+			output = arg
+		elif opt == '--compare':
+			baseline = arg
+		elif opt == '--tolerance':
+			tolerance = float(arg)
+
+	print("%-20s %8s %16s %8s %8s %8s" % ('benchmark', 'objects', 'throughput', 'p50', 'p95', 'p99'))
+	results = run(sizes, names, latency)
+
+	if output != None:
+		with open(output, 'w') as f:
+			json.dump([ result.to_dict() for result in results ], f, indent=1)
+
+	if baseline != None:
+		with open(baseline) as f:
+			regressions = compare(results, json.load(f), tolerance)
+
+		for regression in regressions:
+			print("REGRESSION: %s" % (regression))
+
+		if len(regressions) > 0:
+			return 1
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,20 @@
+#! /usr/bin/env python
+
+# Returns the cached result of a check:
+#   check_client.py node1 InputCheck [/var/run/pygraylog/checks.sock]
+
+import sys
+
+from pygraylog.daemon import query, SOCKET_PATH
+
+if len(sys.argv) < 3:
+	print("UNKNOWN - usage: %s <node|*> <check|*> [socket]" % (sys.argv[0]))
+	exit(3)
+
+if len(sys.argv) > 3:
+	(code, output) = query(sys.argv[1], sys.argv[2], sys.argv[3])
+else:
+	(code, output) = query(sys.argv[1], sys.argv[2], SOCKET_PATH)
+
+print(output)
+exit(code)
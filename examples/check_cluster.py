@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+
+import sys, getopt
+
+sys.path.append('/usr/local/nagios/share')
+from pygraylog.monitoring import CheckRunner, InputCheck, StreamCheck, format_nagios
+
+CHECKS = { 'inputs' : InputCheck, 'streams' : StreamCheck }
+
+hostnames = []
+checks = [ InputCheck, StreamCheck ]
+user = ""
+password = ""
+port = 12900
+
+options = ""
+
+#############
+
+try:
+	options, remainder = getopt.gnu_getopt(sys.argv[1:], 'H:p:u:P:c:', ['hosts=', 'port=', 'user=', 'password=', 'checks=' ])
+except getopt.GetoptError as err:
+	print("UNKNOWN - %s" % str(err))
+	exit(3)
+
+for opt, arg in options:
+	if opt in ('-H', '--hosts'):
+		hostnames = [ h for h in arg.split(',') if len(h) > 0 ]
+	elif opt in ('-p', '--port'):
+		port = int(arg)
+	elif opt in ('-u', '--user'):
+		user = arg
+	elif opt in ('-P', '--password'):
+		password = arg
+	elif opt in ('-c', '--checks'):
+		try:
+			checks = [ CHECKS[c] for c in arg.split(',') ]
+		except KeyError as err:
+			print("UNKNOWN - bad check given: %s" % str(err))
+			exit(3)
+
+if len(hostnames) == 0:
+	print("UNKNOWN - no hostname given")
+	exit(3)
+
+if len(user) == 0 or len(password) == 0:
+	print("UNKNOWN - bad user or password given")
+	exit(3)
+
+#############
+
+runner = CheckRunner(hostnames, checks, user, password, port)
+
+(code, output) = format_nagios(runner.run())
+
+print(output)
+exit(code)
@@ -0,0 +1,44 @@
+#! /usr/bin/env python
+
+# Runs the checks of the whole cluster every minute and serves the results:
+#   check_daemon.py -H node1,node2 -u user -P password [-s /var/run/pygraylog/checks.sock]
+
+import sys, getopt
+
+from pygraylog.daemon import CheckDaemon, SOCKET_PATH
+from pygraylog.monitoring import CheckRunner, InputCheck, StreamCheck, ThroughputCheck
+
+hostnames = []
+user = ""
+password = ""
+port = 12900
+path = SOCKET_PATH
+interval = 60
+
+try:
+	options, remainder = getopt.gnu_getopt(sys.argv[1:], 'H:p:u:P:s:i:', ['hosts=', 'port=', 'user=', 'password=', 'socket=', 'interval=' ])
+except getopt.GetoptError as err:
+	print(str(err))
+	exit(1)
+
+for opt, arg in options:
+	if opt in ('-H', '--hosts'):
+		hostnames = [ h for h in arg.split(',') if len(h) > 0 ]
+	elif opt in ('-p', '--port'):
+		port = int(arg)
+	elif opt in ('-u', '--user'):
+		user = arg
+	elif opt in ('-P', '--password'):
+		password = arg
+	elif opt in ('-s', '--socket'):
+		path = arg
+	elif opt in ('-i', '--interval'):
+		interval = int(arg)
+
+runner = CheckRunner(hostnames, [ InputCheck, StreamCheck, ThroughputCheck ], user, password, port)
+daemon = CheckDaemon(runner, interval, path)
+
+try:
+	daemon.serve_forever()
+except KeyboardInterrupt:
+	daemon.stop()
@@ -0,0 +1,571 @@
+#! /usr/bin/env python
+
+## @package pygraylog.aio
+# This package is used to manage Graylog servers using its remote API thanks to asyncio and aiohttp.
+#
+# It requires Python >= 3.5 and aiohttp (pip install pygraylog[async]).
+# The classes reuse the checks, the URL building and the status handling of their
+# blocking counterparts: only the I/O is asynchronous.
+#
+
+import asyncio, json, time
+import aiohttp
+
+from pygraylog.api import StatusCodeHandler
+from pygraylog.cache import SchemaCache, TitleIndex
+from pygraylog.validation import ValidatorRegistry, STRICT
+from pygraylog.server import Server, api_url
+from pygraylog.streams import Stream, Rule
+from pygraylog.users import User
+from pygraylog.dashboards import Dashboard
+from pygraylog.monitoring import MetaCheck, InputCheck, StreamCheck
+
+## A response read by AsyncServer.request.
+# It exposes the same attributes as a requests' response for the status handling.
+class AsyncResponse:
+	## This is the constructor.
+	# @param status_code the HTTP code
+	# @param text the body
+	# @param headers the response's headers
+	def __init__(self, status_code, text, headers):
+		self.status_code = status_code
+		self.text = text
+		self.headers = headers
+
+	## Decodes the body.
+	def json(self):
+		return json.loads(self.text)
+
+## An index of the titles of a resource, rebuilt from the event loop.
+#
+# It behaves like pygraylog.cache.TitleIndex but lookup is a coroutine. The hooks of
+# the shared API classes (add, remove) are not changed.
+class AsyncTitleIndex(TitleIndex):
+	## Rebuilds the index using one list call.
+	# @throw IOError HTTP code >= 500
+	async def _refresh(self):
+		r = await self._server.request('GET', self._server.build_url(self.object_name))
+
+		self._server._handle_request_status_code(r)
+
+		ids = {}
+		for item in r.json()[self.object_name]:
+			if item['title'] not in ids:
+				ids[item['title']] = item['id']
+
+		with self._lock:
+			self._ids = ids
+			self._loaded = time.time()
+
+	## Returns the id of the object having the given title.
+	# @param title the title to find
+	# @throw IOError HTTP code >= 500
+	# @return the id or None
+	async def lookup(self, title):
+		with self._lock:
+			stale = self._is_stale()
+
+		if stale == True:
+			await self._refresh()
+
+		with self._lock:
+			return self._ids.get(title)
+
+## The class used to connect against a Graylog instance from an event loop.
+class AsyncServer(StatusCodeHandler):
+	## This is the constructor.
+	# The aiohttp session is created by the first request, inside the running loop.
+	# @param limit the maximum number of simultaneous connections
+	# @param timeout the total timeout of a request in seconds or None
+	# @param schema_ttl the lifetime of the cached validation schemas in seconds
+	# @param schema_cache_file a JSON file used to persist the validation schemas or None
+	# @param version the server's version if already known, it avoids a call to /system
+	# @param validation the validation mode of the objects: off, sampled or strict
+	# @param title_ttl the lifetime of the title indexes used by find_by_title in seconds
+	def __init__(self, hostname, port=12900, ssl=False, ssl_verify=True, limit=100, timeout=None, schema_ttl=3600, schema_cache_file=None, version=None, validation=STRICT,
+			title_ttl=60):
+		self.error_msg = ""
+		self._auth = None
+
+		self._data = None
+		self._version = version
+
+		self.schemas = SchemaCache(schema_ttl, schema_cache_file)
+		self.validators = ValidatorRegistry(validation)
+
+		self._title_ttl = title_ttl
+		self._title_indexes = {}
+
+		self.url = api_url(hostname, port, ssl)
+
+		self._ssl_verify = ssl == True and ssl_verify == True
+		self._limit = limit
+		self._timeout = timeout
+		self._session = None
+
+	build_url = Server.build_url
+	get_cached_validation_schema = Server.get_cached_validation_schema
+	set_validation_mode = Server.set_validation_mode
+
+	def auth_by_auth_basic(self, user, password):
+		if self._auth == None:
+			self._auth = aiohttp.BasicAuth(user, password)
+		else:
+			self.error_msg = "Authentication already configured."
+			raise ValueError
+
+	## Returns the aiohttp session, it is created on the first call.
+	def _get_session(self):
+		if self._session == None:
+			if self._ssl_verify == True:
+				connector = aiohttp.TCPConnector(limit=self._limit)
+			else:
+				connector = aiohttp.TCPConnector(limit=self._limit, ssl=False)
+
+			self._session = aiohttp.ClientSession(
+				connector=connector,
+				auth=self._auth,
+				headers={ 'Accept' : 'application/json' },
+				timeout=aiohttp.ClientTimeout(total=self._timeout))
+
+		return self._session
+
+	## Performs an HTTP request and reads the whole response.
+	# @param method GET, POST, PUT or DELETE
+	# @param url the URL built by build_url
+	# @param details a JSON serialisable body or None
+	# @param params the query string as a dict or None
+	# @return an AsyncResponse
+	async def request(self, method, url, details=None, params=None):
+		headers = {}
+		data = None
+
+		if details != None:
+			headers['Content-Type'] = 'application/json'
+			data = json.dumps(details)
+
+		async with self._get_session().request(method, url, data=data, params=params, headers=headers) as r:
+			text = await r.text()
+			return AsyncResponse(r.status, text, r.headers)
+
+	## Closes the connections.
+	async def close(self):
+		if self._session != None:
+			await self._session.close()
+			self._session = None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		await self.close()
+
+	## Returns the server's version.
+	# The value is fetched once from /system and then kept.
+	# @throw IOError HTTP code >= 500
+	# @return the version as a string
+	async def get_version(self):
+		if self._version == None:
+			r = await self.request('GET', self.build_url('system'))
+
+			self._handle_request_status_code(r)
+
+			self._version = r.json()['version']
+
+		return self._version
+
+	## Gets the validation schema of the given resource.
+	# The schema is only fetched from /api-docs if it is not in the cache.
+	# @param object_name the type of resource (users, streams...)
+	# @throw IOError HTTP code >= 500
+	# @return the schema or None
+	async def get_validation_schema(self, object_name):
+		_version = await self.get_version()
+
+		schema = self.schemas.get(_version, object_name)
+
+		if schema != None:
+			return schema
+
+		r = await self.request('GET', "%s/api-docs/%s" % (self.url, object_name))
+
+		if r.status_code == 404:
+			return None
+
+		self._handle_request_status_code(r)
+
+		schema = r.json()
+		self.schemas.set(_version, object_name, schema)
+
+		return schema
+
+	## Returns the title index of the given resource, it is created on the first call.
+	# @param object_name streams or dashboards
+	# @return an AsyncTitleIndex
+	def title_index(self, object_name):
+		if object_name not in self._title_indexes:
+			self._title_indexes[object_name] = AsyncTitleIndex(self, object_name, self._title_ttl)
+
+		return self._title_indexes[object_name]
+
+	## Gets all the users.
+	# @param validation the validation mode used to load them or None to use the server's one
+	# @throw IOError HTTP code >= 500
+	# @return a list of AsyncUser objects
+	async def get_users(self, validation=None):
+		r = await self.request('GET', self.build_url('users'))
+
+		self._handle_request_status_code(r)
+
+		_result = []
+		for json_user in r.json()['users']:
+			user = AsyncUser(self)
+			user.load_from_json(json_user, validation)
+			_result.append(user)
+
+		return _result
+
+## A mixin turning the I/O methods of an API class into coroutines.
+#
+# It must be placed before the blocking class in the bases, so that the checks
+# (_check_create, _check_update, _on_created) of the blocking class are reused.
+class AsyncObjectAPI(object):
+	## The type of resource (users, streams...)
+	_object_name = None
+	## The model of /api-docs used to validate the creations or None
+	_create_model = None
+
+	## Builds the URL of the resource or of one of its members.
+	def _path(self, *parts):
+		return self._server.build_url(self._object_name, *parts)
+
+	## Returns the id of the loaded object.
+	# @throw ValueError no object loaded
+	def _get_id(self):
+		if self._data == None or self._id_key not in self._data:
+			self.error_msg = "The object is empty: no %s available." % (self._id_key)
+			raise ValueError
+
+		return self._data[self._id_key]
+
+	## Creates an object using the given dict.
+	# @param details a dict with required keys
+	# @throw TypeError the given variable is not a dict
+	# @throw ValueError some required keys are missing in the given details dict
+	# @throw IOError HTTP code >= 500
+	# @return True if succeded
+	async def create(self, details):
+		self._check_create(details)
+
+		if self._create_model != None:
+			schema = await self._server.get_validation_schema(self._object_name)
+			self._validation_schema = schema['models'][self._create_model]
+
+		self._server.validators.validate(details, self._validation_schema)
+
+		r = await self._server.request('POST', self._path(), details)
+
+		if r.status_code == 201:
+			self._data = details
+			self._response = r.json()
+			self._on_created()
+
+			return True
+
+		self._handle_request_status_code(r)
+		self._response = r.json()
+
+		return False
+
+	## Removes the loaded object from the server.
+	# @throw ValueError no object loaded
+	# @throw IOError HTTP code >= 500
+	# @return True if succeded
+	async def delete(self):
+		_id = self._get_id()
+		r = await self._server.request('DELETE', self._path(_id))
+
+		self._handle_request_status_code(r)
+
+		if r.status_code == 204:
+			self._server.title_index(self._object_name).remove(_id)
+			self._data.clear()
+			return True
+
+		self._response = r.json()
+
+		return False
+
+	## Updates the loaded object using the given dict.
+	# Only the changed keys are sent and nothing is sent if none changed.
+	# @param details a dict with the keys to update.
+	# @throw TypeError the given variable is not a dict
+	# @throw ValueError no object loaded
+	# @throw IOError HTTP code >= 500
+	# @return True if the object has been changed, None if it was already up to date, False if the update failed
+	async def update(self, details):
+		_id = self._get_id()
+
+		self._check_update(details)
+		self._server.validators.validate(details, self._validation_schema)
+
+		changes = self._get_changes(details)
+
+		if len(changes) == 0:
+			return None
+
+		r = await self._server.request('PUT', self._path(_id), changes)
+
+		self._handle_request_status_code(r)
+
+		if r.status_code == 204 or r.status_code == 200:
+			self._data.update(changes)
+			return True
+
+		self._response = r.json()
+
+		return False
+
+	## Tells if an object exists in the server's database.
+	# @param id the id to find (username, id...)
+	# @throw ValueError the given id is empty
+	# @throw IOError HTTP code >= 500
+	# @return True if found
+	async def find_by_id(self, id):
+		if len(id) == 0:
+			self.error_msg = "given id is too short."
+			raise ValueError
+
+		r = await self._server.request('GET', self._path(id))
+
+		if r.status_code == 404:
+			self._response = r.json()
+			return False
+
+		self._handle_request_status_code(r)
+
+		return True
+
+	## Returns the id of the object having the given title.
+	# The server's title index is used, it is rebuilt once older than its ttl.
+	# @param title the title to find
+	# @throw ValueError the given title is empty
+	# @throw IOError HTTP code >= 500
+	# @return the id or None
+	async def find_by_title(self, title):
+		if len(title) == 0:
+			self.error_msg = "given title is too short."
+			raise ValueError
+
+		try:
+			return await self._server.title_index(self._object_name).lookup(title)
+		except (IOError, ValueError):
+			self.error_msg = self._server.error_msg
+			raise
+
+	## Loads an object from the server's database.
+	# @param id the id to find (username, id...)
+	# @throw ValueError the given id is empty
+	# @throw IOError HTTP code >= 500
+	# @return True if found and loaded
+	async def load_from_server(self, id):
+		if len(id) == 0:
+			self.error_msg = "given id is too short."
+			raise ValueError
+
+		r = await self._server.request('GET', self._path(id))
+
+		if r.status_code == 404:
+			self._response = r.json()
+			return False
+
+		self._handle_request_status_code(r)
+
+		self._data = r.json()
+		return True
+
+## This class is used to manage the streams from an event loop.
+class AsyncStream(AsyncObjectAPI, Stream):
+	_object_name = 'streams'
+	_create_model = 'CreateStreamRequest'
+
+	## Gets the rules attached to the stream.
+	# @throw ValueError no stream loaded
+	# @throw IOError HTTP code >= 500
+	# @return a list a rules
+	async def get_rules(self):
+		r = await self._server.request('GET', self._path(self._get_id(), 'rules'))
+
+		self._handle_request_status_code(r)
+
+		return r.json()['stream_rules']
+
+	## Gets the current thoughput of the stream on this node in messages per second
+	# @throw ValueError no stream loaded
+	# @throw IOError HTTP code >= 500
+	# @return the current value
+	async def get_throughput(self):
+		r = await self._server.request('GET', self._path(self._get_id(), 'throughput'))
+
+		self._handle_request_status_code(r)
+
+		return r.json()['throughput']
+
+	## Pauses the current stream.
+	# @throw IOError HTTP code >= 500
+	# @return true on success
+	async def pause(self):
+		if self._data['disabled'] == True:
+			self.error_msg = "The Steam is already stopped."
+			return False
+
+		r = await self._server.request('POST', self._path(self._get_id(), 'pause'))
+
+		self._handle_request_status_code(r)
+
+		return True
+
+	## Resumes the current stream.
+	# @throw IOError HTTP code >= 500
+	# @return true on success
+	async def resume(self):
+		if self._data['disabled'] == False:
+			self.error_msg = "The Steam is already started."
+			return False
+
+		r = await self._server.request('POST', self._path(self._get_id(), 'resume'))
+
+		self._handle_request_status_code(r)
+
+		return True
+
+## This class is used to manage the rules of a stream from an event loop.
+# The stream must be given using attach() first.
+class AsyncRule(AsyncObjectAPI, Rule):
+	_object_name = 'rules'
+
+	def _path(self, *parts):
+		if getattr(self, '_stream', None) == None:
+			self.error_msg = "The rule is not attached to a stream."
+			raise ValueError
+
+		return self._server.build_url('streams', self._stream._data['id'], 'rules', *parts)
+
+	## Sets the new rule's id.
+	def _on_created(self):
+		self._data['id'] = self._response['streamrule_id']
+
+## This class is used to manage the users from an event loop.
+class AsyncUser(AsyncObjectAPI, User):
+	_object_name = 'users'
+	_create_model = 'UserSummary'
+
+	## Updates a user using the given dict.
+	# The password is changed first using update_password.
+	# @param user_details a dict with the keys to update.
+	# @throw TypeError the given variable is not a dict
+	# @throw IOError HTTP code >= 500
+	# @return True if succeded, None if the user was already up to date
+	async def update(self, user_details):
+		if type(user_details) is not dict:
+			self.error_msg = "given user_details must be a dict."
+			raise TypeError
+
+		changed = None
+
+		if 'password' in user_details.keys():
+			if await self.update_password(str(user_details['password'])) == False:
+				return False
+			changed = True
+
+		result = await super(AsyncUser, self).update(user_details)
+
+		if result == None:
+			return changed
+
+		return result
+
+	## Updates a user's password using the given argument.
+	# @param user_passwd the new password.
+	# @throw TypeError the given variable is not a string
+	# @throw IOError HTTP code >= 500
+	# @return True if succeded
+	async def update_password(self, user_passwd):
+		if type(user_passwd) is not str:
+			self.error_msg = "given user_passwd must be a str."
+			raise TypeError
+
+		r = await self._server.request('PUT', self._path(self._get_id(), 'password'), { 'password' : user_passwd })
+
+		self._handle_request_status_code(r)
+
+		if r.status_code == 204:
+			return True
+
+		self._response = r.json()
+
+		return False
+
+## This class is used to manage the dashboards from an event loop.
+class AsyncDashboard(AsyncObjectAPI, Dashboard):
+	_object_name = 'dashboards'
+	_create_model = 'CreateDashboardRequest'
+
+## A metaclass used to create the asynchronous monitoring classes.
+#
+# The JSON processing is the one of the blocking check.
+class AsyncMetaCheck(StatusCodeHandler):
+	## The resource to check
+	_path = None
+
+	## This is the constructor.
+	# @param server an AsyncServer, it can be shared by many checks
+	def __init__(self, server):
+		if server == None:
+			self.error_msg = "bad server given"
+			raise ValueError
+
+		self._server = server
+		self.error_msg = ""
+		self.failed_stuff = []
+
+	## Performs the GET call.
+	# @throw IOError HTTP code 401 or >= 500
+	# @return True if nothing failed
+	async def perform(self):
+		self.failed_stuff = []
+
+		r = await self._server.request('GET', self._server.build_url(self._path))
+
+		if r.status_code == 401:
+			self.error_msg = 'Not authorized (HTTP 401)'
+			raise IOError
+
+		self._handle_request_status_code(r)
+
+		self._process_json(r.json())
+
+		if len(self.failed_stuff) > 0:
+			return False
+		return True
+
+	_process_json = MetaCheck._process_json
+	get_failed_stuff_as_string = MetaCheck.get_failed_stuff_as_string
+
+## This class is used to monitor inputs from an event loop.
+class AsyncInputCheck(AsyncMetaCheck):
+	_path = 'system/inputs'
+	_list_key = InputCheck._list_key
+	_process_item = InputCheck._process_item
+
+## This class is used to monitor streams from an event loop.
+class AsyncStreamCheck(AsyncMetaCheck):
+	_path = 'streams'
+	_list_key = StreamCheck._list_key
+	_process_item = StreamCheck._process_item
+
+## Performs many checks concurrently.
+# @param checks a list of AsyncMetaCheck objects
+# @return a list of booleans or exceptions, sorted like the given checks
+async def perform_all(checks):
+	return await asyncio.gather(*[ check.perform() for check in checks ], return_exceptions=True)
@@ -5,11 +5,29 @@
 #
 
 import sys, json, requests, re
-import jsonschema
 from abc import ABCMeta, abstractmethod
 
+## A mixin used to turn the HTTP status codes into exceptions.
+#
+# It is shared by the servers and the API classes, blocking or not: the given
+# response only needs the status_code and text attributes.
+class StatusCodeHandler(object):
+	## Raises an exception if the given response failed.
+	# error_msg is set to the response's body.
+	# @param r the response
+	# @throw IOError HTTP code >= 500
+	# @throw ValueError HTTP code >= 400
+	def _handle_request_status_code(self, r):
+		if r.status_code >= 500:
+			self.error_msg = r.text
+			raise IOError
+
+		if r.status_code >= 400:
+			self.error_msg = r.text
+			raise ValueError
+
 ## A metaclass used to create the other API classes.
-class MetaRootAPI:
+class MetaRootAPI(StatusCodeHandler):
 	__metaclass__ = ABCMeta
 
 	## This is the abstract constructor.
@@ -24,15 +42,6 @@ class MetaRootAPI:
 		self._data = None
 		self._response = ""
 
-	def _handle_request_status_code(self, r):
-		if r.status_code >= 500:
-			self.error_msg = r.text
-			raise IOError
-
-		if r.status_code >= 400:
-			self.error_msg = r.text
-			raise ValueError
-
 class MetaAdminAPI(MetaRootAPI):
 	__metaclass__ = ABCMeta
 
@@ -42,6 +51,11 @@ class MetaAdminAPI(MetaRootAPI):
 class MetaObjectAPI(MetaRootAPI):
 	__metaclass__ = ABCMeta
 
+	## The (object_name, model) used by load_from_json to find a cached schema.
+	_load_schema = None
+	## The key of self._data identifying the object on the server.
+	_id_key = 'id'
+
 	## This is the main constructor of the class
 	def __init__(self, server):
 		super(MetaObjectAPI, self).__init__(server)
@@ -51,24 +65,33 @@ class MetaObjectAPI(MetaRootAPI):
 		self._validation_schema = {}
 		self.error_msg = ""
 
-	## Gets the validation schema from the server
+	## Checks the details given to create an object.
+	# @param details the object's details
+	# @throw TypeError the given variable is not a dict
+	# @throw ValueError some required keys are missing
+	def _check_create(self, details):
+		if type(details) is not dict:
+			self.error_msg = "given details must be a dict."
+			raise TypeError
+
+	## Checks and cleans the details given to update an object.
+	# @param details the keys to update
+	# @throw TypeError the given variable is not a dict
+	def _check_update(self, details):
+		if type(details) is not dict:
+			self.error_msg = "given details must be a dict."
+			raise TypeError
+
+	## Called once the object has been created, self._response holds the server's answer.
+	def _on_created(self):
+		pass
+
+	## Gets the validation schema from the server's schema cache.
 	# @param object_name the type of resource to find (user, streams...)
 	# @throw IOError HTTP code >= 500
 	# @return the schema or None
 	def _get_validation_schema(self, object_name):
-		_url = "%s/api-docs/%s" % (self._server.url, object_name)
-
-		r = self._server.session.get(_url)
-
-		if r.status_code >= 500:
-			self.error_msg = r.text
-			raise IOError
-
-		if r.status_code == 404:
-			self._response = r.json()
-			return None
-
-		return r.json()
+		return self._server.get_validation_schema(object_name)
 
 	## Creates an object using the given dict.
 	# @param details a dict with required keys
@@ -90,7 +113,7 @@ class MetaObjectAPI(MetaRootAPI):
 	def _create(self, object_name, details):
 		_url = "%s/%s" % (self._server.url, object_name)
 
-		jsonschema.validate(json.dumps(details), self._validation_schema)
+		self._server.validators.validate(details, self._validation_schema)
 
 		r = self._server.session.post(_url, json.dumps(details), headers={'Content-Type': 'application/json'})
 
@@ -98,6 +121,11 @@ class MetaObjectAPI(MetaRootAPI):
 		if r.status_code == 201:
 			self._data = details
 			self._response = r.json()
+			self._on_created()
+
+			# the request body lacks the server's defaults, the object is cached by its next load
+			if self._id_key in self._data:
+				self._server.objects.evict(object_name, self._data[self._id_key])
 
 			return True
 
@@ -138,6 +166,7 @@ class MetaObjectAPI(MetaRootAPI):
 		self._handle_request_status_code(r)
 
 		if r.status_code == 204:
+			self._server.objects.evict(object_name, id)
 			self._data.clear()
 			return True
 
@@ -154,39 +183,56 @@ class MetaObjectAPI(MetaRootAPI):
 	def update(self):
 		raise ValueError
 
+	## Returns the keys of the given details whose value differs from the loaded object.
+	# @param details a dict with the keys to update.
+	# @return a dict
+	def _get_changes(self, details):
+		if self._data == None:
+			return dict(details)
+
+		return dict([ (k, v) for (k, v) in details.items() if k not in self._data or self._data[k] != v ])
+
 	## Updates a previously loaded object from the server.
-	# self._data is cleared on success.
-	# @throw ValueError the given parameters are not valid
+	# Only the changed keys are sent and nothing is sent if none changed.
+	# self._data and the server's object cache are patched on success, the object is not reloaded.
+	# @param object_name the type of resource to find (user, streams...)
+	# @param id the id to find (username, id...)
+	# @param details a dict with the keys to update.
+	# @throw ValueError the object is empty or the given parameters are not valid
 	# @throw IOError HTTP code >= 500
-	# @return True if succeded
+	# @return True if the object has been changed, None if it was already up to date, False if the update failed
 	def _update(self, object_name, id, details):
+		if self._data == None or len(self._data) == 0:
+			self.error_msg = "The object is empty"
+			raise ValueError
+
+		self._server.validators.validate(details, self._validation_schema)
+
+		changes = self._get_changes(details)
+
+		if len(changes) == 0:
+			return None
+
 		_url = "%s/%s/%s" % (self._server.url, object_name, id)
 
-		jsonschema.validate(json.dumps(details), self._validation_schema)
+		r = self._server.session.put(_url, json.dumps(changes), headers={'Content-Type': 'application/json'})
 
-		r = self._server.session.put(_url, json.dumps(details), headers={'Content-Type': 'application/json'})
+		self._handle_request_status_code(r)
 
-		if r.status_code >= 500:
-			self.error_msg = r.text
-			raise IOError
+		if r.status_code == 204 or r.status_code == 200:
+			self._data.update(changes)
 
-		if r.status_code == 400:
-			self.error_msg = r.text
-			raise ValueError
+			if self._server.objects.contains(object_name, id) == True:
+				self._server.objects.put(object_name, id, self._data)
 
-		if r.status_code == 204:
-			for k in details.keys():
-				print "%s - %s = %s" % ( k, details[k], self._data[k] )
-				if details[k] != self._data[k]:
-					self._load_from_server(object_name, id)
-					return True
-			return False
+			return True
 
 		self._response = r.json()
 
 		return False
 
 	## Tells if an object exists in the server's database.
+	# The server's object cache is used first.
 	# @param object_name the type of resource to find (user, streams...)
 	# @param id the id to find (username, id...)
 	# @throw ValueError the given parameters are not valid
@@ -202,6 +248,9 @@ class MetaObjectAPI(MetaRootAPI):
 			self.error_msg = "given id is too short."
 			raise ValueError
 
+		if self._server.objects.contains(object_name, id) == True:
+			return True
+
 		_url = "%s/%s/%s" % (self._server.url, object_name, id)
 
 		r = self._server.session.get(_url)
@@ -215,6 +264,7 @@ class MetaObjectAPI(MetaRootAPI):
 		return True
 
 	## Loads an object from the server's database.
+	# The server's object cache is used first and updated after a GET.
 	# @param object_name the type of resource to find (user, streams...)
 	# @param id the id to find (username, id...)
 	# @throw ValueError the given parameters are not valid
@@ -229,6 +279,12 @@ class MetaObjectAPI(MetaRootAPI):
 			self.error_msg = "given id is too short."
 			raise ValueError
 
+		_data = self._server.objects.get(object_name, id)
+
+		if _data != None:
+			self._data = _data
+			return True
+
 		_url = "%s/%s/%s" % (self._server.url, object_name, id)
 
 		r = self._server.session.get(_url)
@@ -242,18 +298,28 @@ class MetaObjectAPI(MetaRootAPI):
 			return False
 
 		self._data = r.json()
+		self._server.objects.put(object_name, id, self._data)
 		return True
 
 	## Loads an object from the given JSON object.
 	# @param details the data to load
+	# @param validation the validation mode to apply (off, sampled, strict) or None to use the server's one
 	# @throw ValueError the given parameters are not valid
+	# @throw jsonschema.ValidationError the given details do not match the schema
 	# @return True if found and loaded
-	def load_from_json(self,details):
+	def load_from_json(self, details, validation=None):
 		if len(details) == 0:
 			self.error_msg = "given details are too short."
 			raise ValueError
 
-		jsonschema.validate(json.dumps(details), self._validation_schema)
+		if len(self._validation_schema) == 0 and self._load_schema != None:
+			(object_name, model) = self._load_schema
+			schema = self._server.get_cached_validation_schema(object_name)
+
+			if schema != None:
+				self._validation_schema = schema['models'][model]
+
+		self._server.validators.validate(details, self._validation_schema, validation)
 
 		self._data = details
 		return True
@@ -302,74 +368,64 @@ class MetaObjectAPI(MetaRootAPI):
 
 		return r.json()
 
-#	@abstractmethod
-#	def backup(self):
-#		raise ValueError
-
-## A class used to backup and restore the content of Graylog's database
-class Backup(MetaRootAPI):
-	def __init__(self, hostname, port, login, password):
-		super(MetaAdminAPI, self).__init__(hostname, port, login, password)
-
-		self._hostname = hostname
-		self._port = port
-
-	## Exports the whole configuration.
-	def backup():
-		print "TODO"
-
-	## Exports alarms
-	def backup_alarms():
-		print "TODO"
-
-	## Exports alerts
-	def backup_alerts():
-		print "TODO"
-
-	## Exports dashboards
-	def backup_dashboards():
-		print "TODO"
-
-	## Exports extractors
-	def backup_extractors():
-		print "TODO"
-
-	## Exports filters
-	def backup_filters():
-		print "TODO"
-
-	## Exports outputs
-	def backup_outputs():
-		print "TODO"
-
-	## Exports stream rules
-	def backup_stream_rules():
-		print "TODO"
+	## Performs one action of a bulk operation.
+	# @param action create, update or delete
+	# @param item a dict describing the object, it must contain the id key to update or delete
+	# @throw ValueError the given parameters are not valid
+	# @throw IOError HTTP code >= 500
+	# @return the value returned by the action
+	def _bulk(self, action, item):
+		if type(item) is not dict:
+			self.error_msg = "given item must be a dict."
+			raise TypeError
 
-	## Exports streams
-	def backup_streams():
-		print "TODO"
+		if action == 'create':
+			return self.create(dict(item))
 
-	## Exports bundles
-	def backup_bundles():
-		print "TODO"
+		if self._id_key not in item:
+			self.error_msg = "The item has no %s." % (self._id_key)
+			raise ValueError
 
-	## Exports grok
-	def backup_grok():
-		print "TODO"
+		if action == 'delete':
+			self.load_from_json(item, 'off')
+			return self.delete()
 
-	## Exports inputs
-	def backup_inputs():
-		print "TODO"
+		if action == 'update':
+			if self.load_from_server(item[self._id_key]) == False:
+				self.error_msg = "%s not found." % (item[self._id_key])
+				raise ValueError
+			return self.update(dict(item))
 
-	## Exports jobs
-	def backup_jobs():
-		print "TODO"
+		self.error_msg = "bad action given: %s" % (action)
+		raise ValueError
 
-	## Exports LDAP
-	def backup_ldap():
-		print "TODO"
+	## Creates many objects concurrently.
+	# @param server the Server object
+	# @param items an iterable of dicts
+	# @param workers the number of concurrent requests
+	# @return a list of pygraylog.bulk.BulkResult
+	@classmethod
+	def create_many(cls, server, items, workers=8):
+		return server.bulk(cls, 'create', items, workers)
+
+	## Updates many objects concurrently.
+	# @param server the Server object
+	# @param items an iterable of dicts containing the id key and the keys to update
+	# @param workers the number of concurrent requests
+	# @return a list of pygraylog.bulk.BulkResult
+	@classmethod
+	def update_many(cls, server, items, workers=8):
+		return server.bulk(cls, 'update', items, workers)
+
+	## Removes many objects concurrently.
+	# @param server the Server object
+	# @param items an iterable of dicts containing the id key
+	# @param workers the number of concurrent requests
+	# @return a list of pygraylog.bulk.BulkResult
+	@classmethod
+	def delete_many(cls, server, items, workers=8):
+		return server.bulk(cls, 'delete', items, workers)
 
-	## Exports users
-	def backup_users():
-		print "TODO"
+#	@abstractmethod
+#	def backup(self):
+#		raise ValueError
@@ -0,0 +1,516 @@
+#! /usr/bin/env python
+
+## @package pygraylog.backup
+# This package is used to export the configuration of a Graylog server.
+#
+# Each resource is written to its own newline-delimited JSON file, optionally
+# compressed, while it is read from the server: the configuration is never held
+# in memory. The resources are exported concurrently.
+#
+# A manifest stores the hash of every exported object. The incremental backups
+# compare the server's objects to these hashes and only write the added, changed
+# and deleted objects to a delta file. Reading a resource replays its base file
+# and its deltas.
+#
+
+import gzip, hashlib, json, os, threading, time
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from pygraylog.api import MetaRootAPI
+from pygraylog.bulk import BulkEngine
+
+## The supported compressions and the extensions of their files.
+COMPRESSIONS = { None : '.ndjson', 'gzip' : '.ndjson.gz', 'zstd' : '.ndjson.zst' }
+
+## The exported resources, in the order of the report.
+RESOURCES = [ 'index_sets', 'streams', 'stream_rules', 'alert_receivers', 'dashboards', 'users',
+	'inputs', 'extractors', 'grok', 'outputs', 'ldap' ]
+
+## The manifest's file name.
+MANIFEST = 'manifest.json'
+
+## The key identifying the objects of each resource, 'id' is used by default.
+_KEYS = { 'users' : 'username', 'alert_receivers' : 'stream_id' }
+
+## The keys ignored by the hashes because they change without any configuration change.
+_VOLATILE_KEYS = { 'users' : ( 'last_activity', 'session_active', 'client_address' ) }
+
+## Returns the key identifying an exported object.
+# @param resource the resource's name
+# @param item the object
+def object_key(resource, item):
+	if resource == 'ldap':
+		return 'ldap'
+
+	if resource == 'extractors':
+		return "%s/%s" % (item['input_id'], item['id'])
+
+	return "%s" % (item[_KEYS.get(resource, 'id')])
+
+## Returns the hash of an exported object.
+# @param resource the resource's name
+# @param item the object
+def object_hash(resource, item):
+	if resource in _VOLATILE_KEYS:
+		item = dict([ (k, v) for (k, v) in item.items() if k not in _VOLATILE_KEYS[resource] ])
+
+	return hashlib.sha1(json.dumps(item, sort_keys=True).encode('utf-8')).hexdigest()
+
+## Opens a file for writing using the given compression.
+# @param path the file's path
+# @param compression None, gzip or zstd
+# @return a binary file object
+def open_writer(path, compression):
+	if compression == 'gzip':
+		return gzip.open(path, 'wb', 6)
+
+	if compression == 'zstd':
+		return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+
+	return open(path, 'wb')
+
+## Opens a file for reading using the given compression.
+# @param path the file's path
+# @param compression None, gzip or zstd
+# @return a binary file object
+def open_reader(path, compression):
+	if compression == 'gzip':
+		return gzip.open(path, 'rb')
+
+	if compression == 'zstd':
+		return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+
+	return open(path, 'rb')
+
+## Tells which compression was used to write the given file.
+# @param path the file's path
+# @return None, gzip or zstd
+def guess_compression(path):
+	for compression in COMPRESSIONS.keys():
+		if compression != None and path.endswith(COMPRESSIONS[compression]):
+			return compression
+
+	return None
+
+## Yields the objects stored in a newline-delimited JSON file.
+# @param path the file's path
+def read_ndjson(path):
+	f = open_reader(path, guess_compression(path))
+
+	try:
+		buf = b''
+		while True:
+			chunk = f.read(65536)
+
+			if not chunk:
+				break
+
+			lines = (buf + chunk).split(b'\n')
+			buf = lines.pop()
+
+			for line in lines:
+				if len(line) > 0:
+					yield json.loads(line.decode('utf-8'))
+
+		if len(buf) > 0:
+			yield json.loads(buf.decode('utf-8'))
+	finally:
+		f.close()
+
+## A class used to backup the content of Graylog's database.
+class Backup(MetaRootAPI):
+	## This is the constructor.
+	# @param server the Server object, its session pool should hold at least workers connections
+	# @param workers the number of resources exported concurrently
+	# @param compression None, gzip or zstd
+	# @throw ValueError bad compression given or zstandard not installed
+	def __init__(self, server, workers=4, compression='gzip'):
+		super(Backup, self).__init__(server)
+
+		if compression not in COMPRESSIONS:
+			self.error_msg = "bad compression given: %s" % (compression)
+			raise ValueError
+
+		if compression == 'zstd' and zstandard == None:
+			self.error_msg = "the zstandard module is required to use zstd."
+			raise ValueError
+
+		self.workers = workers
+		self.compression = compression
+
+		## The report of the last export: resource -> { file, count, seconds, error }
+		self.report = {}
+
+	## Returns the file used to store a resource.
+	# @param directory the backup's directory
+	# @param resource the resource's name
+	def get_path(self, directory, resource):
+		return os.path.join(directory, resource + COMPRESSIONS[self.compression])
+
+	## Finds the file of a resource in a backup's directory, whatever its compression.
+	# @param directory the backup's directory
+	# @param resource the resource's name
+	# @return the file's path or None if there is none
+	def find_path(self, directory, resource):
+		for extension in COMPRESSIONS.values():
+			path = os.path.join(directory, resource + extension)
+
+			if os.path.exists(path):
+				return path
+
+		return None
+
+	## Returns the resources found in a backup's directory.
+	# @param directory the backup's directory
+	def list_resources(self, directory):
+		manifest = self.read_manifest(directory)
+
+		if manifest != None:
+			return [ resource for resource in RESOURCES if resource in manifest['resources'] ]
+
+		return [ resource for resource in RESOURCES if self.find_path(directory, resource) != None ]
+
+	## Yields the objects of a resource from the server.
+	# @param resource the resource's name
+	# @throw ValueError unknown resource given
+	# @throw IOError HTTP code >= 500
+	def iter_resource(self, resource):
+		if resource not in RESOURCES:
+			self.error_msg = "unknown resource: %s" % (resource)
+			raise ValueError
+
+		return getattr(self, '_iter_' + resource)()
+
+	def _iter_index_sets(self):
+		return self._server.iter_list('system/indices/index_sets', 'index_sets')
+
+	def _iter_streams(self):
+		return self._server.iter_list('streams', 'streams')
+
+	def _iter_stream_rules(self):
+		for stream in self._server.iter_list('streams', 'streams'):
+			for rule in stream.get('rules', []):
+				rule['stream_id'] = stream['id']
+				yield rule
+
+	def _iter_alert_receivers(self):
+		for stream in self._server.iter_list('streams', 'streams'):
+			if 'alert_receivers' in stream:
+				yield { 'stream_id' : stream['id'], 'alert_receivers' : stream['alert_receivers'] }
+
+	def _iter_dashboards(self):
+		return self._server.iter_list('dashboards', 'dashboards')
+
+	def _iter_users(self):
+		return self._server.iter_list('users', 'users')
+
+	def _iter_inputs(self):
+		return self._server.iter_list('system/inputs', 'inputs')
+
+	def _iter_extractors(self):
+		for input in self._server.iter_list('system/inputs', 'inputs'):
+			for extractor in self._server.iter_list("system/inputs/%s/extractors" % (input['id']), 'extractors'):
+				extractor['input_id'] = input['id']
+				yield extractor
+
+	def _iter_grok(self):
+		return self._server.iter_list('system/grok', 'patterns')
+
+	def _iter_outputs(self):
+		return self._server.iter_list('system/outputs', 'outputs')
+
+	def _iter_ldap(self):
+		r = self._server.session.get(self._server.build_url('system/ldap/settings'))
+
+		if r.status_code == 204 or r.status_code == 404:
+			return
+
+		self._handle_request_status_code(r)
+
+		yield r.json()
+
+	## Writes the objects of a resource to a newline-delimited JSON file.
+	# The file is written under a temporary name and renamed once complete.
+	# @param path the file's path
+	# @param resource the resource's name
+	# @param objects an iterable of dicts
+	# @return the hashes of the written objects
+	def _write(self, path, resource, objects):
+		_tmp = path + '.tmp'
+		hashes = {}
+
+		f = open_writer(_tmp, self.compression)
+		try:
+			for item in objects:
+				f.write((json.dumps(item, sort_keys=True) + '\n').encode('utf-8'))
+				hashes[object_key(resource, item)] = object_hash(resource, item)
+		except:
+			f.close()
+			os.remove(_tmp)
+			raise
+
+		f.close()
+		os.rename(_tmp, path)
+
+		return hashes
+
+	## Exports one resource and returns its report.
+	def _export(self, directory, resource):
+		path = self.get_path(directory, resource)
+		start = time.time()
+
+		hashes = self._write(path, resource, self.iter_resource(resource))
+
+		return { 'file' : path, 'count' : len(hashes), 'seconds' : time.time() - start, 'error' : None, 'hashes' : hashes }
+
+	## Writes the changes of one resource to the delta file and returns its report.
+	# @param resource the resource's name
+	# @param old_hashes the hashes of the previous run
+	# @param writer the delta file
+	# @param lock the lock protecting the delta file
+	def _export_delta(self, resource, old_hashes, writer, lock):
+		start = time.time()
+		hashes = {}
+		counts = { 'add' : 0, 'change' : 0, 'delete' : 0 }
+
+		def _record(op, key, item):
+			line = json.dumps({ 'resource' : resource, 'op' : op, 'key' : key, 'data' : item }, sort_keys=True) + '\n'
+			with lock:
+				writer.write(line.encode('utf-8'))
+			counts[op] += 1
+
+		for item in self.iter_resource(resource):
+			key = object_key(resource, item)
+			hashes[key] = object_hash(resource, item)
+
+			if key not in old_hashes:
+				_record('add', key, item)
+			elif old_hashes[key] != hashes[key]:
+				_record('change', key, item)
+
+		for key in old_hashes:
+			if key not in hashes:
+				_record('delete', key, None)
+
+		return { 'count' : len(hashes), 'seconds' : time.time() - start, 'error' : None, 'hashes' : hashes,
+			'added' : counts['add'], 'changed' : counts['change'], 'deleted' : counts['delete'] }
+
+	## Reads the manifest of a backup's directory.
+	# @param directory the backup's directory
+	# @return the manifest or None if there is none
+	def read_manifest(self, directory):
+		path = os.path.join(directory, MANIFEST)
+
+		if os.path.exists(path) == False:
+			return None
+
+		with open(path) as f:
+			return json.load(f)
+
+	## Writes the manifest and removes the delta files no longer used.
+	def _write_manifest(self, directory, manifest):
+		path = os.path.join(directory, MANIFEST)
+
+		with open(path + '.tmp', 'w') as f:
+			json.dump(manifest, f)
+
+		os.rename(path + '.tmp', path)
+
+		used = set()
+		for resource in manifest['resources'].values():
+			used.update(resource['deltas'])
+
+		for name in os.listdir(directory):
+			if name.startswith('delta-') and name not in used:
+				os.remove(os.path.join(directory, name))
+
+	## Runs an export function on each resource concurrently and fills self.report.
+	# @return the list of the failed resources
+	def _run(self, func, resources):
+		self.report = {}
+		failed = []
+
+		for result in BulkEngine(self.workers).run(func, resources):
+			if result.error == None:
+				self.report[result.item] = result.result
+			else:
+				self.report[result.item] = { 'file' : None, 'count' : 0, 'seconds' : 0, 'error' : result.error_msg or repr(result.error) }
+				failed.append(result.item)
+
+		return failed
+
+	## Exports the whole configuration, or the given resources, to a directory.
+	# The resources are exported concurrently, a failure does not stop the others.
+	# The per-resource report is stored in self.report and the objects' hashes in the manifest.
+	# @param directory the backup's directory, it is created if needed
+	# @param resources a list of resources or None for all of them
+	# @return True if every resource has been exported
+	def backup(self, directory, resources=None):
+		if resources == None:
+			resources = RESOURCES
+
+		if os.path.isdir(directory) == False:
+			os.makedirs(directory)
+
+		manifest = self.read_manifest(directory) or { 'resources' : {} }
+
+		failed = self._run(lambda resource: self._export(directory, resource), resources)
+
+		for resource in resources:
+			if resource not in failed:
+				manifest['resources'][resource] = {
+					'base' : os.path.basename(self.report[resource]['file']),
+					'deltas' : [],
+					'hashes' : self.report[resource].pop('hashes') }
+
+		self._write_manifest(directory, manifest)
+
+		if len(failed) > 0:
+			self.error_msg = "failed to export: %s" % (str.join(', ', failed))
+			return False
+
+		return True
+
+	## Exports the changes made since the previous backup.
+	# The added, changed and deleted objects are written to a new delta file.
+	# The resources without any base in the manifest are fully exported.
+	# @param directory the backup's directory
+	# @param resources a list of resources or None for all of them
+	# @return True if every resource has been exported
+	def backup_incremental(self, directory, resources=None):
+		if resources == None:
+			resources = RESOURCES
+
+		manifest = self.read_manifest(directory)
+
+		if manifest == None:
+			return self.backup(directory, resources)
+
+		missing = [ resource for resource in resources if resource not in manifest['resources'] ]
+		resources = [ resource for resource in resources if resource in manifest['resources'] ]
+
+		_prefix = "delta-%s" % (time.strftime('%Y%m%d%H%M%S', time.gmtime()))
+		i = 0
+		while True:
+			name = "%s-%03i%s" % (_prefix, i, COMPRESSIONS[self.compression])
+			path = os.path.join(directory, name)
+
+			if os.path.exists(path) == False:
+				break
+			i += 1
+
+		lock = threading.Lock()
+
+		writer = open_writer(path, self.compression)
+		try:
+			failed = self._run(lambda resource: self._export_delta(resource, manifest['resources'][resource]['hashes'], writer, lock), resources)
+		finally:
+			writer.close()
+
+		for resource in resources:
+			if resource in failed:
+				continue
+
+			report = self.report[resource]
+			manifest['resources'][resource]['hashes'] = report.pop('hashes')
+
+			if report['added'] + report['changed'] + report['deleted'] > 0:
+				manifest['resources'][resource]['deltas'].append(name)
+				report['file'] = path
+			else:
+				report['file'] = None
+
+		report = self.report
+		self._write_manifest(directory, manifest)
+
+		if len(missing) > 0:
+			if self.backup(directory, missing) == False:
+				failed.extend([ resource for resource in missing if self.report[resource]['error'] != None ])
+			report.update(self.report)
+			self.report = report
+
+		if len(failed) > 0:
+			self.error_msg = "failed to export: %s" % (str.join(', ', failed))
+			return False
+
+		return True
+
+	## Yields the objects of a resource from a backup's directory.
+	# The base file is replayed with the deltas of the incremental backups.
+	# Only the deltas of the resource are held in memory.
+	# @param directory the backup's directory
+	# @param resource the resource's name
+	def read(self, directory, resource):
+		manifest = self.read_manifest(directory)
+
+		if manifest == None or resource not in manifest['resources']:
+			path = self.find_path(directory, resource)
+
+			if path == None:
+				raise IOError("no backup of %s found in %s" % (resource, directory))
+
+			for item in read_ndjson(path):
+				yield item
+			return
+
+		ops = {}
+		for name in manifest['resources'][resource]['deltas']:
+			for record in read_ndjson(os.path.join(directory, name)):
+				if record['resource'] == resource:
+					ops[record['key']] = record
+
+		for item in read_ndjson(os.path.join(directory, manifest['resources'][resource]['base'])):
+			if object_key(resource, item) not in ops:
+				yield item
+
+		for record in ops.values():
+			if record['op'] != 'delete':
+				yield record['data']
+
+	## Exports index sets
+	def backup_index_sets(self, directory):
+		return self.backup(directory, [ 'index_sets' ])
+
+	## Exports streams
+	def backup_streams(self, directory):
+		return self.backup(directory, [ 'streams' ])
+
+	## Exports stream rules
+	def backup_stream_rules(self, directory):
+		return self.backup(directory, [ 'stream_rules' ])
+
+	## Exports alert receivers
+	def backup_alert_receivers(self, directory):
+		return self.backup(directory, [ 'alert_receivers' ])
+
+	## Exports dashboards
+	def backup_dashboards(self, directory):
+		return self.backup(directory, [ 'dashboards' ])
+
+	## Exports users
+	def backup_users(self, directory):
+		return self.backup(directory, [ 'users' ])
+
+	## Exports inputs
+	def backup_inputs(self, directory):
+		return self.backup(directory, [ 'inputs' ])
+
+	## Exports extractors
+	def backup_extractors(self, directory):
+		return self.backup(directory, [ 'extractors' ])
+
+	## Exports grok
+	def backup_grok(self, directory):
+		return self.backup(directory, [ 'grok' ])
+
+	## Exports outputs
+	def backup_outputs(self, directory):
+		return self.backup(directory, [ 'outputs' ])
+
+	## Exports LDAP
+	def backup_ldap(self, directory):
+		return self.backup(directory, [ 'ldap' ])
@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+
+## @package pygraylog.bulk
+# This package is used to run many API calls through a bounded pool of workers.
+#
+
+import sys, threading, time
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+## The result of one item of a bulk operation.
+class BulkResult:
+	## This is the constructor.
+	# @param index the position of the item in the given iterable
+	# @param item the processed item
+	def __init__(self, index, item):
+		self.index = index
+		self.item = item
+
+		## False if the function raised or returned False, an update without change succeeds
+		self.success = False
+		self.result = None
+		self.error = None
+		self.error_msg = ""
+
+## This class is used to run a function on many items concurrently.
+#
+# The items are consumed lazily from the given iterable through a bounded queue,
+# so a generator can be given without being materialised. A failing item never aborts
+# the batch: its exception is stored in its BulkResult.
+class BulkEngine:
+	## This is the constructor.
+	# @param workers the number of threads
+	# @throw ValueError bad number of workers given
+	def __init__(self, workers=8):
+		self.error_msg = ""
+
+		if workers < 1:
+			self.error_msg = "bad number of workers given: %s" % (workers)
+			raise ValueError
+
+		self.workers = workers
+
+	## Processes one item and fills its result.
+	def _process(self, func, result):
+		try:
+			result.result = func(result.item)
+			# None is returned by the updates having nothing to change, they succeeded,
+			# and 0 is a result such as a throughput, not a failure
+			result.success = result.result is not False
+		except Exception:
+			result.error = sys.exc_info()[1]
+			result.error_msg = getattr(result.error, 'error_msg', str(result.error))
+
+	## The main loop of a worker thread.
+	def _work(self, func, tasks, results, lock):
+		while True:
+			result = tasks.get()
+
+			if result == None:
+				return
+
+			self._process(func, result)
+
+			with lock:
+				results.append(result)
+
+	## Runs the given function on each item.
+	# @param func a callable taking one item, its returned value is stored in BulkResult.result
+	# @param items an iterable of items
+	# @return a list of BulkResult objects sorted like the given items
+	def run(self, func, items):
+		results = []
+		lock = threading.Lock()
+		tasks = queue.Queue(self.workers * 2)
+
+		threads = []
+		for i in range(self.workers):
+			thread = threading.Thread(target=self._work, args=(func, tasks, results, lock))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+
+		try:
+			for (i, item) in enumerate(items):
+				tasks.put(BulkResult(i, item))
+		finally:
+			for thread in threads:
+				tasks.put(None)
+
+			for thread in threads:
+				thread.join()
+
+		results.sort(key=lambda result: result.index)
+
+		return results
+
+## This class is used to spread calls over time.
+#
+# acquire blocks until the next call is allowed, the calls are started at most
+# rate times per second whatever the number of threads.
+class RateLimiter:
+	## This is the constructor.
+	# @param rate the number of calls per second
+	# @throw ValueError bad rate given
+	def __init__(self, rate):
+		self.error_msg = ""
+
+		if rate <= 0:
+			self.error_msg = "bad rate given: %s" % (rate)
+			raise ValueError
+
+		self.rate = rate
+
+		self._next = 0
+		self._lock = threading.Lock()
+
+	## Waits until a call is allowed.
+	def acquire(self):
+		with self._lock:
+			now = time.time()
+			wait = self._next - now
+			self._next = max(now, self._next) + 1.0 / self.rate
+
+		if wait > 0:
+			time.sleep(wait)
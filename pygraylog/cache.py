@@ -0,0 +1,377 @@
+#! /usr/bin/env python
+
+## @package pygraylog.cache
+# This package is used to store the client-side caches owned by a Server.
+#
+
+import collections, copy, json, os, threading, time
+
+## A cache used to store the validation schemas returned by /api-docs.
+#
+# The entries are keyed by the server's version and the object name (users, streams...)
+# and expire after ttl seconds. If a path is given, the cache is read from and written to
+# this JSON file so that the schemas can be reused by the next runs.
+class SchemaCache:
+	## This is the constructor.
+	# @param ttl the lifetime of an entry in seconds or None to keep them forever
+	# @param path the JSON file used to persist the cache or None
+	def __init__(self, ttl=3600, path=None):
+		self.ttl = ttl
+		self.path = path
+
+		self._entries = {}
+		self._lock = threading.Lock()
+
+		if path != None:
+			self.load()
+
+	## Tells if the given entry has not expired yet.
+	def _is_fresh(self, entry):
+		if self.ttl == None:
+			return True
+
+		return time.time() - entry['fetched'] < self.ttl
+
+	## Returns a cached schema.
+	# Expired entries are evicted.
+	# @param version the server's version
+	# @param object_name the type of resource (users, streams...)
+	# @return the schema or None
+	def get(self, version, object_name):
+		with self._lock:
+			if version not in self._entries or object_name not in self._entries[version]:
+				return None
+
+			entry = self._entries[version][object_name]
+
+			if self._is_fresh(entry) == False:
+				del self._entries[version][object_name]
+				return None
+
+			return entry['schema']
+
+	## Stores a schema and saves the cache on disk if a path is configured.
+	# @param version the server's version
+	# @param object_name the type of resource (users, streams...)
+	# @param schema the schema to store
+	def set(self, version, object_name, schema):
+		with self._lock:
+			if version not in self._entries:
+				self._entries[version] = {}
+
+			self._entries[version][object_name] = { 'fetched' : time.time(), 'schema' : schema }
+
+		if self.path != None:
+			self.save()
+
+	## Removes every entry from the cache.
+	def clear(self):
+		with self._lock:
+			self._entries = {}
+
+	## Loads the entries from the cache file.
+	# A missing or corrupted file is ignored.
+	# @return True if the file was loaded
+	def load(self):
+		if os.path.exists(self.path) == False:
+			return False
+
+		try:
+			with open(self.path) as f:
+				entries = json.load(f)
+		except (IOError, ValueError):
+			return False
+
+		with self._lock:
+			for version in entries.keys():
+				for object_name in list(entries[version].keys()):
+					if self._is_fresh(entries[version][object_name]) == False:
+						del entries[version][object_name]
+			self._entries = entries
+
+		return True
+
+	## Writes the entries to the cache file.
+	# A temporary file is renamed so that concurrent readers never get a partial file.
+	def save(self):
+		_tmp = "%s.%i.tmp" % (self.path, os.getpid())
+
+		with self._lock:
+			with open(_tmp, 'w') as f:
+				json.dump(self._entries, f)
+
+			os.rename(_tmp, self.path)
+
+## An index of the titles of a resource (streams, dashboards...).
+#
+# The index is built from one list call and rebuilt once it is older than ttl seconds.
+# The objects created or removed through the API classes update it, so the lookups
+# made between two refreshes are dictionary hits.
+class TitleIndex:
+	## This is the constructor.
+	# @param server the Server object
+	# @param object_name the type of resource, it is also the key of the list in the response
+	# @param ttl the lifetime of the index in seconds or None to keep it until invalidate is called
+	def __init__(self, server, object_name, ttl=60):
+		self._server = server
+		self.object_name = object_name
+		self.ttl = ttl
+
+		self._ids = None
+		self._loaded = 0
+		self._lock = threading.Lock()
+
+	## Tells if the index must be rebuilt.
+	def _is_stale(self):
+		if self._ids == None:
+			return True
+
+		if self.ttl == None:
+			return False
+
+		return time.time() - self._loaded >= self.ttl
+
+	## Rebuilds the index using one list call, parsed while it is read.
+	# @throw IOError HTTP code >= 500
+	def _refresh(self):
+		ids = {}
+		for item in self._server.iter_list(self.object_name, self.object_name):
+			# the first object wins, like the former linear scans
+			if item['title'] not in ids:
+				ids[item['title']] = item['id']
+
+		self._ids = ids
+		self._loaded = time.time()
+
+	## Returns the id of the object having the given title.
+	# @param title the title to find
+	# @throw IOError HTTP code >= 500
+	# @return the id or None
+	def lookup(self, title):
+		with self._lock:
+			if self._is_stale() == True:
+				self._refresh()
+
+			return self._ids.get(title)
+
+	## Adds an object to the index.
+	# Nothing is done if the index is not built yet.
+	def add(self, title, id):
+		with self._lock:
+			if self._ids != None and title not in self._ids:
+				self._ids[title] = id
+
+	## Removes an object from the index.
+	def remove(self, id):
+		with self._lock:
+			if self._ids == None:
+				return
+
+			for title in [ title for title in self._ids if self._ids[title] == id ]:
+				del self._ids[title]
+
+	## Forces a rebuild on the next lookup.
+	def invalidate(self):
+		with self._lock:
+			self._ids = None
+
+## An identity map of the objects loaded from the server.
+#
+# The objects are keyed by (object_name, id) and evicted when they are older than
+# ttl seconds or when the cache holds more than size objects (least recently used first).
+# Copies are stored and returned, so the objects' _data can be modified freely.
+# The password field is never stored. A size of 0 disables the cache.
+class ObjectCache:
+	## This is the constructor.
+	# @param size the maximum number of objects, 0 to disable the cache
+	# @param ttl the lifetime of an object in seconds or None to keep them until evicted
+	def __init__(self, size=0, ttl=300):
+		self.size = size
+		self.ttl = ttl
+
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	## Tells if the cache is enabled.
+	def enabled(self):
+		return self.size > 0
+
+	## Returns a copy of a cached object.
+	# @param object_name the type of resource (users, streams...)
+	# @param id the object's id
+	# @return the object's data or None
+	def get(self, object_name, id):
+		if self.size == 0:
+			return None
+
+		_key = (object_name, id)
+
+		with self._lock:
+			if _key not in self._entries:
+				return None
+
+			(stored, data) = self._entries.pop(_key)
+
+			if self.ttl != None and time.time() - stored >= self.ttl:
+				return None
+
+			self._entries[_key] = (stored, data)
+
+			return copy.deepcopy(data)
+
+	## Tells if an object is cached, without copying it.
+	# @param object_name the type of resource (users, streams...)
+	# @param id the object's id
+	def contains(self, object_name, id):
+		if self.size == 0:
+			return False
+
+		with self._lock:
+			if (object_name, id) not in self._entries:
+				return False
+
+			(stored, data) = self._entries[(object_name, id)]
+
+			return self.ttl == None or time.time() - stored < self.ttl
+
+	## Stores a copy of an object.
+	# @param object_name the type of resource (users, streams...)
+	# @param id the object's id
+	# @param data the object's data
+	def put(self, object_name, id, data):
+		if self.size == 0 or data == None:
+			return
+
+		_key = (object_name, id)
+		data = copy.deepcopy(data)
+		data.pop('password', None)
+
+		with self._lock:
+			if _key in self._entries:
+				del self._entries[_key]
+
+			self._entries[_key] = (time.time(), data)
+
+			while len(self._entries) > self.size:
+				self._entries.popitem(last=False)
+
+	## Removes an object.
+	# @param object_name the type of resource (users, streams...)
+	# @param id the object's id
+	def evict(self, object_name, id):
+		with self._lock:
+			self._entries.pop((object_name, id), None)
+
+	## Removes every object.
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+## A cache of the responses of the GET calls.
+#
+# The responses are keyed by their URL and parameters. A response carrying an ETag or a
+# Last-Modified header is revalidated with a conditional call, answered by a bodyless 304
+# while it has not changed. The other ones are served without any call during ttl seconds.
+# The writes made through the session drop the responses of the resource they changed.
+# The least recently used responses are evicted when more than size are held, a size
+# of 0 disables the cache.
+class ResponseCache:
+	## This is the constructor.
+	# @param size the maximum number of responses, 0 to disable the cache
+	# @param ttl the lifetime of the responses without validator in seconds
+	def __init__(self, size=0, ttl=5):
+		self.size = size
+		self.ttl = ttl
+
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	## Tells if the cache is enabled.
+	def enabled(self):
+		return self.size > 0
+
+	## Returns a cached entry.
+	# @param key the call's key
+	# @return a dict: { 'stored', 'url', 'response', 'etag', 'last_modified' } or None
+	def get(self, key):
+		with self._lock:
+			if key not in self._entries:
+				return None
+
+			entry = self._entries.pop(key)
+			self._entries[key] = entry
+
+			return entry
+
+	## Tells if an entry can be served without any call.
+	def is_fresh(self, entry):
+		if entry['etag'] != None or entry['last_modified'] != None:
+			return False
+
+		return self.ttl != None and time.time() - entry['stored'] < self.ttl
+
+	## Returns the headers of the conditional call revalidating an entry.
+	def get_conditional_headers(self, entry):
+		headers = {}
+
+		if entry['etag'] != None:
+			headers['If-None-Match'] = entry['etag']
+
+		if entry['last_modified'] != None:
+			headers['If-Modified-Since'] = entry['last_modified']
+
+		return headers
+
+	## Stores a response, its body must have been read.
+	# @param key the call's key
+	# @param url the called URL
+	# @param response a requests' response with a 200 status code
+	def put(self, key, url, response):
+		if self.size == 0:
+			return
+
+		entry = {
+			'stored' : time.time(),
+			'url' : url,
+			'response' : response,
+			'etag' : response.headers.get('ETag'),
+			'last_modified' : response.headers.get('Last-Modified'),
+		}
+
+		with self._lock:
+			self._entries.pop(key, None)
+			self._entries[key] = entry
+
+			while len(self._entries) > self.size:
+				self._entries.popitem(last=False)
+
+	## Marks an entry revalidated by a 304.
+	def touch(self, entry):
+		entry['stored'] = time.time()
+
+	## Removes the responses of the resource a URL belongs to.
+	# A write to streams/<id>/rules drops every cached streams/... response.
+	# @param url the URL of the write
+	def invalidate(self, url):
+		path = url.split('?')[0]
+		i = path.find('/api/')
+
+		if i < 0:
+			self.clear()
+			return
+
+		parts = [ part for part in path[i + 5:].split('/') if len(part) > 0 ]
+		depth = 2 if len(parts) > 0 and parts[0] == 'system' else 1
+		prefix = "/".join([ path[:i + 4] ] + parts[:depth])
+
+		with self._lock:
+			for key in list(self._entries.keys()):
+				_url = self._entries[key]['url'].split('?')[0]
+
+				if _url == prefix or _url.startswith(prefix + '/'):
+					del self._entries[key]
+
+	## Removes every response.
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
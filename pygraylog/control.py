@@ -4,37 +4,46 @@
 # This package is used to control a Graylog instance using its remote API thanks to requests.
 #
 
-import sys, json, requests
+import re, sys, json, requests, time
+import pygraylog.server
+
 from abc import ABCMeta, abstractmethod
 
-from pygraylog.api import MetaAPI
+from pygraylog.api import MetaRootAPI
+from pygraylog.bulk import BulkEngine, RateLimiter
+from pygraylog.monitoring import InputCheck, InputRateCheck, get_input_type
 
 ## A metaclass used to create the control API classes.
 #
 # The methods should not be overwritten. Each class only needs to set the API URL and the allowed command keywords.
 #
-class MetaControl(MetaAPI):
+class MetaControl(MetaRootAPI):
 	__metaclass__ = ABCMeta
 
 	## This is the abstract constructor.
 	# Each child class needs to implement it to add the allowed commands.
+	# @param server an existing Server whose pooled session is used, the connection parameters are then ignored
 	@abstractmethod
-	def __init__(self, hostname, port, login, password, url, id, command):
-		super(MetaControl, self).__init__(hostname, port, login, password)
+	def __init__(self, hostname, port, login, password, url, id, command, server=None):
+		if server == None:
+			server = pygraylog.server.Server(hostname, port)
+			server.auth_by_auth_basic(login, password)
+
+		self._url = server.build_url(url, id, command)
+
+		super(MetaControl, self).__init__(server)
 
 		self._allowed_commands = []
 		self.command = command
 		self.failed_stuff = []
 
-		self._url = "http://%s:%i/%s/%s/%s" % (hostname, port, url, id, command)
-
-	## Performs the POST calls using requests
+	## Performs the POST calls using the server's session
 	def perform(self):
 		if self.check_command() == False:
 			self.error_msg = "Bad keyword, should be: %s" % (self._allowed_commands)
-			raise
+			raise ValueError
 
-		r = requests.post(self._url, auth=(self._login, self._password))
+		r = self._server.session.post(self._url)
 
 		if r.status_code >= 500:
 			self.error_msg = r.text
@@ -73,8 +82,8 @@ class MetaControl(MetaAPI):
 
 ## This class is used to control inputs.
 class InputControl(MetaControl):
-	def __init__(self, hostname, port, login, password, id, command):
-		super(InputControl, self).__init__(hostname, port, login, password, "system/inputs", id, command)
+	def __init__(self, hostname, port, login, password, id, command, server=None):
+		super(InputControl, self).__init__(hostname, port, login, password, "system/inputs", id, command, server)
 
 		self._append_allowed_commands('launch')
 		self._append_allowed_commands('stop')
@@ -82,9 +91,321 @@ class InputControl(MetaControl):
 
 ## This class is used to control streams.
 class StreamControl(MetaControl):
-	def __init__(self, hostname, port, login, password, id):
-		super(InputCheck, self).__init__(hostname, port, login, password, "streams", id, command)
+	def __init__(self, hostname, port, login, password, id, command, server=None):
+		super(StreamControl, self).__init__(hostname, port, login, password, "streams", id, command, server)
 
 		self._append_allowed_commands('clone')
 		self._append_allowed_commands('pause')
 		self._append_allowed_commands('resume')
+
+## This class is used to select the targets of a ClusterControl.
+# Every given criterion must match, no criterion selects everything.
+class Selector:
+	## This is the constructor.
+	# @param type the exact type of the inputs (org.graylog2.inputs.gelf.tcp.GELFTCPInput...)
+	# @param title a regular expression searched in the titles
+	# @param ids a list of ids
+	def __init__(self, type=None, title=None, ids=None):
+		self.type = type
+		self.title = re.compile(title) if title != None else None
+		self.ids = set(ids) if ids != None else None
+
+	## Tells if an input or a stream is selected.
+	# @param item the object as listed by the API
+	def match(self, item):
+		# the input states hold the input in message_input
+		item = item.get('message_input', item)
+
+		if self.ids != None and item['id'] not in self.ids:
+			return False
+
+		if self.type != None and item.get('type') != self.type:
+			return False
+
+		if self.title != None and self.title.search(item.get('title', '')) == None:
+			return False
+
+		return True
+
+## The result of a command sent to one target.
+class ControlResult:
+	## This is the constructor.
+	# @param node the node's URL
+	# @param id the target's id
+	# @param title the target's title
+	def __init__(self, node, id, title):
+		self.node = node
+		self.id = id
+		self.title = title
+
+		## ok, failed or skipped
+		self.status = 'skipped'
+		self.error_msg = None
+
+## This class is used to send a command to many inputs or streams of a cluster.
+#
+# The inputs are resolved on every node since each node runs its own copy of them,
+# the streams are shared by the cluster so they are resolved and controlled through the first node.
+# The targets are controlled concurrently, batch after batch when batch_size is set.
+class ClusterControl:
+	## The control class and the listed resource of each kind of target.
+	_KINDS = { 'inputs' : (InputControl, 'system/inputs', 'inputs'), 'streams' : (StreamControl, 'streams', 'streams') }
+
+	## This is the constructor.
+	# @param servers a list of Server objects, one per node
+	# @param kind inputs or streams
+	# @param command the command to send (launch, stop, restart, pause, resume...)
+	# @param selector a Selector object, None selects everything
+	# @param workers the number of concurrent calls
+	# @param rate the maximum number of calls per second or None
+	# @param batch_size the number of targets per batch or None to send everything at once
+	# @param batch_pause the delay between two batches in seconds
+	# @param stop_on_failure True to skip the next batches once a target failed
+	# @throw ValueError bad servers, kind or command given
+	def __init__(self, servers, kind, command, selector=None, workers=8, rate=None, batch_size=None, batch_pause=0, stop_on_failure=False):
+		if len(servers) == 0:
+			self.error_msg = "no server given"
+			raise ValueError
+
+		if kind not in self._KINDS:
+			self.error_msg = "bad kind given: %s" % (kind)
+			raise ValueError
+
+		self.servers = servers
+		self.kind = kind
+		self.command = command
+		self.selector = selector or Selector()
+		self.workers = workers
+		self.batch_size = batch_size
+		self.batch_pause = batch_pause
+		self.stop_on_failure = stop_on_failure
+
+		self.error_msg = ""
+
+		self._limiter = RateLimiter(rate) if rate != None else None
+
+		control = self._KINDS[kind][0](None, None, None, None, 'id', command, server=servers[0])
+
+		if control.check_command() == False:
+			self.error_msg = "Bad keyword, should be: %s" % (control._allowed_commands)
+			raise ValueError
+
+	## Lists the selected targets of one node.
+	def _resolve_node(self, server):
+		(control_class, path, key) = self._KINDS[self.kind]
+
+		return [ (server, item.get('message_input', item)) for item in server.iter_list(path, key) if self.selector.match(item) ]
+
+	## Lists the selected targets of the cluster.
+	# @throw IOError a node cannot be listed
+	# @return a list of (Server, item) tuples
+	def resolve(self):
+		servers = self.servers if self.kind == 'inputs' else self.servers[:1]
+		targets = []
+
+		for result in BulkEngine(self.workers).run(self._resolve_node, servers):
+			if result.error != None:
+				raise result.error
+
+			targets += result.result
+
+		return targets
+
+	## Sends the command to one target.
+	def _control(self, task):
+		(server, result) = task
+
+		if self._limiter != None:
+			self._limiter.acquire()
+
+		control = self._KINDS[self.kind][0](None, None, None, None, result.id, self.command, server=server)
+
+		try:
+			if control.perform() == True:
+				result.status = 'ok'
+			else:
+				result.status = 'failed'
+				result.error_msg = "%s" % (control.error_msg,)
+		except Exception:
+			result.status = 'failed'
+			result.error_msg = "%s" % (control.error_msg or sys.exc_info()[1],)
+
+		return result
+
+	## Resolves the targets and sends them the command.
+	# @throw IOError a node cannot be listed
+	# @return a list of ControlResult objects, the skipped targets included
+	def perform(self):
+		tasks = [ (server, ControlResult(server.url, item['id'], item.get('title'))) for (server, item) in self.resolve() ]
+		batch_size = self.batch_size or max(1, len(tasks))
+		failed = False
+
+		for start in range(0, len(tasks), batch_size):
+			if failed == True and self.stop_on_failure == True:
+				break
+
+			if start > 0 and self.batch_pause > 0:
+				time.sleep(self.batch_pause)
+
+			for result in BulkEngine(self.workers).run(self._control, tasks[start:start + batch_size]):
+				if result.item[1].status != 'ok':
+					failed = True
+
+		return [ task[1] for task in tasks ]
+
+## This class is used to restart inputs batch after batch without losing the ingestion capacity.
+#
+# Before each batch the message rate of its inputs is read. The batch is restarted, then
+# the orchestrator waits until every input is RUNNING again and has recovered min_rate_ratio
+# of its former rate before restarting the next batch. A batch which does not recover
+# before the timeout aborts the restart: the remaining inputs are skipped. An input
+# whose rate metric cannot be found cannot be gated and aborts the restart too.
+class RollingRestart:
+	## This is the constructor.
+	# @param servers a list of Server objects, one per node
+	# @param selector a Selector object, None selects every input
+	# @param batch_size the number of inputs restarted together
+	# @param min_capacity the part of the selected inputs which must keep running, between 0 and 1, or None
+	# @param min_rate_ratio the part of its former rate an input must recover, 0 to only wait for RUNNING
+	# @param timeout the time given to a batch to recover in seconds
+	# @param poll_interval the delay between two health checks in seconds
+	# @param workers the number of concurrent calls
+	# @throw ValueError bad servers or min_capacity given
+	def __init__(self, servers, selector=None, batch_size=1, min_capacity=None, min_rate_ratio=0.5, timeout=300, poll_interval=5, workers=8):
+		if min_capacity != None and (min_capacity < 0 or min_capacity >= 1):
+			self.error_msg = "bad min_capacity given: %s" % (min_capacity)
+			raise ValueError
+
+		self._control = ClusterControl(servers, 'inputs', 'restart', selector, workers)
+
+		self.batch_size = batch_size
+		self.min_capacity = min_capacity
+		self.min_rate_ratio = min_rate_ratio
+		self.timeout = timeout
+		self.poll_interval = poll_interval
+		self.workers = workers
+
+		self.error_msg = ""
+
+		self._types = {}
+
+	## Returns the batch size allowed by min_capacity.
+	# @throw ValueError not even one input can be stopped
+	def get_batch_size(self, count):
+		if self.min_capacity == None:
+			return self.batch_size
+
+		allowed = int(count * (1 - self.min_capacity))
+
+		if allowed < 1:
+			self.error_msg = "restarting one of the %i inputs would go below the minimum capacity" % (count)
+			raise ValueError
+
+		return min(self.batch_size, allowed)
+
+	## Reads the rates of a batch's inputs, per node.
+	# The inputs whose meter is not found are missing from the result.
+	# @return a dict: (node, id) -> rate
+	def _get_rates(self, tasks):
+		rates = {}
+		nodes = {}
+
+		for (server, result) in tasks:
+			nodes.setdefault(server.url, (server, {}))[1][result.id] = self._types[(server.url, result.id)]
+
+		for (server, inputs) in nodes.values():
+			check = InputRateCheck(None, None, None, None, server=server)
+
+			for (id, rate) in check.get_rates(inputs).items():
+				rates[(server.url, id)] = rate
+
+		return rates
+
+	## Returns the inputs of a batch which are not healthy yet.
+	# @param tasks the batch's (Server, ControlResult) tuples
+	# @param baseline the rates read before the restart
+	# @return a dict: (node, id) -> reason
+	def _get_unhealthy(self, tasks, baseline):
+		unhealthy = {}
+		states = {}
+
+		for (server, result) in tasks:
+			if server.url not in states:
+				states[server.url] = InputCheck(None, None, None, None, server=server).get_states()
+
+			if states[server.url].get(result.id) != 'RUNNING':
+				unhealthy[(server.url, result.id)] = "state %s" % (states[server.url].get(result.id))
+
+		if self.min_rate_ratio > 0:
+			waiting = [ task for task in tasks if (task[0].url, task[1].id) not in unhealthy ]
+			rates = self._get_rates(waiting)
+
+			for (server, result) in waiting:
+				key = (server.url, result.id)
+
+				if key not in rates:
+					unhealthy[key] = "no rate metric found"
+				elif rates[key] < self.min_rate_ratio * baseline[key]:
+					unhealthy[key] = "rate %.1f < %.1f msg/s" % (rates[key], self.min_rate_ratio * baseline[key])
+
+		return unhealthy
+
+	## Waits until a batch is healthy.
+	# @return the unhealthy inputs when the timeout expired, an empty dict otherwise
+	def _wait(self, tasks, baseline):
+		deadline = time.time() + self.timeout
+
+		while True:
+			unhealthy = self._get_unhealthy(tasks, baseline)
+
+			if len(unhealthy) == 0 or time.time() >= deadline:
+				return unhealthy
+
+			time.sleep(self.poll_interval)
+
+	## Restarts the selected inputs.
+	# @throw IOError a node cannot be listed
+	# @throw ValueError min_capacity does not allow any restart
+	# @return a list of ControlResult objects, the skipped inputs included
+	def perform(self):
+		self.error_msg = ""
+
+		items = self._control.resolve()
+		tasks = [ (server, ControlResult(server.url, item['id'], item.get('title'))) for (server, item) in items ]
+		batch_size = self.get_batch_size(len(tasks))
+
+		self._types = dict([ ((server.url, item['id']), get_input_type(item)) for (server, item) in items ])
+
+		for start in range(0, len(tasks), batch_size):
+			batch = tasks[start:start + batch_size]
+			baseline = self._get_rates(batch) if self.min_rate_ratio > 0 else {}
+
+			# an input without baseline could not be gated on its rate, the batch is not restarted
+			failed = [ result for (server, result) in batch if self.min_rate_ratio > 0 and (server.url, result.id) not in baseline ]
+
+			for result in failed:
+				result.status = 'failed'
+				result.error_msg = "no rate metric found before the restart"
+
+			if len(failed) > 0:
+				self.error_msg = "restart aborted: %i inputs have no rate metric" % (len(failed))
+				break
+
+			BulkEngine(self.workers).run(self._control._control, batch)
+
+			failed = [ task[1] for task in batch if task[1].status != 'ok' ]
+
+			if len(failed) == 0:
+				unhealthy = self._wait(batch, baseline)
+
+				for (server, result) in batch:
+					if (server.url, result.id) in unhealthy:
+						result.status = 'failed'
+						result.error_msg = "not recovered after %i seconds: %s" % (self.timeout, unhealthy[(server.url, result.id)])
+						failed.append(result)
+
+			if len(failed) > 0:
+				self.error_msg = "restart aborted: %i inputs failed" % (len(failed))
+				break
+
+		return [ task[1] for task in tasks ]
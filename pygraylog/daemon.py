@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+
+## @package pygraylog.daemon
+# This package is used to run the checks in a resident process.
+#
+# The daemon runs a CheckRunner on a schedule and keeps the latest results. The
+# Nagios or Icinga checks query it through a local Unix socket using query(), which
+# only needs the standard library: no HTTP connection, no requests nor jsonschema import.
+#
+# The protocol is one line per connection: the client sends "<node> <check>\n", where
+# both may be '*', and the daemon answers "<exit code>\n<Nagios output>".
+#
+
+import os, socket, sys, threading, time
+
+try:
+	import socketserver
+except ImportError:
+	import SocketServer as socketserver
+
+## The default path of the socket.
+SOCKET_PATH = '/var/run/pygraylog/checks.sock'
+
+## The handler answering one query.
+class _Handler(socketserver.StreamRequestHandler):
+	def handle(self):
+		line = self.rfile.readline().decode('utf-8').strip().split()
+
+		if len(line) != 2:
+			(code, output) = (3, "UNKNOWN - bad query, '<node> <check>' expected")
+		else:
+			(code, output) = self.server.daemon.get_output(line[0], line[1])
+
+		self.wfile.write(("%i\n%s\n" % (code, output)).encode('utf-8'))
+
+## The Unix socket server, one thread per query.
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+## A daemon polling the nodes and serving the cached results.
+class CheckDaemon:
+	## This is the constructor.
+	# @param runner the CheckRunner object
+	# @param interval the delay between two runs in seconds
+	# @param path the socket's path
+	# @param max_age the age in seconds after which the results are reported as unknown, 3 intervals by default
+	def __init__(self, runner, interval=60, path=SOCKET_PATH, max_age=None):
+		# the clients do not need the HTTP stack
+		from pygraylog.monitoring import format_nagios
+
+		self._format_nagios = format_nagios
+
+		self.runner = runner
+		self.interval = interval
+		self.path = path
+		self.max_age = max_age or 3 * interval
+
+		self.error_msg = ""
+
+		## The time of the last run
+		self.last_run = None
+
+		self._results = []
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._server = None
+
+	## Runs the checks once and stores the results.
+	def poll(self):
+		try:
+			results = self.runner.run()
+		except Exception:
+			self.error_msg = str(sys.exc_info()[1])
+			return
+
+		with self._lock:
+			self._results = results
+			self.last_run = time.time()
+
+	## Returns the cached results of the given node and check.
+	# @param node a node's name or '*'
+	# @param check a check's class name or '*'
+	# @return a list of CheckResult objects
+	def get_results(self, node='*', check='*'):
+		with self._lock:
+			results = self._results
+
+		return [ r for r in results if (node == '*' or r.node == node) and (check == '*' or r.check == check) ]
+
+	## Returns the Nagios output of the given node and check.
+	# @param node a node's name or '*'
+	# @param check a check's class name or '*'
+	# @return a (exit code, text) tuple
+	def get_output(self, node='*', check='*'):
+		if self.last_run == None:
+			return (3, "UNKNOWN - no result yet")
+
+		if time.time() - self.last_run > self.max_age:
+			return (3, "UNKNOWN - results older than %i seconds: %s" % (self.max_age, self.error_msg))
+
+		results = self.get_results(node, check)
+
+		if len(results) == 0:
+			return (3, "UNKNOWN - no check %s on node %s" % (check, node))
+
+		return self._format_nagios(results)
+
+	## The polling loop.
+	def _poll_loop(self):
+		while self._stop.is_set() == False:
+			start = time.time()
+			self.poll()
+			self._stop.wait(max(0, self.interval - (time.time() - start)))
+
+	## Starts the polling and the socket server in background threads.
+	# @throw IOError the socket cannot be created
+	def start(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+		self._server = _Server(self.path, _Handler)
+		self._server.daemon = self
+
+		for target in [ self._poll_loop, self._server.serve_forever ]:
+			thread = threading.Thread(target=target)
+			thread.daemon = True
+			thread.start()
+
+	## Starts the daemon and waits until stop is called.
+	def serve_forever(self):
+		self.start()
+
+		while self._stop.is_set() == False:
+			self._stop.wait(1)
+
+	## Stops the daemon and removes its socket.
+	def stop(self):
+		self._stop.set()
+
+		if self._server != None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+## Queries a running daemon, this is the thin check client.
+# @param node a node's name or '*'
+# @param check a check's class name or '*'
+# @param path the socket's path
+# @param timeout the timeout in seconds
+# @return a (exit code, text) tuple, unknown if the daemon cannot be reached
+def query(node='*', check='*', path=SOCKET_PATH, timeout=5):
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	client.settimeout(timeout)
+
+	try:
+		client.connect(path)
+		client.sendall(("%s %s\n" % (node, check)).encode('utf-8'))
+
+		chunks = []
+		while True:
+			chunk = client.recv(4096)
+			if len(chunk) == 0:
+				break
+			chunks.append(chunk)
+	except (IOError, OSError, socket.error):
+		return (3, "UNKNOWN - daemon unreachable: %s" % (sys.exc_info()[1]))
+	finally:
+		client.close()
+
+	parts = b''.join(chunks).decode('utf-8', 'replace').split('\n', 1)
+
+	# a plugin must never fail with a traceback
+	if len(parts) != 2 or parts[0].strip().isdigit() == False:
+		return (3, "UNKNOWN - empty/invalid reply from daemon")
+
+	return (int(parts[0]), parts[1].rstrip('\n'))
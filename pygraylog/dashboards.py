@@ -9,6 +9,7 @@ import sys, json, requests
 from pygraylog.api import MetaObjectAPI
 
 class Dashboard(MetaObjectAPI):
+	_load_schema = ("dashboards", "CreateDashboardRequest")
 
 	## Creates a dashboard using the given dict.
 	# @param dashboard_details a dict with two required keys (description and title).
@@ -17,6 +18,17 @@ class Dashboard(MetaObjectAPI):
 	# @throw IOError HTTP code >= 500
 	# @return True if succeded
 	def create(self, dashboard_details):
+		self._check_create(dashboard_details)
+
+		self._validation_schema =  super(Dashboard, self)._get_validation_schema("dashboards")['models']['CreateDashboardRequest']
+
+		return super(Dashboard, self)._create("dashboards", dashboard_details)
+
+	## Checks the details given to create a dashboard.
+	# @param dashboard_details the dashboard's details
+	# @throw TypeError the given variable is not a dict
+	# @throw ValueError some required keys are missing in the given dashboard_details dict
+	def _check_create(self, dashboard_details):
 		if type(dashboard_details) is not dict:
 			self.error_msg = "given dashboard_details must be a dict."
 			raise TypeError
@@ -25,9 +37,11 @@ class Dashboard(MetaObjectAPI):
 			self.error_msg = "Some parameters are missing, required: description, title."
 			raise ValueError
 
-		self._validation_schema =  super(Dashboard, self)._get_validation_schema("dashboards")['models']['CreateDashboardRequest']
+	## Sets the new dashboard's id and adds it to the title index.
+	def _on_created(self):
+		self._data['id'] = self._response['dashboard_id']
 
-		return super(Dashboard, self)._create("dashboards", dashboard_details)
+		self._server.title_index('dashboards').add(self._data['title'], self._data['id'])
 
 	## Removes a previously loaded dashboard from the server.
 	# The key 'id' from self._data is used.
@@ -40,7 +54,13 @@ class Dashboard(MetaObjectAPI):
 			self.error_msg = "The object is empty: no id available."
 			raise ValueError
 
-		return super(Dashboard, self).delete("dashboards", self._data['id'])
+		_id = self._data['id']
+
+		if super(Dashboard, self)._delete("dashboards", _id) == True:
+			self._server.title_index('dashboards').remove(_id)
+			return True
+
+		return False
 
 	## Tells if a dashboardname exists in the server's database.
 	# @param dashboardname the dashboard to find
@@ -51,6 +71,7 @@ class Dashboard(MetaObjectAPI):
 		return super(Dashboard, self).find_by_id("dashboards", id)
 
 	## Tells if a dashboardname exists in the server's database.
+	# The server's title index is used, so only one list call is made per refresh.
 	# @param dashboardname the dashboard to find
 	# @throw ValueError the given dashboardname is empty
 	# @throw IOError HTTP code >= 500
@@ -60,23 +81,11 @@ class Dashboard(MetaObjectAPI):
 			self.error_msg = "given title is too short."
 			raise ValueError
 
-		_url = "%s/%s" % (self._url, 'dashboards')
-
-		r = requests.get(_url, auth=(self._login, self._password))
-
-		if r.status_code >= 500:
-			self.error_msg = r.text
-			raise IOError
-
-		if r.status_code == 404:
-			self._response = r.json()
-			return None
-
-		for (i, dashboard) in enumerate(r.json()['dashboards']):
-			if dashboard['title'] == title:
-				return dashboard['id']
-
-		return None
+		try:
+			return self._server.title_index('dashboards').lookup(title)
+		except (IOError, ValueError):
+			self.error_msg = self._server.error_msg
+			raise
 
 	## Loads a dashboardname from the server's database.
 	# @param id the dashboard to find
@@ -90,4 +99,10 @@ class Dashboard(MetaObjectAPI):
 		return self._backup2("dashboards", id)
 
 	def backup_all(self):
-		return self._backup1("dashboards")
+		_result = self._backup1("dashboards")
+
+		if _result != None:
+			for dashboard in _result['dashboards']:
+				self._server.objects.put("dashboards", dashboard['id'], dashboard)
+
+		return _result
@@ -0,0 +1,301 @@
+#! /usr/bin/env python
+
+## @package pygraylog.exporter
+# This package is used to export the health of Graylog clusters to Prometheus.
+#
+# The metrics of every cluster are collected in background at a fixed interval and
+# rendered once in the OpenMetrics text format. The scrapes are served from this
+# cache, so their rate does not change the load put on the clusters.
+#
+
+import getopt, sys, threading, time
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+
+from pygraylog.api import MetaRootAPI
+from pygraylog.bulk import BulkEngine
+from pygraylog.monitoring import BufferCheck, InputCheck, JournalCheck, ThroughputCheck
+from pygraylog.server import Server
+from pygraylog.streams import Stream
+
+## The content type of the OpenMetrics text format.
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+## The exported metrics: name -> help.
+METRICS = {
+	'graylog_up' : 'Whether the cluster answered the last collection.',
+	'graylog_collect_seconds' : 'Duration of the last collection.',
+	'graylog_collect_errors' : 'Number of sections which failed during the last collection.',
+	'graylog_input_running' : 'Whether the input is running.',
+	'graylog_stream_disabled' : 'Whether the stream is paused.',
+	'graylog_stream_throughput' : 'Messages per second routed into the stream.',
+	'graylog_throughput' : 'Messages per second processed by the node.',
+	'graylog_journal_size_bytes' : 'Size of the journal.',
+	'graylog_journal_size_limit_bytes' : 'Maximum size of the journal.',
+	'graylog_journal_uncommitted_entries' : 'Entries of the journal not yet processed.',
+	'graylog_buffer_utilization_percent' : 'Fill of the buffer.',
+}
+
+## Escapes a label value.
+def _escape(value):
+	return ("%s" % (value,)).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+## Renders samples in the OpenMetrics text format.
+# @param samples a list of (name, labels dict, value) tuples
+# @return a string ending with the EOF marker
+def render(samples):
+	families = {}
+
+	for (name, labels, value) in samples:
+		families.setdefault(name, []).append((labels, value))
+
+	lines = []
+
+	for name in sorted(families.keys()):
+		lines.append("# TYPE %s gauge" % (name))
+		lines.append("# HELP %s %s" % (name, METRICS.get(name, name)))
+
+		for (labels, value) in families[name]:
+			if len(labels) == 0:
+				lines.append("%s %s" % (name, repr(float(value))))
+				continue
+
+			_labels = str.join(',', [ '%s="%s"' % (k, _escape(labels[k])) for k in sorted(labels.keys()) ])
+			lines.append("%s{%s} %s" % (name, _labels, repr(float(value))))
+
+	lines.append("# EOF")
+
+	return str.join('\n', lines) + '\n'
+
+## A class collecting the metrics of one cluster.
+# The values are read by the monitoring checks, only their rendering is done here.
+class Collector(MetaRootAPI):
+	## This is the constructor.
+	# @param server the Server object
+	# @param cluster the value of the cluster label
+	# @param workers the number of concurrent throughput calls
+	def __init__(self, server, cluster, workers=8):
+		super(Collector, self).__init__(server)
+
+		self.cluster = cluster
+		self.workers = workers
+
+		self._inputs = InputCheck(None, None, None, None, server=server)
+		self._throughput = ThroughputCheck(None, None, None, None, server=server)
+		self._journal = JournalCheck(None, None, None, None, server=server)
+		self._buffers = BufferCheck(None, None, None, None, server=server)
+
+	def _collect_inputs(self):
+		states = self._inputs.get_titled_states()
+
+		return [ ('graylog_input_running', { 'input' : id, 'title' : states[id][0] }, 1 if states[id][1] == 'RUNNING' else 0) for id in states.keys() ]
+
+	def _collect_streams(self):
+		samples = []
+		streams = {}
+
+		for stream in self._server.iter_list('streams', 'streams'):
+			labels = { 'stream' : stream['id'], 'title' : stream['title'] }
+			samples.append(('graylog_stream_disabled', labels, 1 if stream['disabled'] == True else 0))
+
+			if stream['disabled'] != True:
+				streams[stream['id']] = labels
+
+		for result in Stream.get_throughputs(self._server, list(streams.keys()), self.workers):
+			if result.error != None:
+				raise result.error
+
+			samples.append(('graylog_stream_throughput', streams[result.item], result.result))
+
+		return samples
+
+	def _collect_node(self):
+		samples = [ ('graylog_throughput', {}, self._throughput.get_throughput()) ]
+
+		journal = self._journal.get_journal()
+		samples.append(('graylog_journal_size_bytes', {}, journal.get('journal_size', 0)))
+		samples.append(('graylog_journal_size_limit_bytes', {}, journal.get('journal_size_limit', 0)))
+		samples.append(('graylog_journal_uncommitted_entries', {}, journal.get('uncommitted_journal_entries', 0)))
+
+		buffers = self._buffers.get_utilization()
+		for name in buffers.keys():
+			samples.append(('graylog_buffer_utilization_percent', { 'buffer' : name }, buffers[name]))
+
+		return samples
+
+	## Collects the metrics.
+	# A failing section does not prevent the others from being collected.
+	# @return a list of (name, labels dict, value) tuples
+	def collect(self):
+		start = time.time()
+		samples = []
+		errors = 0
+
+		for section in [ self._collect_inputs, self._collect_streams, self._collect_node ]:
+			try:
+				samples += section()
+			except Exception:
+				errors += 1
+				error = sys.exc_info()[1]
+				self.error_msg = getattr(error, 'error_msg', None) or str(error)
+
+		samples.append(('graylog_up', {}, 1 if errors < 3 else 0))
+		samples.append(('graylog_collect_errors', {}, errors))
+		samples.append(('graylog_collect_seconds', {}, time.time() - start))
+
+		for (name, labels, value) in samples:
+			labels['cluster'] = self.cluster
+
+		return samples
+
+## The handler serving the cached metrics.
+class _Handler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path.split('?')[0] != '/metrics':
+			self.send_error(404)
+			return
+
+		body = self.server.exporter.get_metrics().encode('utf-8')
+
+		self.send_response(200)
+		self.send_header('Content-Type', CONTENT_TYPE)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args): pass
+
+## The HTTP server, one thread per scrape.
+class _Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+## A class serving the metrics of several clusters.
+class Exporter:
+	## This is the constructor.
+	# @param collectors a list of Collector objects
+	# @param refresh the delay between two collections in seconds
+	# @param workers the number of clusters collected concurrently
+	def __init__(self, collectors, refresh=30, workers=8):
+		self.collectors = collectors
+		self.refresh = refresh
+		self.workers = workers
+
+		self._metrics = render([])
+		self._stop = threading.Event()
+		self._server = None
+
+	## Collects every cluster once and renders the result.
+	def update(self):
+		samples = []
+
+		for result in BulkEngine(self.workers).run(lambda collector: collector.collect(), self.collectors):
+			samples += result.result or []
+
+		self._metrics = render(samples)
+
+	## Returns the last rendered metrics.
+	def get_metrics(self):
+		return self._metrics
+
+	## The collecting loop.
+	def _update_loop(self):
+		while self._stop.is_set() == False:
+			start = time.time()
+			self.update()
+			self._stop.wait(max(0, self.refresh - (time.time() - start)))
+
+	## Starts collecting and serving in background threads.
+	# @param port the listening port
+	# @param address the listening address
+	def start(self, port=9833, address=''):
+		self._server = _Server((address, port), _Handler)
+		self._server.exporter = self
+
+		for target in [ self._update_loop, self._server.serve_forever ]:
+			thread = threading.Thread(target=target)
+			thread.daemon = True
+			thread.start()
+
+	## Stops the exporter.
+	def stop(self):
+		self._stop.set()
+
+		if self._server != None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+## The usage of the command.
+USAGE = """usage: pygraylog-exporter -c name=host[:port] [-c ...] -u user -P password [-l port] [-r seconds] [-s]
+  -c, --cluster    a cluster to collect, repeat it for each cluster
+  -u, --user       the API user
+  -P, --password   the API password
+  -l, --listen     the listening port, 9833 by default
+  -r, --refresh    the delay between two collections, 30 seconds by default
+  -s, --ssl        use HTTPS to reach the clusters"""
+
+## The command's entry point.
+def main(argv=None):
+	if argv == None:
+		argv = sys.argv[1:]
+
+	clusters = []
+	user = ""
+	password = ""
+	listen = 9833
+	refresh = 30
+	ssl = False
+
+	try:
+		options, remainder = getopt.gnu_getopt(argv, 'c:u:P:l:r:s', ['cluster=', 'user=', 'password=', 'listen=', 'refresh=', 'ssl' ])
+	except getopt.GetoptError as err:
+		print("%s\n%s" % (str(err), USAGE))
+		return 1
+
+	for opt, arg in options:
+		if opt in ('-c', '--cluster'):
+			clusters.append(arg)
+		elif opt in ('-u', '--user'):
+			user = arg
+		elif opt in ('-P', '--password'):
+			password = arg
+		elif opt in ('-l', '--listen'):
+			listen = int(arg)
+		elif opt in ('-r', '--refresh'):
+			refresh = int(arg)
+		elif opt in ('-s', '--ssl'):
+			ssl = True
+
+	if len(clusters) == 0 or len(user) == 0 or len(password) == 0:
+		print(USAGE)
+		return 1
+
+	collectors = []
+
+	for cluster in clusters:
+		(name, address) = cluster.split('=', 1) if '=' in cluster else (cluster, cluster)
+		(hostname, port) = address.split(':', 1) if ':' in address else (address, 12900)
+
+		server = Server(hostname, int(port), ssl, connect_timeout=10, read_timeout=30)
+		server.auth_by_auth_basic(user, password)
+
+		collectors.append(Collector(server, name))
+
+	exporter = Exporter(collectors, refresh)
+	exporter.start(listen)
+
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		exporter.stop()
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
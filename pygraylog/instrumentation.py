@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+
+## @package pygraylog.instrumentation
+# This package is used to measure the calls made by a Server.
+#
+# Every call of the server's session is recorded per endpoint: the ids found in the
+# URL are replaced by placeholders, so GET streams/<id> calls are summed together and
+# an N+1 pattern shows up as one endpoint with a high count.
+#
+# Hooks can be added to trace the calls, OpenTelemetry-style. A hook is called with
+# (method, endpoint, url) before the call and may return a callable, called with
+# (status_code, seconds, error) once the call is over:
+#
+#	def trace(method, endpoint, url):
+#		span = tracer.start_span("%s %s" % (method, endpoint))
+#		def end(status_code, seconds, error):
+#			span.set_attribute('http.status_code', status_code)
+#			span.end()
+#		return end
+#
+#	server.add_hook(trace)
+#
+
+import re, threading
+
+try:
+	from urllib.parse import urlparse
+except ImportError:
+	from urlparse import urlparse
+
+## The upper bounds of the latency buckets in milliseconds.
+BUCKETS = [ 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000 ]
+
+## The segments taken for ids: Mongo ids, UUIDs and numbers.
+_ID = re.compile(r'^([0-9a-f]{24}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9]+)$')
+
+## The top-level resources whose next segment is a name rather than an id.
+_NAMED = [ 'users', 'roles' ]
+
+## Returns the endpoint of a URL: its path without the API prefix and with the ids replaced.
+# @param url the called URL
+# @return a string such as streams/{id}/rules
+def get_endpoint(url):
+	parts = [ part for part in urlparse(url).path.split('/') if len(part) > 0 ]
+
+	if len(parts) > 0 and parts[0] == 'api':
+		parts = parts[1:]
+
+	for i in range(len(parts)):
+		if _ID.match(parts[i]) != None:
+			parts[i] = '{id}'
+		elif i == 1 and parts[0] in _NAMED:
+			parts[i] = '{name}'
+
+	return str.join('/', parts)
+
+## The measures of one endpoint.
+class EndpointStats:
+	def __init__(self):
+		self.count = 0
+		self.errors = 0
+		self.retries = 0
+		self.coalesced = 0
+		self.cached = 0
+		self.seconds = 0.0
+		self.max_seconds = 0.0
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.status_codes = {}
+		self.histogram = [ 0 ] * (len(BUCKETS) + 1)
+
+	## Records one call.
+	def add(self, status_code, seconds, bytes_sent, bytes_received, retries):
+		self.count += 1
+		self.retries += retries
+		self.seconds += seconds
+		self.max_seconds = max(self.max_seconds, seconds)
+		self.bytes_sent += bytes_sent
+		self.bytes_received += bytes_received
+
+		if status_code == None or status_code >= 400:
+			self.errors += 1
+
+		self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+		ms = seconds * 1000
+		i = 0
+		while i < len(BUCKETS) and ms > BUCKETS[i]:
+			i += 1
+		self.histogram[i] += 1
+
+	## Returns the measures as a dict.
+	def to_dict(self):
+		return {
+			'count' : self.count,
+			'errors' : self.errors,
+			'retries' : self.retries,
+			'coalesced' : self.coalesced,
+			'cached' : self.cached,
+			'seconds' : self.seconds,
+			'mean_seconds' : self.seconds / self.count if self.count > 0 else 0,
+			'max_seconds' : self.max_seconds,
+			'bytes_sent' : self.bytes_sent,
+			'bytes_received' : self.bytes_received,
+			'status_codes' : dict(self.status_codes),
+			'histogram' : dict(zip([ "<=%ims" % b for b in BUCKETS ] + [ ">%ims" % BUCKETS[-1] ], self.histogram)),
+		}
+
+## The measures of all the calls of a session.
+class RequestStats:
+	def __init__(self):
+		self._endpoints = {}
+		self._hooks = []
+		self._lock = threading.Lock()
+
+	## Adds a tracing hook.
+	# @param hook a callable taking (method, endpoint, url) and returning None or a callable taking (status_code, seconds, error)
+	def add_hook(self, hook):
+		with self._lock:
+			self._hooks = self._hooks + [ hook ]
+
+	## Removes a tracing hook.
+	def remove_hook(self, hook):
+		with self._lock:
+			self._hooks = [ h for h in self._hooks if h != hook ]
+
+	## Calls the hooks before a call.
+	# @return the list of the callables to call after it
+	def start(self, method, endpoint, url):
+		ends = []
+
+		for hook in self._hooks:
+			end = hook(method, endpoint, url)
+
+			if end != None:
+				ends.append(end)
+
+		return ends
+
+	## Records a call and calls the ends returned by the hooks.
+	# @param status_code the status code or None if the call failed
+	def record(self, method, endpoint, status_code, seconds, bytes_sent, bytes_received, retries, ends=[], error=None):
+		key = "%s %s" % (method, endpoint)
+
+		with self._lock:
+			if key not in self._endpoints:
+				self._endpoints[key] = EndpointStats()
+
+			self._endpoints[key].add(status_code, seconds, bytes_sent, bytes_received, retries)
+
+		for end in ends:
+			end(status_code, seconds, error)
+
+	## Records a call answered by an identical one in flight, it did not reach the server.
+	def record_coalesced(self, method, endpoint):
+		self._count(method, endpoint, 'coalesced')
+
+	## Records a call answered by the response cache, it did not reach the server.
+	def record_cached(self, method, endpoint):
+		self._count(method, endpoint, 'cached')
+
+	## Increments a counter of an endpoint.
+	def _count(self, method, endpoint, name):
+		key = "%s %s" % (method, endpoint)
+
+		with self._lock:
+			if key not in self._endpoints:
+				self._endpoints[key] = EndpointStats()
+
+			setattr(self._endpoints[key], name, getattr(self._endpoints[key], name) + 1)
+
+	## Returns a summary of the calls.
+	# @return a dict: { 'endpoints' : { 'METHOD endpoint' : measures }, 'total' : measures }
+	def summary(self):
+		with self._lock:
+			endpoints = dict([ (key, stats.to_dict()) for (key, stats) in self._endpoints.items() ])
+
+		total = {}
+		for name in [ 'count', 'errors', 'retries', 'coalesced', 'cached', 'seconds', 'bytes_sent', 'bytes_received' ]:
+			total[name] = sum([ stats[name] for stats in endpoints.values() ])
+
+		return { 'endpoints' : endpoints, 'total' : total }
+
+	## Drops the measures, the hooks are kept.
+	def reset(self):
+		with self._lock:
+			self._endpoints = {}
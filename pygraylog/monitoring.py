@@ -4,25 +4,50 @@
 # This package is used to monitor a Graylog instance using its remote API thanks to pycurl.
 #
 
-import sys, json, requests, StringIO
+import sys, json, requests, time
+from collections import deque
 import pygraylog.server
 
 from abc import ABCMeta, abstractmethod
 from pygraylog.api import MetaRootAPI
+from pygraylog.bulk import BulkEngine
+from pygraylog.sampler import RingBuffer, mean
+from pygraylog.streaming import iter_json_list
+from pygraylog.streams import Stream
+
+## The Nagios' states, their value is the plugin's exit code.
+OK = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+
+STATE_NAMES = [ 'OK', 'WARNING', 'CRITICAL', 'UNKNOWN' ]
+
+## The states sorted by severity, a critical check wins over an unknown one.
+_SEVERITY = [ OK, WARNING, UNKNOWN, CRITICAL ]
 
 ## A metaclass used to create the monitoring classes.
 #
-# Only one method needs to be overwritten by the children classes.
+# The children classes set the key of the checked list and overwrite _process_item.
 #
 class MetaCheck(MetaRootAPI):
 	__metaclass__ = ABCMeta
 
 	failed_stuff = []
 
+	## The key holding the checked list in the response
+	_list_key = None
+
 	## This is the abstract constructor.
 	# Each child class needs to implement it using the right parameters.
+	# @param server an existing Server whose pooled session is used, the connection parameters are then ignored
 	@abstractmethod
-	def __init__(self, hostname, port, login, password, url):
+	def __init__(self, hostname, port, login, password, url, server=None):
+		if server != None:
+			super(MetaCheck, self).__init__(server)
+			self._url = server.build_url(url)
+			return
+
 		server = pygraylog.server.Server(hostname, port)
 		server.auth_by_auth_basic(login, password)
 
@@ -36,55 +61,528 @@ class MetaCheck(MetaRootAPI):
 			self.error_msg = "bad password given"
 			raise ValueError
 
-		self._url = "http://%s:%i/%s" % (hostname, port, url)
+		self._url = server.build_url(url)
 
 	## Updates the failed_stuff list in case of error.
-	# @param buf the binary result from a CURL call.
+	# @param item one element of the checked list
 	@abstractmethod
-	def _process_json(self, buf): pass
+	def _process_item(self, item): pass
 
-	## Performs the GET calls using requestss
+	## Updates the failed_stuff list using a whole decoded response.
+	# @param buf the decoded JSON response
+	def _process_json(self, buf):
+		for item in buf[self._list_key]:
+			self._process_item(item)
+
+	## Performs the GET calls using requests
+	# The list is processed while the response is read.
 	def perform(self):
-		r = self._server.session.get(self._url)
+		self.failed_stuff = []
+
+		r = self._server.session.get(self._url, stream=True)
 
 		if r.status_code == 401:
 			self.error_msg = 'Not authorized (HTTP 401)'
 			raise IOError
 
-		self._process_json(r.json)
+		self._handle_request_status_code(r)
+
+		for item in iter_json_list(r, self._list_key):
+			self._process_item(item)
 
 		if len(self.failed_stuff) > 0:
 			return False
 		return True
 
+	## Returns the Nagios state of the last perform.
+	def get_state(self):
+		if len(self.failed_stuff) > 0:
+			return CRITICAL
+		return OK
+
 	## Joins the list using ',' to return a string.
 	def get_failed_stuff_as_string(self):
 		if len(self.failed_stuff) > 0:
 			return str.join(', ', self.failed_stuff)
 		return None
 
+## Returns the type of an input, the class name Graylog uses to name its metrics.
+# @param input an item of the system/inputs list
+# @return a string such as org.graylog2.inputs.gelf.tcp.GELFTCPInput
+def get_input_type(input):
+	if 'message_input' in input:
+		return input['message_input']['type']
+
+	return input['type']
+
 ## This class is used to monitor inputs.
 # It alerts if some inputs are not running.
 class InputCheck(MetaCheck):
+	_list_key = "inputs"
 
-	def __init__(self, hostname, port, login, password):
-		super(InputCheck, self).__init__(hostname, port, login, password, "system/inputs")
+	def __init__(self, hostname, port, login, password, server=None):
+		super(InputCheck, self).__init__(hostname, port, login, password, "system/inputs", server)
 
-	## Checks if some inputs are not running.
-	def _process_json(self, buf):
-		for (i, input) in enumerate(buf["inputs"]):
-			if input["state"] != "RUNNING":
-				self.failed_stuff.append(input["message_input"]["title"])
+	## Returns the title and the state of every input.
+	# @throw IOError HTTP code >= 500
+	# @return a dict: id -> (title, state)
+	def get_titled_states(self):
+		return dict([ (input['id'], (input['message_input']['title'], input['state'])) for input in self._server.iter_list('system/inputs', 'inputs') ])
+
+	## Returns the state of every input.
+	# @throw IOError HTTP code >= 500
+	# @return a dict: id -> state (RUNNING, FAILED...)
+	def get_states(self):
+		states = self.get_titled_states()
+
+		return dict([ (id, states[id][1]) for id in states.keys() ])
+
+	## Checks if the input is not running.
+	def _process_item(self, input):
+		if input["state"] != "RUNNING":
+			self.failed_stuff.append(input["message_input"]["title"])
 
 ## This class is used to monitor streams.
 # It alerts if some streams are disabled.
 class StreamCheck(MetaCheck):
+	_list_key = "streams"
 
-	def __init__(self, hostname, port, login, password):
-		super(StreamCheck, self).__init__(hostname, port, login, password, "streams")
+	def __init__(self, hostname, port, login, password, server=None):
+		super(StreamCheck, self).__init__(hostname, port, login, password, "streams", server)
 
-	## Checks if some streams are disabled.
-	def _process_json(self, buf):
-		for (i, stream) in enumerate(buf["streams"]):
-			if stream["disabled"] != False:
-				self.failed_stuff.append(stream["title"])
+	## Checks if the stream is disabled.
+	def _process_item(self, stream):
+		if stream["disabled"] != False:
+			self.failed_stuff.append(stream["title"])
+
+## This class is used to monitor the throughput of a node.
+# It alerts if the node processes less than min_throughput messages per second.
+class ThroughputCheck(MetaCheck):
+	## The lowest accepted throughput
+	min_throughput = 1
+
+	def __init__(self, hostname, port, login, password, server=None):
+		super(ThroughputCheck, self).__init__(hostname, port, login, password, "system/throughput", server)
+
+	def _process_item(self, item): pass
+
+	## Returns the number of messages processed per second by the node.
+	# @throw IOError HTTP code >= 500 or 401
+	def get_throughput(self):
+		r = self._server.session.get(self._url)
+
+		if r.status_code == 401:
+			self.error_msg = 'Not authorized (HTTP 401)'
+			raise IOError
+
+		self._handle_request_status_code(r)
+
+		return r.json()['throughput']
+
+	## Performs the GET call using requests
+	def perform(self):
+		self.failed_stuff = []
+
+		throughput = self.get_throughput()
+
+		if throughput < self.min_throughput:
+			self.failed_stuff.append("throughput %s < %s" % (throughput, self.min_throughput))
+			return False
+		return True
+
+## A metaclass used to create the numeric checks.
+#
+# Each perform reads some named values and compares them to the warning and critical
+# thresholds. A value fails when it is above them, or below them if lower is True. The
+# last samples states of each value are kept and a state is only reported if it has
+# been reached by at least required of them, so a single reading neither pages nor recovers.
+#
+class MetaThresholdCheck(MetaCheck):
+	__metaclass__ = ABCMeta
+
+	## The default thresholds
+	warning = None
+	critical = None
+
+	## True if the values below the thresholds fail
+	lower = False
+
+	## The size of the sliding window and the number of failed samples needed
+	samples = 5
+	required = 3
+
+	## The unit printed after the values
+	_unit = ''
+
+	## This is the abstract constructor.
+	# @param warning the warning threshold or None for the class' default
+	# @param critical the critical threshold or None for the class' default
+	# @param samples the size of the window or None for the class' default
+	# @param required the number of failed samples needed or None for the class' default
+	# @throw ValueError required is greater than samples
+	@abstractmethod
+	def __init__(self, hostname, port, login, password, url, server=None, warning=None, critical=None, samples=None, required=None):
+		super(MetaThresholdCheck, self).__init__(hostname, port, login, password, url, server)
+
+		if warning != None:
+			self.warning = warning
+		if critical != None:
+			self.critical = critical
+		if samples != None:
+			self.samples = samples
+		if required != None:
+			self.required = required
+
+		if self.required > self.samples:
+			self.error_msg = "required must not be greater than samples"
+			raise ValueError
+
+		## The state of the last perform
+		self.state = OK
+
+		## The values read by the last perform: name -> value
+		self.values = {}
+
+		self._windows = {}
+
+	def _process_item(self, item): pass
+
+	## Reads the checked values.
+	# @return a dict: name -> value
+	@abstractmethod
+	def _get_values(self): pass
+
+	## Performs a GET call and returns the decoded response.
+	def _get_json(self, url):
+		r = self._server.session.get(url)
+
+		if r.status_code == 401:
+			self.error_msg = 'Not authorized (HTTP 401)'
+			raise IOError
+
+		self._handle_request_status_code(r)
+
+		return r.json()
+
+	## Returns the state of one reading.
+	def _evaluate(self, value):
+		for (threshold, state) in [ (self.critical, CRITICAL), (self.warning, WARNING) ]:
+			if threshold == None:
+				continue
+
+			if (self.lower == True and value < threshold) or (self.lower == False and value > threshold):
+				return state
+
+		return OK
+
+	## Returns the state reached by enough samples of a window.
+	def _get_window_state(self, window):
+		if window.count(CRITICAL) >= self.required:
+			return CRITICAL
+
+		if window.count(CRITICAL) + window.count(WARNING) >= self.required:
+			return WARNING
+
+		return OK
+
+	## Reads the values and updates their windows.
+	# @throw IOError HTTP code >= 500 or 401
+	# @return True if every value is OK
+	def perform(self):
+		self.failed_stuff = []
+		self.state = OK
+		self.values = self._get_values()
+
+		for name in list(self._windows.keys()):
+			if name not in self.values:
+				del self._windows[name]
+
+		for name in sorted(self.values.keys()):
+			if name not in self._windows:
+				self._windows[name] = deque(maxlen=self.samples)
+
+			self._windows[name].append(self._evaluate(self.values[name]))
+
+			state = self._get_window_state(self._windows[name])
+
+			if state != OK:
+				self.failed_stuff.append("%s=%.1f%s" % (name, self.values[name], self._unit))
+
+			if _SEVERITY.index(state) > _SEVERITY.index(self.state):
+				self.state = state
+
+		return self.state == OK
+
+	## Returns the Nagios state of the last perform.
+	def get_state(self):
+		return self.state
+
+## This class is used to monitor the journal's utilisation in percent.
+class JournalCheck(MetaThresholdCheck):
+	warning = 50
+	critical = 80
+	_unit = '%'
+
+	def __init__(self, hostname, port, login, password, server=None, warning=None, critical=None, samples=None, required=None):
+		super(JournalCheck, self).__init__(hostname, port, login, password, "system/journal", server, warning, critical, samples, required)
+
+	## Returns the state of the journal.
+	# @throw IOError HTTP code >= 500 or 401
+	# @return the decoded system/journal response
+	def get_journal(self):
+		return self._get_json(self._url)
+
+	def _get_values(self):
+		journal = self.get_journal()
+
+		if journal.get('enabled') == False or journal.get('journal_size_limit', 0) == 0:
+			return {}
+
+		return { 'journal' : 100.0 * journal['journal_size'] / journal['journal_size_limit'] }
+
+## This class is used to monitor the fill of the input, process and output buffers in percent.
+class BufferCheck(MetaThresholdCheck):
+	warning = 50
+	critical = 80
+	_unit = '%'
+
+	def __init__(self, hostname, port, login, password, server=None, warning=None, critical=None, samples=None, required=None):
+		super(BufferCheck, self).__init__(hostname, port, login, password, "system/buffers", server, warning, critical, samples, required)
+
+	## Returns the fill of each buffer.
+	# @throw IOError HTTP code >= 500 or 401
+	# @return a dict: buffer name -> percent
+	def get_utilization(self):
+		buffers = self._get_json(self._url)['buffers']
+
+		return dict([ (name, buffers[name]['utilization_percent']) for name in buffers.keys() ])
+
+	def _get_values(self):
+		return self.get_utilization()
+
+## This class is used to detect the drops of the streams' throughput.
+# The value is the drop in percent of the current throughput compared to the mean
+# of the baseline previous readings of the stream.
+class StreamThroughputCheck(MetaThresholdCheck):
+	warning = 50
+	critical = 90
+	_unit = '%'
+
+	## The number of readings used as the reference
+	baseline = 30
+
+	## The number of concurrent calls
+	workers = 8
+
+	def __init__(self, hostname, port, login, password, server=None, warning=None, critical=None, samples=None, required=None):
+		super(StreamThroughputCheck, self).__init__(hostname, port, login, password, "streams", server, warning, critical, samples, required)
+
+		self._history = {}
+
+	def _get_values(self):
+		r = self._server.session.get(self._url, stream=True)
+		self._handle_request_status_code(r)
+
+		titles = dict([ (stream['id'], stream['title']) for stream in iter_json_list(r, 'streams') if stream.get('disabled') != True ])
+
+		values = {}
+
+		for result in Stream.get_throughputs(self._server, list(titles.keys()), self.workers):
+			if result.error != None:
+				raise result.error
+
+			if result.item not in self._history:
+				self._history[result.item] = RingBuffer(self.baseline)
+
+			history = self._history[result.item]
+			reference = mean(history.values())
+
+			if reference != None and reference > 0:
+				values[titles[result.item]] = max(0, 100.0 * (1 - result.result / float(reference)))
+
+			history.append(time.time(), result.result)
+
+		for id in list(self._history.keys()):
+			if id not in titles:
+				del self._history[id]
+
+		return values
+
+## This class is used to monitor the message rate of each input, in messages per second.
+# The rate is the one minute rate of the input's incomingMessages meter.
+class InputRateCheck(MetaThresholdCheck):
+	warning = 1
+	critical = 0.1
+	lower = True
+	_unit = 'msg/s'
+
+	def __init__(self, hostname, port, login, password, server=None, warning=None, critical=None, samples=None, required=None):
+		super(InputRateCheck, self).__init__(hostname, port, login, password, "system/inputs", server, warning, critical, samples, required)
+
+	## Returns the one minute rate of the given inputs.
+	# The meter of an input is named after its type and id: <type>.<id>.incomingMessages.
+	# The inputs whose meter is not found are missing from the result.
+	# @param inputs a dict: id -> input type, see get_input_type
+	# @throw IOError HTTP code >= 500 or 401
+	# @return a dict: id -> messages per second
+	def get_rates(self, inputs):
+		if len(inputs) == 0:
+			return {}
+
+		names = dict([ ("%s.%s.incomingMessages" % (inputs[id], id), id) for id in inputs ])
+
+		r = self._server.session.post(self._server.build_url('system', 'metrics', 'multiple'), json={ 'metrics' : list(names.keys()) })
+		self._handle_request_status_code(r)
+
+		rates = {}
+
+		for metric in r.json()['metrics']:
+			if metric['full_name'] in names:
+				rates[names[metric['full_name']]] = metric['metric']['rate']['one_minute']
+
+		return rates
+
+	def _get_values(self):
+		inputs = self._get_json(self._url)['inputs']
+		titles = dict([ (input['id'], input['message_input']['title']) for input in inputs ])
+		rates = self.get_rates(dict([ (input['id'], get_input_type(input)) for input in inputs ]))
+
+		return dict([ (titles[id], rates[id]) for id in rates.keys() ])
+
+## The result of one check run on one node.
+class CheckResult:
+	## This is the constructor.
+	# @param node the checked node
+	# @param check the name of the check's class
+	# @param state OK, CRITICAL or UNKNOWN
+	# @param failed_stuff the list of the failed objects
+	# @param error_msg the error which made the check unknown
+	# @param seconds the duration of the check
+	def __init__(self, node, check, state, failed_stuff=None, error_msg=None, seconds=0):
+		self.node = node
+		self.check = check
+		self.state = state
+		self.failed_stuff = failed_stuff or []
+		self.error_msg = error_msg
+		self.seconds = seconds
+
+	## Returns the result as a Nagios line.
+	def get_message(self):
+		if self.state == UNKNOWN:
+			return "%s %s: %s - %s" % (self.node, self.check, STATE_NAMES[self.state], self.error_msg)
+
+		if len(self.failed_stuff) > 0:
+			return "%s %s: %s - %s" % (self.node, self.check, STATE_NAMES[self.state], str.join(', ', self.failed_stuff))
+
+		return "%s %s: %s" % (self.node, self.check, STATE_NAMES[self.state])
+
+## This class is used to run several checks on several nodes concurrently.
+#
+# One Server, hence one pooled session, is kept per node and reused by every run,
+# so the connections are only opened once when the runner is used repeatedly.
+class CheckRunner:
+	## This is the constructor.
+	# @param nodes a list of hostnames or (hostname, port) tuples
+	# @param checks a list of MetaCheck classes (InputCheck, StreamCheck...) or factories such as functools.partial(JournalCheck, warning=60)
+	# @param login the login used on every node
+	# @param password the password used on every node
+	# @param port the default port
+	# @param ssl True to use HTTPS
+	# @param ssl_verify False to accept any certificate
+	# @param workers the number of checks run concurrently
+	# @param timeout the connection and read timeout of each call in seconds
+	# @throw ValueError bad login, password, node or check given
+	def __init__(self, nodes, checks, login, password, port=12900, ssl=False, ssl_verify=True, workers=16, timeout=10):
+		if login == None or len(login) == 0:
+			self.error_msg = "bad login given"
+			raise ValueError
+
+		if password == None or len(password) == 0:
+			self.error_msg = "bad password given"
+			raise ValueError
+
+		if len(nodes) == 0 or len(checks) == 0:
+			self.error_msg = "no node or no check given"
+			raise ValueError
+
+		self.error_msg = ""
+		self.checks = checks
+		self.workers = workers
+
+		## The servers used to reach the nodes: node -> Server
+		self.servers = {}
+
+		self._instances = {}
+
+		for node in nodes:
+			if type(node) is tuple:
+				(hostname, _port) = node
+				name = "%s:%i" % (hostname, _port)
+			else:
+				(hostname, _port) = (node, port)
+				name = node
+
+			server = pygraylog.server.Server(hostname, _port, ssl, ssl_verify, pool_maxsize=len(checks), connect_timeout=timeout, read_timeout=timeout)
+			server.auth_by_auth_basic(login, password)
+
+			self.servers[name] = server
+
+	## Runs one check on one node.
+	# The check objects are kept between two runs, so the threshold checks keep their windows.
+	# @param task a (node, check class) tuple
+	# @return a CheckResult object
+	def _run_check(self, task):
+		start = time.time()
+		check = self._instances.get(task)
+
+		try:
+			if check == None:
+				(node, check_class) = task
+				check = check_class(None, None, None, None, server=self.servers[node])
+				self._instances[task] = check
+
+			if check.perform() == True:
+				return CheckResult(task[0], check.__class__.__name__, OK, seconds=time.time() - start)
+
+			return CheckResult(task[0], check.__class__.__name__, check.get_state(), check.failed_stuff, seconds=time.time() - start)
+		except Exception:
+			error = sys.exc_info()[1]
+			error_msg = getattr(check, 'error_msg', None) or str(error) or repr(error)
+			name = check.__class__.__name__ if check != None else getattr(task[1], '__name__', str(task[1]))
+
+			return CheckResult(task[0], name, UNKNOWN, error_msg=error_msg, seconds=time.time() - start)
+
+	## Runs every check on every node.
+	# The runs must not overlap.
+	# @return a list of CheckResult objects sorted by node and check
+	def run(self):
+		tasks = [ (node, check_class) for node in sorted(self.servers.keys()) for check_class in self.checks ]
+
+		return [ result.result for result in BulkEngine(self.workers).run(self._run_check, tasks) ]
+
+## Returns the worst state of the given results.
+# @param results a list of CheckResult objects
+def get_worst_state(results):
+	worst = OK
+
+	for result in results:
+		if _SEVERITY.index(result.state) > _SEVERITY.index(worst):
+			worst = result.state
+
+	return worst
+
+## Formats the given results as a Nagios plugin's output.
+# The first line sums up the results, the next ones give the failed checks.
+# @param results a list of CheckResult objects
+# @return a (exit code, text) tuple
+def format_nagios(results):
+	state = get_worst_state(results)
+	failed = [ result for result in results if result.state != OK ]
+
+	if len(failed) == 0:
+		return (state, "OK - %i checks passed" % (len(results)))
+
+	lines = [ "%s - %i/%i checks failed" % (STATE_NAMES[state], len(failed), len(results)) ]
+	lines += [ result.get_message() for result in failed ]
+
+	return (state, str.join('\n', lines))
@@ -0,0 +1,327 @@
+#! /usr/bin/env python
+
+## @package pygraylog.reconcile
+# This package is used to bring a server to a desired state.
+#
+# The desired state is a dict holding the lists of the wanted streams, users and dashboards:
+#
+#	{
+#		'streams' : [ { 'title' : 'FOO - bar', 'matching_type' : 'AND', 'rules' : [ { 'field' : 'message', 'type' : 2, 'value' : '^problem$' } ] } ],
+#		'users' : [ { 'username' : 'foo', 'full_name' : 'Foo', 'email' : 'foo@bar', 'password' : 'secret', 'permissions' : [] } ],
+#		'dashboards' : [ { 'title' : 'FOO', 'description' : 'foo' } ]
+#	}
+#
+# The objects are matched by their natural key: the title of the streams and the dashboards,
+# the username of the users and the field, type, value and inverted flag of the rules. Only
+# the given keys are compared, the current state is fetched with one list call per resource.
+# The rules of a stream are only managed if the stream has a 'rules' key.
+#
+
+from pygraylog.api import MetaRootAPI
+from pygraylog.bulk import BulkEngine
+
+## The operations of a change.
+CREATE = '+'
+UPDATE = '~'
+DELETE = '-'
+
+## The managed resources and the key matching their objects.
+NATURAL_KEYS = { 'streams' : 'title', 'users' : 'username', 'dashboards' : 'title' }
+
+## The keys identifying a stream rule.
+RULE_KEYS = ( 'field', 'type', 'value', 'inverted' )
+
+## The keys which are never compared.
+_IGNORED_KEYS = { 'streams' : [ 'rules', 'disabled' ], 'users' : [ 'password' ], 'dashboards' : [] }
+
+## Returns the natural key of a rule.
+def rule_key(rule):
+	return (rule['field'], rule['type'], rule['value'], rule.get('inverted', False))
+
+## A change to apply on the server.
+class Change(object):
+	## This is the constructor.
+	# @param op CREATE, UPDATE or DELETE
+	# @param resource streams, stream_rules, users or dashboards
+	# @param key the natural key of the object
+	# @param details the sent payload: the whole object to create or the changed keys
+	# @param id the id of the current object
+	# @param stream_id the stream of a rule
+	def __init__(self, op, resource, key, details=None, id=None, stream_id=None):
+		self.op = op
+		self.resource = resource
+		self.key = key
+		self.details = details
+		self.id = id
+		self.stream_id = stream_id
+
+	def __str__(self):
+		if self.resource == 'stream_rules':
+			text = "%s stream_rules %s: %s" % (self.op, self.key[0], str.join(' ', [ "%s" % (k,) for k in self.key[1] ]))
+		else:
+			text = "%s %s %s" % (self.op, self.resource, self.key)
+
+		if self.op == UPDATE:
+			text += " (%s)" % (str.join(', ', sorted(self.details.keys())))
+
+		return text
+
+## Formats a plan.
+# @param changes a list of Change objects
+# @return a string
+def format_plan(changes):
+	if len(changes) == 0:
+		return "no changes"
+
+	return str.join('\n', [ str(change) for change in changes ])
+
+## A class used to bring a server to a desired state.
+class Reconciler(MetaRootAPI):
+	## This is the constructor.
+	# @param server the Server object, its session pool should hold at least workers connections
+	# @param workers the number of changes applied concurrently
+	# @param prune True to delete the objects missing from the desired state
+	def __init__(self, server, workers=8, prune=False):
+		super(Reconciler, self).__init__(server)
+
+		self.workers = workers
+		self.prune = prune
+
+		## The changes which failed during the last apply: a list of (Change, error message)
+		self.failed = []
+
+	## Fetches the current state of the given resources, one list call each.
+	# @param resources a list of resources
+	# @throw IOError HTTP code >= 500
+	# @return a dict: resource -> list of objects
+	def fetch(self, resources):
+		current = {}
+
+		for result in BulkEngine(self.workers).run(lambda resource: list(self._server.iter_list(resource, resource)), resources):
+			if result.error != None:
+				raise result.error
+
+			current[result.item] = result.result
+
+		return current
+
+	## Indexes the desired objects by their natural key.
+	# @throw ValueError duplicated key
+	def _index(self, resource, items):
+		index = {}
+
+		for item in items:
+			key = item[NATURAL_KEYS[resource]]
+
+			if key in index:
+				self.error_msg = "duplicated %s: %s" % (resource, key)
+				raise ValueError
+
+			index[key] = item
+
+		return index
+
+	## Returns the keys of the desired object whose value differs from the current one.
+	def _diff(self, resource, wanted, current):
+		return dict([ (k, v) for (k, v) in wanted.items() if k not in _IGNORED_KEYS[resource] and current.get(k) != v ])
+
+	## Computes the changes of the rules of a stream.
+	def _plan_rules(self, title, stream_id, wanted, current):
+		changes = []
+		current_rules = dict([ (rule_key(rule), rule) for rule in current ])
+		wanted_keys = set()
+
+		for rule in wanted:
+			key = rule_key(rule)
+			wanted_keys.add(key)
+
+			if key not in current_rules:
+				changes.append(Change(CREATE, 'stream_rules', (title, key), dict(rule), stream_id=stream_id))
+			elif 'description' in rule and rule['description'] != current_rules[key].get('description'):
+				details = dict(rule)
+				details['inverted'] = key[3]
+				changes.append(Change(UPDATE, 'stream_rules', (title, key), details, current_rules[key]['id'], stream_id))
+
+		for key in current_rules.keys():
+			if key not in wanted_keys:
+				changes.append(Change(DELETE, 'stream_rules', (title, key), id=current_rules[key]['id'], stream_id=stream_id))
+
+		return changes
+
+	## Computes the changes of a resource.
+	def _plan_resource(self, resource, wanted, current):
+		changes = []
+		wanted = self._index(resource, wanted)
+		current_index = {}
+
+		for item in current:
+			# the first object wins, like find_by_title
+			current_index.setdefault(item[NATURAL_KEYS[resource]], item)
+
+		for key in wanted.keys():
+			item = wanted[key]
+
+			if key not in current_index:
+				changes.append(Change(CREATE, resource, key, dict(item)))
+				continue
+
+			_current = current_index[key]
+			_id = _current[NATURAL_KEYS[resource]] if resource == 'users' else _current['id']
+
+			details = self._diff(resource, item, _current)
+
+			if resource == 'streams' and 'disabled' in item and item['disabled'] != _current.get('disabled'):
+				details['disabled'] = item['disabled']
+
+			if len(details) > 0:
+				changes.append(Change(UPDATE, resource, key, details, _id))
+
+			if resource == 'streams' and 'rules' in item:
+				changes += self._plan_rules(key, _id, item['rules'], _current.get('rules', []))
+
+		if self.prune == True:
+			for item in current:
+				if item[NATURAL_KEYS[resource]] in wanted:
+					continue
+
+				# the default stream and the admin user cannot be deleted
+				if item.get('is_default') == True or item.get('read_only') == True:
+					continue
+
+				_id = item['username'] if resource == 'users' else item['id']
+				changes.append(Change(DELETE, resource, item[NATURAL_KEYS[resource]], id=_id))
+
+		return changes
+
+	## Computes the changes needed to reach the desired state.
+	# Nothing is written on the server, the result can be printed with format_plan.
+	# @param desired the desired state
+	# @throw ValueError unknown resource or duplicated object given
+	# @throw IOError HTTP code >= 500
+	# @return a list of Change objects
+	def plan(self, desired):
+		for resource in desired.keys():
+			if resource not in NATURAL_KEYS:
+				self.error_msg = "unknown resource: %s" % resource
+				raise ValueError
+
+		resources = [ resource for resource in sorted(NATURAL_KEYS.keys()) if resource in desired ]
+		current = self.fetch(resources)
+
+		changes = []
+		for resource in resources:
+			changes += self._plan_resource(resource, desired[resource], current[resource])
+
+		return changes
+
+	## Performs a call.
+	# @throw ValueError HTTP code >= 400
+	# @throw IOError HTTP code >= 500
+	def _call(self, method, path, details=None):
+		r = self._server.session.request(method, self._server.build_url(path), json=details)
+
+		try:
+			self._handle_request_status_code(r)
+		except (IOError, ValueError) as e:
+			# self.error_msg is shared by the workers
+			e.error_msg = "%s %s: %s" % (method, path, r.text)
+			raise
+
+		return r
+
+	## Applies one change and keeps the caches of the server up to date.
+	def _apply(self, change):
+		if change.resource == 'stream_rules':
+			path = "streams/%s/rules" % (change.stream_id)
+
+			if change.op == CREATE:
+				self._call('POST', path, change.details)
+			elif change.op == UPDATE:
+				self._call('PUT', "%s/%s" % (path, change.id), change.details)
+			else:
+				self._call('DELETE', "%s/%s" % (path, change.id))
+
+			self._server.objects.evict('streams', change.stream_id)
+			return True
+
+		if change.op == CREATE:
+			return self._create(change)
+
+		if change.op == DELETE:
+			self._call('DELETE', "%s/%s" % (change.resource, change.id))
+
+			self._server.objects.evict(change.resource, change.id)
+			if change.resource != 'users':
+				self._server.title_index(change.resource).remove(change.id)
+
+			return True
+
+		details = dict(change.details)
+
+		if change.resource == 'streams' and 'disabled' in details:
+			self._call('POST', "streams/%s/%s" % (change.id, 'pause' if details.pop('disabled') == True else 'resume'))
+
+		if len(details) > 0:
+			self._call('PUT', "%s/%s" % (change.resource, change.id), details)
+
+		self._server.objects.evict(change.resource, change.id)
+		if 'title' in details:
+			self._server.title_index(change.resource).remove(change.id)
+			self._server.title_index(change.resource).add(details['title'], change.id)
+
+		return True
+
+	## Creates an object, the rules of a new stream are sent along with it.
+	def _create(self, change):
+		details = dict(change.details)
+		disabled = details.pop('disabled', None)
+
+		r = self._call('POST', change.resource, details)
+
+		if change.resource == 'users':
+			return True
+
+		_id = r.json()['stream_id' if change.resource == 'streams' else 'dashboard_id']
+		self._server.title_index(change.resource).add(details['title'], _id)
+
+		# the new streams are paused
+		if disabled == False:
+			self._call('POST', "streams/%s/resume" % (_id))
+
+		return True
+
+	## Applies a plan.
+	# The creations and the updates are applied concurrently, then the deletions.
+	# A failure does not stop the others, the failed changes are stored in self.failed.
+	# @param changes a list of Change objects
+	# @return True if every change has been applied
+	def apply(self, changes):
+		self.failed = []
+
+		writes = [ change for change in changes if change.op != DELETE or change.resource == 'stream_rules' ]
+		deletes = [ change for change in changes if change.op == DELETE and change.resource != 'stream_rules' ]
+
+		for phase in [ writes, deletes ]:
+			for result in BulkEngine(self.workers).run(self._apply, phase):
+				if result.error != None:
+					self.failed.append((result.item, result.error_msg or repr(result.error)))
+
+		if len(self.failed) > 0:
+			self.error_msg = "%i changes failed" % (len(self.failed))
+			return False
+
+		return True
+
+	## Brings the server to the desired state.
+	# @param desired the desired state
+	# @param dry_run True to only compute the plan
+	# @throw ValueError unknown resource or duplicated object given
+	# @throw IOError HTTP code >= 500
+	# @return the list of the Change objects planned
+	def reconcile(self, desired, dry_run=False):
+		changes = self.plan(desired)
+
+		if dry_run == False:
+			self.apply(changes)
+
+		return changes
@@ -0,0 +1,297 @@
+#! /usr/bin/env python
+
+## @package pygraylog.restore
+# This package is used to restore a backup made by pygraylog.backup.
+#
+# The resources are sorted in waves using their dependencies: the index sets are
+# created before the streams, the streams before their rules and alert receivers,
+# the users before the dashboards and the inputs before their extractors. The
+# objects of a wave are created concurrently. The ids given by the server to the
+# new objects replace the old ones in the objects of the next waves.
+#
+# The objects a fresh server already holds are not created again: the index sets are
+# matched by their prefix and the built-in "All messages" stream by its is_default flag.
+#
+
+import binascii, logging, os, threading, time
+
+from pygraylog.api import MetaRootAPI
+from pygraylog.backup import Backup, RESOURCES
+from pygraylog.bulk import BulkEngine
+
+_log = logging.getLogger(__name__)
+
+## The resources each resource depends on.
+DEPENDENCIES = {
+	'index_sets' : [],
+	'streams' : [ 'index_sets' ],
+	'stream_rules' : [ 'streams' ],
+	'alert_receivers' : [ 'streams' ],
+	'users' : [],
+	'dashboards' : [ 'users' ],
+	'inputs' : [],
+	'extractors' : [ 'inputs' ],
+	'grok' : [],
+	'outputs' : [],
+	'ldap' : [],
+}
+
+## Sorts the given resources in waves.
+# The resources of a wave only depend on the resources of the previous waves.
+# The dependencies which are not in the given list are ignored.
+# @param resources a list of resources
+# @throw ValueError unknown resource given
+# @return a list of lists of resources
+def get_waves(resources):
+	for resource in resources:
+		if resource not in DEPENDENCIES:
+			raise ValueError("unknown resource: %s" % resource)
+
+	waves = []
+	left = [ resource for resource in RESOURCES if resource in resources ]
+
+	while len(left) > 0:
+		wave = [ resource for resource in left if len([ dep for dep in DEPENDENCIES[resource] if dep in left ]) == 0 ]
+		waves.append(wave)
+		left = [ resource for resource in left if resource not in wave ]
+
+	return waves
+
+## Returns a copy of the given dict holding only the given keys.
+def _select(item, keys):
+	return dict([ (k, item[k]) for k in keys if k in item ])
+
+## A class used to restore the content of Graylog's database.
+class Restore(MetaRootAPI):
+	## This is the constructor.
+	# @param server the Server object, its session pool should hold at least workers connections
+	# @param workers the number of objects created concurrently
+	def __init__(self, server, workers=8):
+		super(Restore, self).__init__(server)
+
+		self.workers = workers
+
+		## The report of the last restore: resource -> { count, failed, seconds, errors }
+		self.report = {}
+
+		## The referenced ids which were not restored by the last restore: resource -> set of ids
+		self.missing = {}
+
+		self._ids = {}
+		self._failed = {}
+		self._lock = threading.Lock()
+
+		self._index_sets = {}
+		self._default_stream_id = None
+
+	## Returns the new id of a restored object.
+	# An object which has not been restored by this run, such as a stream already on the
+	# server or the built-in "All messages" stream, keeps its id. The miss is logged and
+	# recorded in self.missing.
+	# @param resource the resource's name
+	# @param id the id found in the backup
+	# @throw ValueError the object failed to be restored
+	# @return the new id or the given one
+	def get_new_id(self, resource, id):
+		with self._lock:
+			if resource in self._ids and id in self._ids[resource]:
+				return self._ids[resource][id]
+
+			if id in self._failed.get(resource, ()):
+				raise ValueError("%s %s failed to be restored" % (resource, id))
+
+			if id not in self.missing.setdefault(resource, set()):
+				self.missing[resource].add(id)
+				_log.warning("%s %s was not restored, its id is kept", resource, id)
+
+		return id
+
+	## Records the new id of a restored object.
+	def _set_new_id(self, resource, old_id, new_id):
+		with self._lock:
+			if resource not in self._ids:
+				self._ids[resource] = {}
+
+			self._ids[resource][old_id] = new_id
+
+	## Performs a call and returns the decoded response, if any.
+	# @throw ValueError HTTP code >= 400
+	# @throw IOError HTTP code >= 500
+	def _call(self, method, path, details=None, params=None):
+		r = self._server.session.request(method, self._server.build_url(path), json=details, params=params)
+
+		try:
+			self._handle_request_status_code(r)
+		except (IOError, ValueError) as e:
+			# self.error_msg is shared by the workers
+			e.error_msg = "%s %s: %s" % (method, path, r.text)
+			raise
+
+		if len(r.content) == 0:
+			return None
+
+		return r.json()
+
+	## Reads the objects of the server matched instead of being created.
+	# @param resources the restored resources
+	# @throw IOError HTTP code >= 500
+	def _load_existing(self, resources):
+		self._index_sets = {}
+		self._default_stream_id = None
+
+		if 'index_sets' in resources:
+			for index_set in self._server.iter_list('system/indices/index_sets', 'index_sets'):
+				self._index_sets[index_set['index_prefix']] = index_set['id']
+
+		if 'streams' in resources:
+			for stream in self._server.iter_list('streams', 'streams'):
+				if stream.get('is_default') == True:
+					self._default_stream_id = stream['id']
+
+	def _restore_index_sets(self, item):
+		# an index set using the same prefix already exists, such as the default one
+		if item['index_prefix'] in self._index_sets:
+			self._set_new_id('index_sets', item['id'], self._index_sets[item['index_prefix']])
+			return
+
+		details = dict(item)
+		del details['id']
+		details['default'] = False
+
+		self._set_new_id('index_sets', item['id'], self._call('POST', 'system/indices/index_sets', details)['id'])
+
+	def _restore_streams(self, item):
+		# the built-in stream cannot be created, the server's one is used
+		if item.get('is_default') == True:
+			self._set_new_id('streams', item['id'], self._default_stream_id or item['id'])
+			return
+
+		details = _select(item, [ 'title', 'description', 'matching_type', 'remove_matches_from_default_stream', 'content_pack' ])
+		details['rules'] = []
+
+		if item.get('index_set_id') != None:
+			details['index_set_id'] = self.get_new_id('index_sets', item['index_set_id'])
+
+		_id = self._call('POST', 'streams', details)['stream_id']
+		self._set_new_id('streams', item['id'], _id)
+
+		# the new streams are paused
+		if item.get('disabled') == False:
+			self._call('POST', "streams/%s/resume" % (_id))
+
+	def _restore_stream_rules(self, item):
+		details = _select(item, [ 'field', 'type', 'value', 'inverted', 'description' ])
+		_id = self.get_new_id('streams', item['stream_id'])
+
+		# the built-in stream cannot be edited
+		if _id == self._default_stream_id:
+			return
+
+		self._call('POST', "streams/%s/rules" % (_id), details)
+
+	def _restore_alert_receivers(self, item):
+		_id = self.get_new_id('streams', item['stream_id'])
+
+		for type in item['alert_receivers'].keys():
+			for entity in item['alert_receivers'][type]:
+				self._call('POST', "streams/%s/alerts/receivers" % (_id), params={ 'entity' : entity, 'type' : type })
+
+	def _restore_users(self, item):
+		# the admin user is not stored in the database and the LDAP users are created on login
+		if item.get('read_only') == True or item.get('external') == True:
+			return
+
+		details = _select(item, [ 'username', 'full_name', 'email', 'permissions', 'timezone', 'session_timeout_ms', 'startpage', 'roles' ])
+		# the passwords are not exported: a random one is set and must be changed
+		details['password'] = binascii.hexlify(os.urandom(16)).decode('ascii')
+
+		self._call('POST', 'users', details)
+
+	def _restore_dashboards(self, item):
+		details = _select(item, [ 'title', 'description' ])
+
+		self._set_new_id('dashboards', item['id'], self._call('POST', 'dashboards', details)['dashboard_id'])
+
+	def _restore_inputs(self, item):
+		details = _select(item, [ 'title', 'type', 'global', 'node' ])
+		details['configuration'] = item.get('attributes', {})
+
+		self._set_new_id('inputs', item['id'], self._call('POST', 'system/inputs', details)['id'])
+
+	def _restore_extractors(self, item):
+		details = _select(item, [ 'title', 'cut_or_copy', 'source_field', 'target_field', 'extractor_config', 'converters', 'condition_type', 'condition_value', 'order' ])
+		details['extractor_type'] = item['type']
+
+		self._call('POST', "system/inputs/%s/extractors" % (self.get_new_id('inputs', item['input_id'])), details)
+
+	def _restore_grok(self, item):
+		self._call('POST', 'system/grok', _select(item, [ 'name', 'pattern' ]))
+
+	def _restore_outputs(self, item):
+		self._call('POST', 'system/outputs', _select(item, [ 'title', 'type', 'configuration' ]))
+
+	def _restore_ldap(self, item):
+		self._call('PUT', 'system/ldap/settings', item)
+
+	## Restores one object.
+	# @param task a (resource, object) tuple
+	def _restore(self, task):
+		(resource, item) = task
+
+		getattr(self, '_restore_' + resource)(item)
+
+		return True
+
+	## Yields the objects of a wave from the backup.
+	def _iter_wave(self, directory, wave):
+		reader = Backup(self._server)
+
+		for resource in wave:
+			for item in reader.read(directory, resource):
+				yield (resource, item)
+
+	## Restores a backup.
+	# The waves are restored one after the other, their objects concurrently.
+	# A failure does not stop the restore, the objects depending on a failed one fail too.
+	# The per-resource report is stored in self.report.
+	# @param directory the backup's directory
+	# @param resources a list of resources or None for all the backed up ones
+	# @throw ValueError unknown resource given
+	# @throw IOError the server's index sets or streams cannot be listed
+	# @return True if every object has been restored
+	def restore(self, directory, resources=None):
+		if resources == None:
+			resources = Backup(self._server).list_resources(directory)
+
+		self.report = {}
+		self.missing = {}
+		self._ids = {}
+		self._failed = {}
+
+		self._load_existing(resources)
+
+		for wave in get_waves(resources):
+			start = time.time()
+
+			for resource in wave:
+				self.report[resource] = { 'count' : 0, 'failed' : 0, 'seconds' : 0, 'errors' : [] }
+
+			for result in BulkEngine(self.workers).run(self._restore, self._iter_wave(directory, wave)):
+				report = self.report[result.item[0]]
+				report['count'] += 1
+
+				if result.error != None:
+					report['failed'] += 1
+					self._failed.setdefault(result.item[0], set()).add(result.item[1].get('id'))
+					report['errors'].append(result.error_msg or repr(result.error))
+
+			for resource in wave:
+				self.report[resource]['seconds'] = time.time() - start
+
+		failed = [ resource for resource in self.report if self.report[resource]['failed'] > 0 ]
+
+		if len(failed) > 0:
+			self.error_msg = "failed to restore: %s" % (str.join(', ', failed))
+			return False
+
+		return True
@@ -0,0 +1,250 @@
+#! /usr/bin/env python
+
+## @package pygraylog.sampler
+# This package is used to keep a short history of the streams' throughput.
+#
+# The throughput of every stream is polled concurrently at a fixed interval. The
+# samples are stored in fixed-size ring buffers backed by arrays of doubles, so the
+# memory used does not grow with the uptime and no external time series database is needed.
+#
+
+import sys, threading, time
+from array import array
+
+from pygraylog.api import MetaRootAPI
+from pygraylog.streams import Stream
+
+## A fixed-size buffer of timestamped values, the oldest ones are overwritten.
+class RingBuffer:
+	## This is the constructor.
+	# @param size the number of samples kept
+	# @throw ValueError bad size given
+	def __init__(self, size):
+		self.error_msg = ""
+
+		if size < 1:
+			self.error_msg = "bad size given: %s" % size
+			raise ValueError
+
+		self.size = size
+
+		self._times = array('d', [ 0.0 ] * size)
+		self._values = array('d', [ 0.0 ] * size)
+		self._next = 0
+		self._count = 0
+
+	def __len__(self):
+		return self._count
+
+	## Adds a sample.
+	# @param timestamp the sample's time in seconds
+	# @param value the sample's value
+	def append(self, timestamp, value):
+		self._times[self._next] = timestamp
+		self._values[self._next] = value
+
+		self._next = (self._next + 1) % self.size
+		self._count = min(self._count + 1, self.size)
+
+	## Returns the samples from the oldest to the newest.
+	# @param window the age in seconds of the oldest returned sample or None for all of them
+	# @return a list of (timestamp, value) tuples
+	def samples(self, window=None):
+		start = (self._next - self._count) % self.size
+		samples = [ (self._times[(start + i) % self.size], self._values[(start + i) % self.size]) for i in range(self._count) ]
+
+		if window != None and len(samples) > 0:
+			limit = samples[-1][0] - window
+			samples = [ s for s in samples if s[0] >= limit ]
+
+		return samples
+
+	## Returns the values from the oldest to the newest.
+	# @param window the age in seconds of the oldest returned value or None for all of them
+	def values(self, window=None):
+		return [ s[1] for s in self.samples(window) ]
+
+	## Returns the newest sample.
+	# @return a (timestamp, value) tuple or None
+	def last(self):
+		if self._count == 0:
+			return None
+
+		i = (self._next - 1) % self.size
+
+		return (self._times[i], self._values[i])
+
+## Returns the mean of a list of values.
+# @return the mean or None if the list is empty
+def mean(values):
+	if len(values) == 0:
+		return None
+
+	return sum(values) / float(len(values))
+
+## Returns a percentile of a list of values, using the nearest rank.
+# @param values the values
+# @param p the percentile, between 0 and 100
+# @return the percentile or None if the list is empty
+def percentile(values, p):
+	if len(values) == 0:
+		return None
+
+	values = sorted(values)
+	rank = int(round(p / 100.0 * (len(values) - 1)))
+
+	return values[rank]
+
+## A class polling the throughput of the streams.
+class Sampler(MetaRootAPI):
+	## This is the constructor.
+	# @param server the Server object, its session pool should hold at least workers connections
+	# @param interval the delay between two polls in seconds
+	# @param size the number of samples kept per stream
+	# @param workers the number of concurrent calls
+	# @param refresh the number of polls between two refreshes of the streams list
+	def __init__(self, server, interval=10, size=360, workers=8, refresh=30):
+		super(Sampler, self).__init__(server)
+
+		self.interval = interval
+		self.size = size
+		self.workers = workers
+		self.refresh = refresh
+
+		## The titles of the sampled streams: id -> title
+		self.titles = {}
+
+		## The errors of the last poll: id -> error message
+		self.errors = {}
+
+		self._buffers = {}
+		self._polls = 0
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+
+	## Reloads the list of the enabled streams, the buffers of the removed ones are dropped.
+	# @throw IOError HTTP code >= 500
+	def refresh_streams(self):
+		titles = {}
+
+		for stream in self._server.iter_list('streams', 'streams'):
+			if stream.get('disabled') != True:
+				titles[stream['id']] = stream['title']
+
+		with self._lock:
+			self.titles = titles
+
+			for id in list(self._buffers.keys()):
+				if id not in titles:
+					del self._buffers[id]
+
+			for id in titles.keys():
+				if id not in self._buffers:
+					self._buffers[id] = RingBuffer(self.size)
+
+	## Polls the throughput of every stream once.
+	# The failed streams get no sample, their error is stored in self.errors.
+	# @throw IOError the streams list cannot be loaded
+	def poll(self):
+		if self._polls % self.refresh == 0:
+			self.refresh_streams()
+
+		self._polls += 1
+
+		errors = {}
+		now = time.time()
+
+		for result in Stream.get_throughputs(self._server, list(self.titles.keys()), self.workers):
+			if result.error != None:
+				# the message is attached to the exception, not shared by the workers
+				errors[result.item] = result.error_msg or repr(result.error)
+				continue
+
+			with self._lock:
+				if result.item in self._buffers:
+					self._buffers[result.item].append(now, result.result)
+
+		self.errors = errors
+
+	## The polling loop.
+	def _poll_loop(self):
+		while self._stop.is_set() == False:
+			start = time.time()
+
+			try:
+				self.poll()
+			except Exception:
+				self.errors = { None : str(sys.exc_info()[1]) }
+
+			self._stop.wait(max(0, self.interval - (time.time() - start)))
+
+	## Starts polling in a background thread.
+	def start(self):
+		self._stop.clear()
+
+		thread = threading.Thread(target=self._poll_loop)
+		thread.daemon = True
+		thread.start()
+
+	## Stops polling.
+	def stop(self):
+		self._stop.set()
+
+	## Returns the buffer of a stream.
+	# It is written by the polling thread, the other getters read it under the lock.
+	# @throw KeyError unknown stream
+	def get_buffer(self, id):
+		return self._buffers[id]
+
+	## Returns the values of a stream, read under the lock held by the polling thread.
+	# @throw KeyError unknown stream
+	def _get_values(self, id, window):
+		with self._lock:
+			return self._buffers[id].values(window)
+
+	## Returns the last throughput of a stream.
+	# @return the value or None if there is no sample
+	def get_rate(self, id):
+		with self._lock:
+			last = self._buffers[id].last()
+
+		if last == None:
+			return None
+
+		return last[1]
+
+	## Returns the moving average of the throughput of a stream.
+	# @param window the averaged period in seconds or None for all the samples
+	# @return the value or None if there is no sample
+	def get_average(self, id, window=None):
+		return mean(self._get_values(id, window))
+
+	## Returns a percentile of the throughput of a stream.
+	# @param p the percentile, between 0 and 100
+	# @param window the period in seconds or None for all the samples
+	# @return the value or None if there is no sample
+	def get_percentile(self, id, p, window=None):
+		return percentile(self._get_values(id, window), p)
+
+	## Returns the streams which went silent.
+	# A stream is silent if it had some throughput and has none since the given period.
+	# @param window the silence's duration in seconds
+	# @return a list of ids
+	def get_silent_streams(self, window):
+		silent = []
+
+		with self._lock:
+			buffers = [ (id, buf.samples()) for (id, buf) in self._buffers.items() ]
+
+		for (id, samples) in buffers:
+
+			if len(samples) == 0 or samples[-1][0] - samples[0][0] < window:
+				continue
+
+			recent = [ s[1] for s in samples if s[0] >= samples[-1][0] - window ]
+			older = [ s[1] for s in samples if s[0] < samples[-1][0] - window ]
+
+			if max(recent) == 0 and len(older) > 0 and max(older) > 0:
+				silent.append(id)
+
+		return silent
@@ -6,32 +6,244 @@
 
 import requests
 import pygraylog
+import pygraylog.streams
+import pygraylog.users
+
+from pygraylog.api import StatusCodeHandler
+from pygraylog.bulk import BulkEngine
+from pygraylog.cache import SchemaCache, TitleIndex, ObjectCache, ResponseCache
+from pygraylog.session import build_session
+from pygraylog.streaming import iter_json_list
+from pygraylog.validation import ValidatorRegistry, STRICT
 #from pygraylog.users import User
 
+## Returns the base URL of the API.
+# @param hostname the server's name
+# @param port the API's port
+# @param ssl True to use https
+def api_url(hostname, port, ssl):
+	if ssl == True:
+		proto = 'https'
+	else:
+		proto = 'http'
+
+	return "%s://%s:%s/api" % ( proto, hostname, port )
+
 ## The class used to connect against a Grafana instance
-class Server:
+class Server(StatusCodeHandler):
 	## This is the constructor.
-	def __init__(self, hostname, port=12900, ssl=False, ssl_verify=True):
+	# @param schema_ttl the lifetime of the cached validation schemas in seconds
+	# @param schema_cache_file a JSON file used to persist the validation schemas or None
+	# @param version the server's version if already known, it avoids a call to /system
+	# @param validation the validation mode of the objects: off, sampled or strict
+	# @param pool_connections the number of hosts kept in the connection pool
+	# @param pool_maxsize the number of connections kept per host, it should be at least the number of bulk workers
+	# @param max_retries the number of retries of the failed connections and of the idempotent calls returning 502, 503 or 504
+	# @param backoff_factor the factor of the exponential delay between two retries
+	# @param connect_timeout the connection timeout in seconds or None
+	# @param read_timeout the read timeout in seconds or None
+	# @param keep_alive False to close the connection after each call
+	# @param title_ttl the lifetime of the title indexes used by find_by_title in seconds
+	# @param object_cache_size the number of objects kept by the object cache, 0 disables it
+	# @param object_cache_ttl the lifetime of the cached objects in seconds
+	# @param rate_limit the maximum number of calls per second or None, it is halved when the server is overloaded
+	# @param concurrency_limit the maximum number of concurrent calls or None, it is halved when the server is overloaded
+	# @param latency_target the duration in seconds above which a call is taken as a sign of overload, None to ignore the latency
+	# @param throttle_retries the number of retries with jitter of the idempotent calls answered 429, 502, 503 or 504
+	# @param coalesce_gets True to send only once the identical GET calls made concurrently, the others get a copy of its response:
+	#	a GET made just after a write may then get the answer of an identical GET sent before the write
+	# @param response_cache_size the number of GET responses kept, 0 disables the response cache
+	# @param response_cache_ttl the lifetime of the responses without ETag nor Last-Modified header in seconds
+	def __init__(self, hostname, port=12900, ssl=False, ssl_verify=True, schema_ttl=3600, schema_cache_file=None, version=None, validation=STRICT,
+			pool_connections=10, pool_maxsize=10, max_retries=0, backoff_factor=0, connect_timeout=None, read_timeout=None, keep_alive=True,
+			title_ttl=60, object_cache_size=0, object_cache_ttl=300, rate_limit=None, concurrency_limit=None, latency_target=2.0, throttle_retries=0,
+			coalesce_gets=False, response_cache_size=0, response_cache_ttl=5):
 		self.error_msg = ""
 		self._auth_configured = False
 
 		self._data = None
+		self._version = version
 
-		if ssl == True:
-			proto = 'https'
-		else:
-			proto = 'http'
+		self.schemas = SchemaCache(schema_ttl, schema_cache_file)
+		self.validators = ValidatorRegistry(validation)
 
-		self.url = "%s://%s:%s/api" % ( proto, hostname, port )
+		self._title_ttl = title_ttl
+		self._title_indexes = {}
 
-		self.session = requests.Session()
+		self.objects = ObjectCache(object_cache_size, object_cache_ttl)
+
+		self.url = api_url(hostname, port, ssl)
+
+		self.session = build_session(pool_connections, pool_maxsize, max_retries, backoff_factor, connect_timeout, read_timeout, keep_alive,
+			rate_limit, concurrency_limit, latency_target, throttle_retries, coalesce_gets, response_cache_size, response_cache_ttl)
 
 		if ssl == True and ssl_verify == True:
 			self.session.verify = True
 		else:
 			self.session.verify = False
 
-	def get_users(self):
+	## Builds the URL of a resource.
+	# @param parts the components of the path (streams, an id...)
+	# @return the URL
+	def build_url(self, *parts):
+		return "/".join([ self.url ] + [ str(part) for part in parts ])
+
+	## Returns the server's version.
+	# The value is fetched once from /system and then kept.
+	# @throw IOError HTTP code >= 500
+	# @return the version as a string
+	def get_version(self):
+		if self._version == None:
+			_url = "%s/system" % (self.url)
+
+			r = self.session.get(_url)
+
+			self._handle_request_status_code(r)
+
+			self._version = r.json()['version']
+
+		return self._version
+
+	## Gets the validation schema of the given resource.
+	# The schema is only fetched from /api-docs if it is not in the cache.
+	# @param object_name the type of resource (users, streams...)
+	# @throw IOError HTTP code >= 500
+	# @return the schema or None
+	def get_validation_schema(self, object_name):
+		_version = self.get_version()
+
+		schema = self.schemas.get(_version, object_name)
+
+		if schema != None:
+			return schema
+
+		_url = "%s/api-docs/%s" % (self.url, object_name)
+
+		r = self.session.get(_url)
+
+		if r.status_code == 404:
+			return None
+
+		self._handle_request_status_code(r)
+
+		schema = r.json()
+		self.schemas.set(_version, object_name, schema)
+
+		return schema
+
+	## Gets the validation schema of the given resource without any network call.
+	# @param object_name the type of resource (users, streams...)
+	# @return the cached schema or None
+	def get_cached_validation_schema(self, object_name):
+		if self._version == None:
+			return None
+
+		return self.schemas.get(self._version, object_name)
+
+	## Returns the title index of the given resource, it is created on the first call.
+	# @param object_name streams or dashboards
+	# @return a pygraylog.cache.TitleIndex
+	def title_index(self, object_name):
+		if object_name not in self._title_indexes:
+			self._title_indexes[object_name] = TitleIndex(self, object_name, self._title_ttl)
+
+		return self._title_indexes[object_name]
+
+	## Returns the measures of the calls made by the server's session.
+	# The calls are grouped by method and endpoint, the ids being replaced by placeholders.
+	# @return a dict: { 'endpoints' : { 'METHOD endpoint' : measures }, 'total' : measures }
+	def stats(self):
+		return self.session.stats.summary()
+
+	## Drops the measures of the calls.
+	def reset_stats(self):
+		self.session.stats.reset()
+
+	## Adds a hook called around each call, see pygraylog.instrumentation.
+	# @param hook a callable taking (method, endpoint, url) and returning None or a callable taking (status_code, seconds, error)
+	def add_hook(self, hook):
+		self.session.stats.add_hook(hook)
+
+	## Removes a hook.
+	def remove_hook(self, hook):
+		self.session.stats.remove_hook(hook)
+
+	## Enables the object cache used by find_by_id and load_from_server.
+	# The cached objects are dropped.
+	# @param size the number of objects kept, 0 disables the cache
+	# @param ttl the lifetime of the cached objects in seconds or None
+	def enable_object_cache(self, size=10000, ttl=300):
+		self.objects = ObjectCache(size, ttl)
+
+	## Enables the cache of the GET responses.
+	# The responses carrying an ETag or a Last-Modified header are revalidated by conditional
+	# calls, the other ones are served from memory during ttl seconds. The cached responses are dropped.
+	# @param size the number of responses kept, 0 disables the cache
+	# @param ttl the lifetime of the responses without validator in seconds
+	def enable_response_cache(self, size=1000, ttl=5):
+		self.session.responses = ResponseCache(size, ttl)
+
+	## Iterates over the items of a list resource.
+	# The response is parsed while it is read from the socket.
+	# @param path the resource's path (streams, system/inputs...)
+	# @param key the key holding the list in the response
+	# @throw IOError HTTP code >= 500
+	# @return a generator of dicts
+	def iter_list(self, path, key):
+		r = self.session.get(self.build_url(path), stream=True)
+
+		self._handle_request_status_code(r)
+
+		return iter_json_list(r, key)
+
+	## Iterates over the users without loading the whole list.
+	# @param validation the validation mode used to load them or None to use the server's one
+	# @throw IOError HTTP code >= 500
+	# @return a generator of User objects
+	def iter_users(self, validation=None):
+		for json_user in self.iter_list('users', 'users'):
+			self.objects.put("users", json_user['username'], json_user)
+
+			user = pygraylog.users.User(self)
+			user.load_from_json(json_user, validation)
+
+			yield user
+
+	## Iterates over the streams without loading the whole list.
+	# @param validation the validation mode used to load them or None to use the server's one
+	# @throw IOError HTTP code >= 500
+	# @return a generator of Stream objects
+	def iter_streams(self, validation=None):
+		for json_stream in self.iter_list('streams', 'streams'):
+			self.objects.put("streams", json_stream['id'], json_stream)
+
+			stream = pygraylog.streams.Stream(self)
+			stream.load_from_json(json_stream, validation)
+
+			yield stream
+
+	## Iterates over the inputs without loading the whole list.
+	# @throw IOError HTTP code >= 500
+	# @return a generator of dicts
+	def iter_inputs(self):
+		return self.iter_list('system/inputs', 'inputs')
+
+	## Changes the validation mode of the objects.
+	# @param mode off, sampled or strict
+	# @param sample_rate the part of the objects validated in sampled mode
+	# @throw ValueError bad mode or sample rate given
+	def set_validation_mode(self, mode, sample_rate=None):
+		try:
+			self.validators.set_mode(mode, sample_rate)
+		except ValueError:
+			self.error_msg = self.validators.error_msg
+			raise
+
+	## Gets all the users.
+	# @param validation the validation mode used to load them or None to use the server's one
+	# @throw IOError HTTP code >= 500
+	# @return a list of User objects
+	def get_users(self, validation=None):
 		_url = "%s/users" % (self.url)
 
 		r = self.session.get(_url)
@@ -42,10 +254,11 @@ class Server:
 			_result = []
 			for json_user in r.json()['users']:
 				user = pygraylog.users.User(self)
+				self.objects.put("users", json_user['username'], json_user)
 				try:
-					user.load_from_json(json_user)
+					user.load_from_json(json_user, validation)
 				except:
-					print user.error_msg
+					print(user.error_msg)
 					return None
 				_result.append(user)
 
@@ -54,6 +267,36 @@ class Server:
 		self.error_msg = "Bad status code: %s" % (r.status_code)
 		raise IOError
 
+	## Performs the same action on many objects concurrently.
+	# Every worker uses its own object of the given class and shares the server's session.
+	# A failure never aborts the batch, it is reported in the item's result.
+	# @param object_class the class of the objects (Stream, Rule, User, Dashboard...)
+	# @param action create, update or delete
+	# @param items an iterable of dicts describing the objects
+	# @param workers the number of concurrent requests
+	# @throw ValueError bad action or number of workers given
+	# @return a list of pygraylog.bulk.BulkResult sorted like the given items
+	def bulk(self, object_class, action, items, workers=8):
+		if action not in ('create', 'update', 'delete'):
+			self.error_msg = "bad action given: %s" % (action)
+			raise ValueError
+
+		try:
+			engine = BulkEngine(workers)
+		except ValueError:
+			self.error_msg = "bad number of workers given: %s" % (workers)
+			raise
+
+		def _perform(item):
+			_object = object_class(self)
+			try:
+				return _object._bulk(action, item)
+			except Exception as e:
+				e.error_msg = _object.error_msg
+				raise
+
+		return engine.run(_perform, items)
+
 #	def auth_by_token(self, token):
 #		if self._auth_configured == False:
 #			self.session.headers.update({ 'Accept' : 'application/json', 'Content-Type' : 'application/json', 'Authorization' : "Bearer %s" % token })
@@ -70,12 +313,3 @@ class Server:
 		else:
 			self.error_msg = "Authentication already configured."
 			raise ValueError
-
-	def _handle_request_status_code(self, r):
-		if r.status_code >= 500:
-			self.error_msg = r.text
-			raise IOError
-
-		if r.status_code >= 400:
-			self.error_msg = r.text
-			raise ValueError
@@ -0,0 +1,283 @@
+#! /usr/bin/env python
+
+## @package pygraylog.session
+# This package is used to build the HTTP session shared by all the objects of a Server.
+#
+
+import copy, sys, threading, time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pygraylog.cache import ResponseCache
+from pygraylog.instrumentation import RequestStats, get_endpoint
+from pygraylog.throttle import AdaptiveLimiter, OVERLOAD_STATUS_CODES
+from pygraylog.throttle import RETRY_STATUS_CODES as THROTTLE_RETRY_STATUS_CODES
+
+try:
+	from urllib3.util.retry import Retry
+except ImportError:
+	from requests.packages.urllib3.util.retry import Retry
+
+## The status codes retried when max_retries is set.
+RETRY_STATUS_CODES = (502, 503, 504)
+
+## A requests' session applying default settings to every request.
+class Session(requests.Session):
+	## This is the constructor.
+	# @param timeout the default timeout: None, a number of seconds or a (connect, read) tuple
+	# @param limiter an AdaptiveLimiter object or None
+	# @param coalesce True to coalesce the identical GET calls in flight
+	# @param responses a ResponseCache object or None
+	def __init__(self, timeout=None, limiter=None, coalesce=False, responses=None):
+		super(Session, self).__init__()
+
+		self.timeout = timeout
+		self.limiter = limiter
+		self.coalesce = coalesce
+
+		## The cache of the GET responses
+		self.responses = responses or ResponseCache()
+
+		self._in_flight = {}
+		self._lock = threading.Lock()
+
+		## The measures of the calls
+		self.stats = RequestStats()
+
+	## Performs a request, the default timeout is used if none is given.
+	# When coalescing is enabled, identical GET calls made while one is in flight wait for
+	# it and get a copy of its response instead of being sent. When the response cache is
+	# enabled, the GET calls are answered by it and the writes invalidate it.
+	def request(self, method, url, **kwargs):
+		if kwargs.get('timeout') == None:
+			kwargs['timeout'] = self.timeout
+
+		key = self._get_key(method, url, kwargs)
+
+		if key == None:
+			try:
+				return self._perform(method, url, kwargs)
+			finally:
+				if method.upper() not in ('GET', 'HEAD', 'OPTIONS') and self.responses.enabled() == True:
+					self.responses.invalidate(url)
+
+		# the streamed bodies can only be read once
+		if self.coalesce == False or kwargs.get('stream') == True:
+			return self._get_cached(method, url, kwargs, key)
+
+		# a caller with a short timeout must not wait for a call having a longer one
+		flight = (key, repr(kwargs['timeout']))
+
+		with self._lock:
+			call = self._in_flight.get(flight)
+			leader = call == None
+
+			if leader == True:
+				call = _InFlightCall()
+				self._in_flight[flight] = call
+
+		if leader == False:
+			self.stats.record_coalesced(method, get_endpoint(url))
+			return call.wait()
+
+		try:
+			call.response = self._get_cached(method, url, kwargs, key)
+		except Exception:
+			call.error = sys.exc_info()[1]
+			raise
+		finally:
+			with self._lock:
+				del self._in_flight[flight]
+			call.done.set()
+
+		return call.response
+
+	## Returns the key identifying a GET call which can be shared or None.
+	# The response cache uses it, the coalescing adds the timeout to it.
+	def _get_key(self, method, url, kwargs):
+		if method.upper() != 'GET':
+			return None
+
+		# the per-call settings may change the answer
+		for name in kwargs:
+			if name not in ('params', 'timeout', 'allow_redirects', 'stream') and kwargs[name] not in (None, False):
+				return None
+
+		params = kwargs.get('params')
+		if isinstance(params, dict):
+			params = tuple(sorted(params.items()))
+
+		return (url, repr(params))
+
+	## Performs a GET call using the response cache.
+	# A fresh response is served without any call, the other ones are revalidated
+	# when they carry a validator.
+	def _get_cached(self, method, url, kwargs, key):
+		if self.responses.enabled() == False:
+			return self._perform(method, url, kwargs)
+
+		entry = self.responses.get(key)
+
+		if entry != None and self.responses.is_fresh(entry) == True:
+			self.stats.record_cached(method, get_endpoint(url))
+			return copy.copy(entry['response'])
+
+		if entry != None:
+			kwargs = dict(kwargs)
+			kwargs['headers'] = self.responses.get_conditional_headers(entry)
+
+		r = self._perform(method, url, kwargs)
+
+		if r.status_code == 304 and entry != None:
+			r.close()
+			self.responses.touch(entry)
+			return copy.copy(entry['response'])
+
+		if r.status_code == 200:
+			# the whole body is read, the streamed callers get it from memory
+			r.content
+			self.responses.put(key, url, r)
+			return copy.copy(r)
+
+		return r
+
+	## Performs a request.
+	# When a limiter is set, the call waits for it and the idempotent calls are retried
+	# when the server is overloaded or unreachable.
+	def _perform(self, method, url, kwargs):
+		if self.limiter == None:
+			return self._send(method, url, kwargs, 0)
+
+		attempt = 0
+
+		while True:
+			self.limiter.acquire()
+			start = time.time()
+
+			try:
+				r = self._send(method, url, kwargs, attempt)
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+				self.limiter.release(time.time() - start, True)
+
+				if self.limiter.can_retry(method, attempt) == False:
+					raise
+
+				time.sleep(self.limiter.get_delay(attempt))
+				attempt += 1
+				continue
+			except Exception:
+				# the slot is given back whatever the error
+				self.limiter.release(time.time() - start, False)
+				raise
+
+			self.limiter.release(time.time() - start, r.status_code in OVERLOAD_STATUS_CODES)
+
+			if r.status_code not in THROTTLE_RETRY_STATUS_CODES or self.limiter.can_retry(method, attempt) == False:
+				return r
+
+			r.close()
+			time.sleep(self.limiter.get_delay(attempt, r.headers.get('Retry-After')))
+			attempt += 1
+
+	## Performs one call, records it in self.stats and gives it to its hooks.
+	# @param attempt the number of retries already made
+	def _send(self, method, url, kwargs, attempt):
+		endpoint = get_endpoint(url)
+		ends = self.stats.start(method, endpoint, url)
+		start = time.time()
+		retried = 1 if attempt > 0 else 0
+
+		try:
+			r = super(Session, self).request(method, url, **kwargs)
+		except Exception:
+			error = sys.exc_info()[1]
+			self.stats.record(method, endpoint, None, time.time() - start, 0, 0, retried, ends, error)
+			raise
+
+		self.stats.record(method, endpoint, r.status_code, time.time() - start, _get_bytes_sent(r), _get_bytes_received(r, kwargs.get('stream')), _get_retries(r) + retried, ends)
+
+		return r
+
+## A call shared by the identical GET calls made while it is in flight.
+class _InFlightCall:
+	def __init__(self):
+		self.done = threading.Event()
+		self.response = None
+		self.error = None
+
+	## Waits for the call to end.
+	# @return a copy of the response, so the waiters do not share the decoding state
+	def wait(self):
+		self.done.wait()
+
+		if self.error != None:
+			raise self.error
+
+		return copy.copy(self.response)
+
+## Returns the size of the sent body.
+def _get_bytes_sent(r):
+	body = r.request.body
+
+	if body == None or hasattr(body, '__len__') == False:
+		return 0
+
+	return len(body)
+
+## Returns the size of the received body, the Content-Length header is used for the streamed ones.
+def _get_bytes_received(r, stream):
+	if stream == True:
+		return int(r.headers.get('Content-Length') or 0)
+
+	return len(r.content)
+
+## Returns the number of retries made by the adapter.
+def _get_retries(r):
+	retries = getattr(getattr(r, 'raw', None), 'retries', None)
+
+	if retries == None:
+		return 0
+
+	return len(getattr(retries, 'history', ()))
+
+## Builds a pooled session.
+# @param pool_connections the number of hosts kept in the pool
+# @param pool_maxsize the number of connections kept per host, it should be at least the number of workers
+# @param max_retries the number of retries of the failed connections and of the idempotent calls returning 502, 503 or 504
+# @param backoff_factor the factor of the exponential delay between two retries
+# @param connect_timeout the connection timeout in seconds or None
+# @param read_timeout the read timeout in seconds or None
+# @param keep_alive False to close the connection after each call
+# @param rate_limit the maximum number of calls per second or None
+# @param concurrency_limit the maximum number of concurrent calls or None
+# @param latency_target the duration in seconds above which the limits are lowered, None to ignore the latency
+# @param throttle_retries the number of retries with jitter of the idempotent calls when the server is overloaded
+# @param coalesce True to coalesce the identical GET calls in flight
+# @param response_cache_size the number of GET responses kept, 0 disables the response cache
+# @param response_cache_ttl the lifetime of the responses without ETag nor Last-Modified header in seconds
+# @return a Session object
+def build_session(pool_connections=10, pool_maxsize=10, max_retries=0, backoff_factor=0, connect_timeout=None, read_timeout=None, keep_alive=True,
+		rate_limit=None, concurrency_limit=None, latency_target=2.0, throttle_retries=0, coalesce=False, response_cache_size=0, response_cache_ttl=5):
+	limiter = None
+
+	if rate_limit != None or concurrency_limit != None or throttle_retries > 0:
+		limiter = AdaptiveLimiter(rate_limit, concurrency_limit, latency_target, throttle_retries)
+
+	responses = ResponseCache(response_cache_size, response_cache_ttl)
+
+	if connect_timeout == None and read_timeout == None:
+		session = Session(None, limiter, coalesce, responses)
+	else:
+		session = Session((connect_timeout, read_timeout), limiter, coalesce, responses)
+
+	retries = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES, raise_on_status=False)
+	adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retries)
+
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+
+	if keep_alive == False:
+		session.headers['Connection'] = 'close'
+
+	return session
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+
+## @package pygraylog.streaming
+# This package is used to parse the large list responses incrementally.
+#
+# The API returns its lists inside an object, such as {"total": 2, "streams": [...]}.
+# The items of the list are decoded and yielded one at a time while the response
+# is read from the socket, so the whole document is never held in memory.
+#
+
+import codecs, json
+
+## The whitespaces allowed between two JSON tokens.
+_WHITESPACES = ' \t\n\r'
+
+## A reader decoding JSON values from a stream of chunks.
+class _Reader:
+	## This is the constructor.
+	# @param chunks an iterator of bytes
+	# @param encoding the response's encoding
+	def __init__(self, chunks, encoding):
+		self._chunks = chunks
+		self._decoder = codecs.getincrementaldecoder(encoding)()
+		self._json = json.JSONDecoder()
+
+		self._buf = u''
+		self._pos = 0
+		self._eof = False
+
+	## Reads the next chunk, the consumed part of the buffer is dropped.
+	# @return False at the end of the stream
+	def _fill(self):
+		if self._eof == True:
+			return False
+
+		try:
+			chunk = next(self._chunks)
+			text = self._decoder.decode(chunk)
+		except StopIteration:
+			text = self._decoder.decode(b'', True)
+			self._eof = True
+
+		self._buf = self._buf[self._pos:] + text
+		self._pos = 0
+
+		return True
+
+	## Returns the next non blank character without consuming it.
+	# @return the character or None at the end of the stream
+	def peek(self):
+		while True:
+			while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACES:
+				self._pos += 1
+
+			if self._pos < len(self._buf):
+				return self._buf[self._pos]
+
+			if self._fill() == False:
+				return None
+
+	## Consumes the given character.
+	# @throw ValueError another character was found
+	def expect(self, char):
+		if self.peek() != char:
+			raise ValueError("'%s' expected at %i" % (char, self._pos))
+
+		self._pos += 1
+
+	## Decodes the next JSON value.
+	# @throw ValueError the stream is not valid JSON
+	def decode(self):
+		self.peek()
+
+		while True:
+			try:
+				(value, end) = self._json.raw_decode(self._buf, self._pos)
+			except ValueError:
+				if self._fill() == False:
+					raise
+				continue
+
+			# a number may continue in the next chunk
+			if end == len(self._buf) and self._eof == False:
+				if self._fill() == True:
+					continue
+
+			self._pos = end
+
+			return value
+
+## Yields the items of the list stored under the given key of a JSON object.
+# The other keys are skipped. The response must have been requested with stream=True,
+# it is closed once the list has been read.
+# @param response a requests' response
+# @param key the key holding the list (streams, users, inputs...)
+# @param chunk_size the size of the chunks read from the socket
+# @throw KeyError the key was not found
+# @throw ValueError the response is not valid JSON
+def iter_json_list(response, key, chunk_size=65536):
+	reader = _Reader(response.iter_content(chunk_size), response.encoding or 'utf-8')
+
+	try:
+		reader.expect('{')
+
+		while reader.peek() != '}':
+			name = reader.decode()
+			reader.expect(':')
+
+			if name != key:
+				reader.decode()
+			else:
+				reader.expect('[')
+
+				if reader.peek() == ']':
+					return
+
+				while True:
+					yield reader.decode()
+
+					if reader.peek() == ']':
+						return
+
+					reader.expect(',')
+
+			if reader.peek() == ',':
+				reader.expect(',')
+
+		raise KeyError(key)
+	finally:
+		response.close()
@@ -7,9 +7,11 @@
 import sys, json, requests
 
 from pygraylog.api import MetaObjectAPI
+from pygraylog.bulk import BulkEngine
 
 ## This class is used to manage the streams.
 class Stream(MetaObjectAPI):
+	_load_schema = ("streams", "CreateStreamRequest")
 
 	## Creates a stream using the given dict.
 	# @param stream_details a dict with four required keys (description, rules, title).
@@ -18,6 +20,17 @@ class Stream(MetaObjectAPI):
 	# @throw IOError HTTP code >= 500
 	# @return True if succeded
 	def create(self, stream_details):
+		self._check_create(stream_details)
+
+		self._validation_schema =  super(Stream, self)._get_validation_schema("streams")['models']['CreateStreamRequest']
+
+		return super(Stream, self)._create("streams", stream_details)
+
+	## Checks the details given to create a stream.
+	# @param stream_details the stream's details
+	# @throw TypeError the given variable is not a dict
+	# @throw ValueError some required keys are missing in the given stream_details dict
+	def _check_create(self, stream_details):
 		if type(stream_details) is not dict:
 			self.error_msg = "given stream_details must be a dict."
 			raise TypeError
@@ -26,14 +39,12 @@ class Stream(MetaObjectAPI):
 			self.error_msg = "Some parameters are missing, required: description, rules, title."
 			raise ValueError
 
-		self._validation_schema =  super(Stream, self)._get_validation_schema("streams")['models']['CreateStreamRequest']
+	## Sets the new stream's id and adds it to the title index.
+	def _on_created(self):
+		self._data['stream_id'] = self._response['stream_id']
+		self._data['id'] = self._response['stream_id']
 
-		if super(Stream, self)._create("streams", stream_details) == True:
-			self._data['stream_id'] = self._response['stream_id']
-			self._data['id'] = self._response['stream_id']
-			return True
-
-		return False
+		self._server.title_index('streams').add(self._data['title'], self._data['id'])
 
 	## Removes a previously loaded stream from the server.
 	# The key 'id' from self._data is used.
@@ -46,25 +57,46 @@ class Stream(MetaObjectAPI):
 			self.error_msg = "The object is empty: no id available."
 			raise ValueError
 
-		return super(Stream, self)._delete("streams", self._data['id'])
+		_id = self._data['id']
+
+		if super(Stream, self)._delete("streams", _id) == True:
+			self._server.title_index('streams').remove(_id)
+			return True
+
+		return False
 
 	## Updates a stream using the given dict.
 	# @param stream_details a dict with the keys to update.
 	# @throw TypeError the given variable is not a dict
 	# @throw ValueError some required keys are missing in the given stream_details dict
 	# @throw IOError HTTP code >= 500
-	# @return True if succeded
+	# @return True if succeded, None if the stream was already up to date
 	def update(self, stream_details):
+		self._check_update(stream_details)
+
+		result = super(Stream, self)._update("streams", (self._data or {}).get('id'), stream_details)
+
+		if result != True:
+			return result
+
+		if 'title' in stream_details:
+			self._server.title_index('streams').remove(self._data['id'])
+			self._server.title_index('streams').add(stream_details['title'], self._data['id'])
+
+		return True
+
+	## Checks the details given to update a stream, the id is removed.
+	# @param stream_details a dict with the keys to update.
+	# @throw TypeError the given variable is not a dict
+	def _check_update(self, stream_details):
 		if type(stream_details) is not dict:
-			print stream_details
+			print(stream_details)
 			self.error_msg = "given stream_details must be a dict."
 			raise TypeError
 
 		if 'id' in stream_details.keys():
 			del stream_details['id']
 
-		return super(Stream, self)._update("streams", self._data['id'], stream_details)
-
 	## Tells if a stream exists in the server's database.
 	# @param id the stream to find
 	# @throw ValueError the given stream is empty
@@ -74,6 +106,7 @@ class Stream(MetaObjectAPI):
 		return super(Stream, self).find_by_id("streams", id)
 
 	## Returns the stream's id if it exists in the server's database.
+	# The server's title index is used, so only one list call is made per refresh.
 	# @param title the stream to find
 	# @throw ValueError the given stream is empty
 	# @throw IOError HTTP code >= 500
@@ -83,19 +116,11 @@ class Stream(MetaObjectAPI):
 			self.error_msg = "given title is too short."
 			raise ValueError
 
-		_url = "%s/%s" % (self._server.url, "streams")
-
-		r = self._server.session.get(_url)
-
-		if r.status_code != 200:
-			self.error_msg = r.text
-			raise IOError
-
-		for (i, stream) in enumerate(r.json()['streams']):
-			if stream['title'] == title:
-				return stream['id']
-
-		return None
+		try:
+			return self._server.title_index('streams').lookup(title)
+		except (IOError, ValueError):
+			self.error_msg = self._server.error_msg
+			raise
 
 	## Loads a stream from the server's database.
 	# @param stream the stream to find
@@ -132,7 +157,7 @@ class Stream(MetaObjectAPI):
 			self.error_msg = "The object is empty: no id available."
 			raise ValueError
 
-		_url = "%s/%s/%s/%s" % (self._server.url, "streams", id, "throughput")
+		_url = "%s/%s/%s/%s" % (self._server.url, "streams", self._data['id'], "throughput")
 
 		r = self._server.session.get(_url)
 
@@ -144,6 +169,27 @@ class Stream(MetaObjectAPI):
 
 		return r.json()['throughput']
 
+	## Gets the current throughput of many streams concurrently.
+	# @param server the Server object, its session pool should hold at least workers connections
+	# @param ids an iterable of stream ids
+	# @param workers the number of concurrent requests
+	# @return a list of pygraylog.bulk.BulkResult whose result is the stream's throughput
+	@classmethod
+	def get_throughputs(cls, server, ids, workers=8):
+		return BulkEngine(workers).run(lambda id: cls._get_throughput_of(server, id), ids)
+
+	## Gets the throughput of one stream, the error message is attached to the raised exception.
+	@classmethod
+	def _get_throughput_of(cls, server, id):
+		stream = cls(server)
+		stream.load_from_json({ 'id' : id }, 'off')
+
+		try:
+			return stream.get_throughput()
+		except Exception as e:
+			e.error_msg = stream.error_msg
+			raise
+
 	## Pauses the current stream/
 	# @throw ValueError the given stream is not found
 	# @throw IOError HTTP code != 200
@@ -221,7 +267,7 @@ class Rule(MetaObjectAPI):
 			self.error_msg = "The object is empty: no id available."
 			raise ValueError
 
-		_url = "%s/%s/%s/%s" % (self._server.url, 'streams', self._stream._data['id'], "rules", self._data['id'])
+		_url = "%s/%s/%s/%s/%s" % (self._server.url, 'streams', self._stream._data['id'], "rules", self._data['id'])
 
 		r = self._server.session.delete(_url)
 
@@ -235,6 +281,31 @@ class Rule(MetaObjectAPI):
 
 		return False
 
+	## Performs one action of a bulk operation.
+	# The stream is given by the item's 'stream_id' key.
+	# @param action create or delete
+	# @param item a dict describing the rule and its stream_id
+	# @throw ValueError the given parameters are not valid
+	# @throw IOError HTTP code >= 500
+	# @return the value returned by the action
+	def _bulk(self, action, item):
+		if type(item) is not dict or 'stream_id' not in item:
+			self.error_msg = "The item has no stream_id."
+			raise ValueError
+
+		stream = Stream(self._server)
+		stream._data = { 'id' : item['stream_id'] }
+		self.attach(stream)
+
+		details = dict(item)
+		del details['stream_id']
+
+		if action == 'update':
+			self.error_msg = "Rules cannot be updated."
+			raise ValueError
+
+		return super(Rule, self)._bulk(action, details)
+
 	def update():
 		_url = "%s/streams/%s/rules/%s" % ( self._server.url, self._stream._data['id'], id)
 		return super(Rule, self)._update(_url, id)
@@ -282,7 +353,7 @@ class Alert_Receiver(MetaObjectAPI):
 	# @throw IOError HTTP code >= 500
 	# @return True if succeded
 	def add(self, ar_details):
-		if type(ar_details_details) is not dict:
+		if type(ar_details) is not dict:
 			self.error_msg = "given stream_details must be a dict."
 			raise TypeError
 
@@ -290,16 +361,20 @@ class Alert_Receiver(MetaObjectAPI):
 			self.error_msg = "Some parameters are missing, required: streamId, entity, type."
 			raise ValueError
 
-		if pygraylog.streams.Stream(self._hostname, self._login, self._password).find_by_id(ar_details['streamId']) == False:
+		if Stream(self._server).find_by_id(ar_details['streamId']) == False:
 			self.error_msg = "Bad given streamId."
 			raise ValueError
 
 		# TODO: find the right definition in the API's doc
 		#self._validation_schema =  super(Stream, self)._get_validation_schema("streams")['models']['StreamListResponse']['streams']
 
-		_url = "/streams/%s/%alerts/receivers" % ( ar_details['streamId'] )
+		_url = "%s/streams/%s/alerts/receivers" % ( self._server.url, ar_details['streamId'] )
+
+		r = self._server.session.post(_url, params={ 'entity' : ar_details['entity'], 'type' : ar_details['type'] })
+
+		self._handle_request_status_code(r)
 
-		return super(Alert_Receiver, self).create(_url, ar_details)
+		return True
 
 	## Removes a previously loaded alert receiver from all the streams.
 	# self._data is used and cleared on success.
@@ -312,7 +387,7 @@ class Alert_Receiver(MetaObjectAPI):
 			self.error_msg = "The object is empty: no type or entity available."
 			raise ValueError
 
-		r = self._server.session.get("/streams")
+		r = self._server.session.get("%s/%s" % (self._server.url, 'streams'))
 
 		if r.status_code >= 500:
 			self.error_msg = r.text
@@ -324,7 +399,7 @@ class Alert_Receiver(MetaObjectAPI):
 
 		for (i, stream) in enumerate(r.json()['streams']):
 			if 'alert_receivers' in stream:
-				_url = "/streams/%s/%alerts/receivers" % ( stream['id'] )
+				_url = "%s/streams/%s/alerts/receivers" % ( self._server.url, stream['id'] )
 				_payload = {}
 
 				if self._data['entity'] in stream['alert_receivers']['emails']:
@@ -349,11 +424,11 @@ class Alert_Receiver(MetaObjectAPI):
 	# @throw IOError HTTP code >= 500
 	# @return True if succeded
 	def delete(self):
-		if self._data == None or 'type' not in self._data or 'entity' not in self._data:
-			self.error_msg = "The object is empty: no type or entity available."
+		if self._data == None or 'type' not in self._data or 'entity' not in self._data or 'streamId' not in self._data:
+			self.error_msg = "The object is empty: no streamId, type or entity available."
 			raise ValueError
 
-		_url = "/streams/%s/%alerts/receivers" % ( ar_details['streamId'] )
+		_url = "%s/streams/%s/alerts/receivers" % ( self._server.url, self._data['streamId'] )
 
 		r = self._server.session.delete(_url, params=self._data)
 
@@ -397,7 +472,7 @@ class Alert_Receiver(MetaObjectAPI):
 			self.error_msg = "given id is too short."
 			raise ValueError
 
-		_url = "%s/%s" % (self._url, 'streams')
+		_url = "%s/%s" % (self._server.url, 'streams')
 
 		r = self._server.session.get(_url)
 
@@ -422,13 +497,11 @@ class Alert_Receiver(MetaObjectAPI):
 	# @throw IOError HTTP code >= 500
 	# @return True if found and loaded
 	def load_from_server(self, id):
-		objec_name = 'streams'
-
 		if len(id) == 0:
 			self.error_msg = "given id is too short."
 			raise ValueError
 
-		_url = "%s/%s/%s" % (self._url, object_name, id)
+		_url = "%s/%s" % (self._server.url, 'streams')
 
 		r = self._server.session.get(_url)
 
@@ -440,6 +513,8 @@ class Alert_Receiver(MetaObjectAPI):
 			self._response = r.json()
 			return False
 
+		self._data = {}
+
 		for (i, stream) in enumerate(r.json()['streams']):
 			if 'alert_receivers' in stream:
 				if id in stream['alert_receivers']['emails']:
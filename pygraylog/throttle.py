@@ -0,0 +1,146 @@
+#! /usr/bin/env python
+
+## @package pygraylog.throttle
+# This package is used to adapt the pace of the calls to what the server tolerates.
+#
+# The limiter combines a token bucket, bounding the calls per second, and a limit of
+# concurrent calls. Both follow an AIMD policy: they grow slowly while the calls succeed
+# quickly and are halved when the server answers 429 or 503 or gets slower than the
+# latency target. The idempotent calls which failed that way are retried after a
+# delay with full jitter, or the one asked by the Retry-After header.
+#
+
+import random, threading, time
+
+## The methods which can be sent again safely.
+IDEMPOTENT_METHODS = ( 'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE' )
+
+## The status codes telling that the server is overloaded.
+OVERLOAD_STATUS_CODES = ( 429, 503 )
+
+## The status codes of the retried calls.
+RETRY_STATUS_CODES = ( 429, 502, 503, 504 )
+
+## An adaptive rate and concurrency limiter.
+class AdaptiveLimiter:
+	## This is the constructor.
+	# @param rate the maximum number of calls per second or None
+	# @param concurrency the maximum number of concurrent calls or None
+	# @param latency_target the duration in seconds above which a call is taken as a sign of overload, None to ignore the latency
+	# @param retries the number of retries of the idempotent calls
+	# @param backoff the base delay of the retries in seconds
+	# @param max_backoff the longest delay of a retry in seconds
+	# @param min_rate the lowest rate reached when backing off
+	# @param min_concurrency the lowest concurrency reached when backing off
+	# @throw ValueError bad rate or concurrency given
+	def __init__(self, rate=None, concurrency=None, latency_target=2.0, retries=3, backoff=0.5, max_backoff=30, min_rate=1, min_concurrency=1):
+		self.error_msg = ""
+
+		if rate != None and rate <= 0:
+			self.error_msg = "bad rate given: %s" % rate
+			raise ValueError
+
+		if concurrency != None and concurrency < 1:
+			self.error_msg = "bad concurrency given: %s" % concurrency
+			raise ValueError
+
+		self.max_rate = rate
+		self.max_concurrency = concurrency
+		self.min_rate = min(min_rate, rate or min_rate)
+		self.min_concurrency = min(min_concurrency, concurrency or min_concurrency)
+		self.latency_target = latency_target
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+
+		## The current limits
+		self.rate = rate
+		self.concurrency = concurrency
+
+		self._in_flight = 0
+		self._tokens = 1.0
+		self._last_fill = time.time()
+		self._last_decrease = 0
+		self._cond = threading.Condition()
+
+	## Waits until a call is allowed, release must be called once it is over.
+	def acquire(self):
+		wait = 0
+
+		with self._cond:
+			while self.concurrency != None and self._in_flight >= int(self.concurrency):
+				self._cond.wait()
+
+			self._in_flight += 1
+
+			if self.rate != None:
+				now = time.time()
+				self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last_fill) * self.rate)
+				self._last_fill = now
+
+				# a negative balance is a reservation: the caller waits for its token
+				self._tokens -= 1
+				if self._tokens < 0:
+					wait = -self._tokens / self.rate
+
+		if wait > 0:
+			time.sleep(wait)
+
+	## Ends a call and adapts the limits.
+	# @param seconds the call's duration
+	# @param overloaded True if the server answered it was overloaded or could not be reached
+	def release(self, seconds, overloaded=False):
+		with self._cond:
+			self._in_flight -= 1
+
+			if overloaded == False and self.latency_target != None and seconds > self.latency_target:
+				overloaded = True
+
+			if overloaded == True:
+				self._decrease()
+			else:
+				self._increase()
+
+			self._cond.notify_all()
+
+	## Halves the limits, at most once per second so that a burst of failures counts once.
+	def _decrease(self):
+		now = time.time()
+
+		if now - self._last_decrease < 1:
+			return
+
+		self._last_decrease = now
+
+		if self.rate != None:
+			self.rate = max(self.min_rate, self.rate / 2.0)
+
+		if self.concurrency != None:
+			self.concurrency = max(self.min_concurrency, self.concurrency / 2.0)
+
+	## Raises the limits a little, up to their maximum.
+	def _increase(self):
+		if self.rate != None:
+			self.rate = min(self.max_rate, self.rate + self.max_rate / 100.0)
+
+		if self.concurrency != None:
+			self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.concurrency)
+
+	## Tells if a call may be retried.
+	# @param method the call's method
+	# @param attempt the number of retries already made
+	def can_retry(self, method, attempt):
+		return method.upper() in IDEMPOTENT_METHODS and attempt < self.retries
+
+	## Returns the delay before a retry.
+	# @param attempt the number of retries already made
+	# @param retry_after the value of the Retry-After header or None
+	# @return a number of seconds
+	def get_delay(self, attempt, retry_after=None):
+		if retry_after != None:
+			try:
+				return min(self.max_backoff, max(0, float(retry_after)))
+			except ValueError:
+				pass
+
+		return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
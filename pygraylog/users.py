@@ -10,6 +10,8 @@ from pygraylog.api import MetaObjectAPI
 
 ## This class is used to manage the users.
 class User(MetaObjectAPI):
+	_load_schema = ("users", "UserSummary")
+	_id_key = 'username'
 
 	## Creates a user using the given dict.
 	# @param user_details a dict with five required keys (username, full_name, email, password, permissions).
@@ -18,6 +20,17 @@ class User(MetaObjectAPI):
 	# @throw IOError HTTP code >= 500
 	# @return True if succeded
 	def create(self, user_details):
+		self._check_create(user_details)
+
+		self._validation_schema =  super(User, self)._get_validation_schema("users")['models']['UserSummary']
+
+		return super(User, self)._create("users", user_details)
+
+	## Checks the details given to create a user.
+	# @param user_details the user's details
+	# @throw TypeError the given variable is not a dict
+	# @throw ValueError some required keys are missing in the given user_details dict
+	def _check_create(self, user_details):
 		if type(user_details) is not dict:
 			self.error_msg = "given user_details must be a dict."
 			raise TypeError
@@ -30,10 +43,6 @@ class User(MetaObjectAPI):
 			self.error_msg = "Some parameters are missing, required: username, full_name, email, password, permissions."
 			raise ValueError
 
-		self._validation_schema =  super(User, self)._get_validation_schema("users")['models']['UserSummary']
-
-		return super(User, self)._create("users", user_details)
-
 	## Removes a previously loaded user from the server.
 	# The key 'username' from self._data is used.
 	# @throw TypeError the given variable is not a dict
@@ -52,20 +61,42 @@ class User(MetaObjectAPI):
 	# @throw TypeError the given variable is not a dict
 	# @throw ValueError some required keys are missing in the given user_details dict
 	# @throw IOError HTTP code >= 500
-	# @return True if succeded
+	# @return True if succeded, None if the user was already up to date
 	def update(self, user_details):
 		if type(user_details) is not dict:
-			print user_details
+			print(user_details)
 			self.error_msg = "given user_details must be a dict."
 			raise TypeError
 
-		if 'username' in user_details.keys():
-			del user_details['username']
+		changed = None
 
 		if 'password' in user_details.keys():
 			if self.update_password(str(user_details['password'])) == False:
 				   return False
+			changed = True
+
+		self._check_update(user_details)
+
+		result = super(User, self)._update("users", (self._data or {}).get('username'), user_details)
 
+		if result == None:
+			return changed
+
+		return result
+
+	## Checks and cleans the details given to update a user.
+	# The username and the password, updated by update_password, are removed.
+	# @param user_details a dict with the keys to update.
+	# @throw TypeError the given variable is not a dict
+	def _check_update(self, user_details):
+		if type(user_details) is not dict:
+			self.error_msg = "given user_details must be a dict."
+			raise TypeError
+
+		if 'username' in user_details.keys():
+			del user_details['username']
+
+		if 'password' in user_details.keys():
 			del user_details['password']
 
 		if 'permissions' in user_details.keys():
@@ -76,8 +107,6 @@ class User(MetaObjectAPI):
 			if user_details['startpage'] == None or len(user_details['startpage']) == 0:
 				user_details['startpage'] = { u'type' : None, u'id' : None }
 
-		return super(User, self)._update("users", self._data['username'], user_details)
-
 	## Updates a user's password using the given argument.
 	# @param user_pwd the new password.
 	# @throw TypeError the given variable is not a string
@@ -200,4 +229,9 @@ class User(MetaObjectAPI):
 		#return self._backup2("users", id)
 
 	def backup_all(self):
-		return self._backup1("users")["users"]
+		_result = self._backup1("users")["users"]
+
+		for user in _result:
+			self._server.objects.put("users", user['username'], user)
+
+		return _result
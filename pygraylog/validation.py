@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+
+## @package pygraylog.validation
+# This package is used to validate the objects against the schemas given by the server.
+#
+
+import json, random, threading
+import jsonschema
+
+## Nothing is validated.
+OFF = 'off'
+## A random part of the objects is validated.
+SAMPLED = 'sampled'
+## Every object is validated.
+STRICT = 'strict'
+
+## A registry of compiled validators.
+#
+# One validator is built per schema and reused by the following calls. The validators
+# are keyed by the model's id, so a schema fetched again replaces the validator of its
+# previous copy and the registry holds one validator per model.
+# The mode can be lowered to OFF or SAMPLED during bulk loads.
+class ValidatorRegistry:
+	## This is the constructor.
+	# @param mode OFF, SAMPLED or STRICT
+	# @param sample_rate the part of the objects validated in SAMPLED mode (0.0 to 1.0)
+	# @throw ValueError bad mode or sample rate given
+	def __init__(self, mode=STRICT, sample_rate=0.01):
+		self._validators = {}
+		self._lock = threading.Lock()
+		self.error_msg = ""
+
+		self.set_mode(mode, sample_rate)
+
+	## Changes the validation mode.
+	# @param mode OFF, SAMPLED or STRICT
+	# @param sample_rate the part of the objects validated in SAMPLED mode or None to keep the current one
+	# @throw ValueError bad mode or sample rate given
+	def set_mode(self, mode, sample_rate=None):
+		if mode not in (OFF, SAMPLED, STRICT):
+			self.error_msg = "bad validation mode given: %s" % (mode)
+			raise ValueError
+
+		if sample_rate != None:
+			if sample_rate < 0 or sample_rate > 1:
+				self.error_msg = "bad sample rate given: %s" % (sample_rate)
+				raise ValueError
+			self.sample_rate = sample_rate
+
+		self.mode = mode
+
+	## Returns the compiled validator of the given schema.
+	# The schema is checked once, when the validator is built.
+	# @param schema the JSON schema
+	# @throw jsonschema.SchemaError the schema is not valid
+	# @return the validator
+	def get(self, schema):
+		_key = self._get_key(schema)
+
+		with self._lock:
+			entry = self._validators.get(_key)
+
+			if entry != None and entry[0] is schema:
+				return entry[1]
+
+			# an identical copy of the schema, such as one fetched again, reuses the validator
+			if entry != None and entry[0] == schema:
+				self._validators[_key] = (schema, entry[1])
+				return entry[1]
+
+		cls = jsonschema.validators.validator_for(schema)
+		cls.check_schema(schema)
+		validator = cls(schema)
+
+		with self._lock:
+			self._validators[_key] = (schema, validator)
+
+		return validator
+
+	## Returns the key of a schema in the registry.
+	# The models of /api-docs are named by their id, the other schemas by their content.
+	def _get_key(self, schema):
+		if 'id' in schema:
+			return schema['id']
+
+		return json.dumps(schema, sort_keys=True)
+
+	## Tells if the next object must be validated according to the mode.
+	# @param mode the mode to apply or None to use the registry's one
+	def _must_validate(self, mode=None):
+		if mode == None:
+			mode = self.mode
+
+		if mode == STRICT:
+			return True
+
+		if mode == SAMPLED:
+			return random.random() < self.sample_rate
+
+		return False
+
+	## Validates the given object.
+	# @param details the dict to validate
+	# @param schema the JSON schema
+	# @param mode the mode to apply to this object or None to use the registry's one
+	# @throw jsonschema.ValidationError the object is not valid
+	# @return True if the object has been validated, False if skipped
+	def validate(self, details, schema, mode=None):
+		if schema == None or len(schema) == 0:
+			return False
+
+		if self._must_validate(mode) == False:
+			return False
+
+		self.get(schema).validate(details)
+
+		return True
+
+	## Removes every compiled validator.
+	def clear(self):
+		with self._lock:
+			self._validators = {}
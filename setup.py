@@ -83,6 +83,7 @@ setup(
     # for example:
     # $ pip install -e .[dev,test]
     extras_require={
+        'async': ['aiohttp'],
     },
 
     # If there are data files included in your packages that need to be
@@ -100,10 +101,10 @@ setup(
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
-    #entry_points={
-    #    'console_scripts': [
-    #        'sample=sample:main',
-    #    ],
-    #},
+    entry_points={
+        'console_scripts': [
+            'pygraylog-exporter=pygraylog.exporter:main',
+        ],
+    },
 )
 
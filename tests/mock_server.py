@@ -0,0 +1,446 @@
+#! /usr/bin/env python
+
+## @package mock_server
+# A local stand-in for the Graylog REST API, used by the tests and the benchmarks.
+#
+# The server keeps streams, users, dashboards and inputs in memory and answers the
+# calls made by pygraylog: the lists, the CRUD calls, the validation schemas and a
+# few system resources. The latency of every call, the number of generated objects
+# and the part of the calls failing on purpose can be set.
+#
+# It can also be run alone:
+#	python tests/mock_server.py --port 12900 --streams 10000 --latency 0.005
+#
+
+import getopt, json, random, re, sys, threading, time
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+
+## The validation schemas served under /api/api-docs.
+SCHEMAS = {
+	'streams' : { 'models' : { 'CreateStreamRequest' : { 'id' : 'CreateStreamRequest', 'properties' : {
+		'title' : { 'type' : 'string' }, 'description' : { 'type' : 'string' }, 'rules' : { 'type' : 'array' },
+		'matching_type' : { 'type' : 'string' } } } } },
+	'users' : { 'models' : { 'UserSummary' : { 'id' : 'UserSummary', 'properties' : {
+		'username' : { 'type' : 'string' }, 'full_name' : { 'type' : 'string' }, 'email' : { 'type' : 'string' } } } } },
+	'dashboards' : { 'models' : { 'CreateDashboardRequest' : { 'id' : 'CreateDashboardRequest', 'properties' : {
+		'title' : { 'type' : 'string' }, 'description' : { 'type' : 'string' } } } } },
+}
+
+## The id of the built-in "All messages" stream.
+DEFAULT_STREAM_ID = '000000000000000000000001'
+
+## The resources served as empty lists: path -> key.
+EMPTY_LISTS = {
+	'system/grok' : 'patterns',
+	'system/outputs' : 'outputs',
+}
+
+## The in-memory content of the server.
+class MockState:
+	## This is the constructor.
+	# @param streams the number of generated streams
+	# @param users the number of generated users
+	# @param dashboards the number of generated dashboards
+	# @param inputs the number of generated inputs, one in ten is not running
+	#
+	# Like a fresh Graylog, the server also holds the default index set and the
+	# built-in "All messages" stream.
+	def __init__(self, streams=100, users=100, dashboards=100, inputs=10):
+		self.lock = threading.Lock()
+		self.resources = { 'index_sets' : {}, 'streams' : {}, 'users' : {}, 'dashboards' : {}, 'inputs' : {} }
+
+		# the first id is the default stream's
+		self._next_id = 1
+		self._bodies = {}
+		self._etags = {}
+		self._version = 0
+
+		index_set_id = self.add('index_sets', { 'title' : 'Default index set', 'description' : 'The Graylog default index set',
+			'index_prefix' : 'graylog', 'shards' : 4, 'replicas' : 0, 'default' : True, 'writable' : True })
+
+		self.resources['streams'][DEFAULT_STREAM_ID] = { 'id' : DEFAULT_STREAM_ID, 'title' : 'All messages', 'description' : 'Stream containing all messages',
+			'disabled' : False, 'is_default' : True, 'matching_type' : 'AND', 'rules' : [], 'index_set_id' : index_set_id }
+
+		for i in range(streams):
+			self.add('streams', { 'title' : "stream %i" % i, 'description' : 'generated', 'disabled' : i % 10 == 9, 'is_default' : False, 'index_set_id' : index_set_id,
+				'matching_type' : 'AND', 'rules' : [ { 'id' : "rule-%i" % i, 'field' : 'source', 'type' : 1, 'value' : "host%i" % i, 'inverted' : False } ] })
+
+		for i in range(users):
+			self.add('users', { 'username' : "user%i" % i, 'full_name' : "User %i" % i, 'email' : "user%i@example.org" % i,
+				'permissions' : [], 'read_only' : False, 'external' : False })
+
+		for i in range(dashboards):
+			self.add('dashboards', { 'title' : "dashboard %i" % i, 'description' : 'generated' })
+
+		for i in range(inputs):
+			_id = self.new_id()
+			self.resources['inputs'][_id] = { 'id' : _id, 'title' : "input %i" % i, 'type' : 'org.graylog2.inputs.gelf.tcp.GELFTCPInput',
+				'state' : 'FAILED' if i % 10 == 9 else 'RUNNING', 'message_input' : { 'id' : _id, 'title' : "input %i" % i,
+				'type' : 'org.graylog2.inputs.gelf.tcp.GELFTCPInput' } }
+
+	## Returns a new object id.
+	def new_id(self):
+		with self.lock:
+			self._next_id += 1
+			return "%024x" % self._next_id
+
+	## Adds an object and returns its id.
+	def add(self, resource, details):
+		details = dict(details)
+
+		if resource == 'users':
+			_id = details['username']
+			details.pop('password', None)
+		elif resource == 'index_sets':
+			_id = self.new_id()
+			details['id'] = _id
+		else:
+			_id = self.new_id()
+			details['id'] = _id
+			details.setdefault('disabled', True)
+
+		with self.lock:
+			self.resources[resource][_id] = details
+			self._bodies.pop(resource, None)
+			self._etags.pop(resource, None)
+
+		return _id
+
+	## Updates an object.
+	# @return False if it does not exist
+	def update(self, resource, id, details):
+		with self.lock:
+			if id not in self.resources[resource]:
+				return False
+
+			self.resources[resource][id].update(details)
+			self._bodies.pop(resource, None)
+			self._etags.pop(resource, None)
+
+		return True
+
+	## Removes an object.
+	# @return False if it does not exist
+	def remove(self, resource, id):
+		with self.lock:
+			if self.resources[resource].pop(id, None) == None:
+				return False
+
+			self._bodies.pop(resource, None)
+			self._etags.pop(resource, None)
+
+		return True
+
+	## Returns the encoded list of a resource, it is only encoded again after a change.
+	def get_list_body(self, resource):
+		with self.lock:
+			if resource not in self._bodies:
+				items = list(self.resources[resource].values())
+				self._bodies[resource] = json.dumps({ 'total' : len(items), resource : items }).encode('utf-8')
+
+			return self._bodies[resource]
+
+	## Returns the meters of system/metrics/multiple, the running inputs get 10 msg/s.
+	# @param names the requested metrics, the unknown ones are left out like Graylog does
+	def get_meters(self, names):
+		meters = []
+
+		with self.lock:
+			for input in self.resources['inputs'].values():
+				name = "%s.%s.incomingMessages" % (input['message_input']['type'], input['id'])
+
+				if name in names:
+					rate = 10.0 if input['state'] == 'RUNNING' else 0.0
+					meters.append({ 'full_name' : name, 'name' : 'incomingMessages', 'type' : 'meter',
+						'metric' : { 'rate' : { 'total' : 0, 'mean' : rate, 'one_minute' : rate, 'five_minute' : rate, 'fifteen_minute' : rate }, 'rate_unit' : 'events/second' } })
+
+		return { 'total' : len(meters), 'metrics' : meters }
+
+	## Returns the ETag of the list of a resource, it changes with its content.
+	def get_list_etag(self, resource):
+		with self.lock:
+			if resource not in self._etags:
+				self._version += 1
+				self._etags[resource] = '"%s-%i"' % (resource, self._version)
+
+			return self._etags[resource]
+
+## The handler of the API calls.
+class _Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	# the headers and the body are sent in one segment, the mock must not add the delayed ACK's 40ms
+	wbufsize = -1
+	disable_nagle_algorithm = True
+
+	def log_message(self, format, *args): pass
+
+	def _send(self, code, obj=None, body=None, etag=None):
+		if body == None:
+			body = b'' if obj == None else json.dumps(obj).encode('utf-8')
+
+		self.send_response(code)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		if etag != None:
+			self.send_header('ETag', etag)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _read_body(self):
+		length = int(self.headers.get('Content-Length') or 0)
+
+		if length == 0:
+			return None
+
+		return json.loads(self.rfile.read(length).decode('utf-8'))
+
+	def do_GET(self):
+		self._dispatch('GET')
+
+	def do_POST(self):
+		self._dispatch('POST')
+
+	def do_PUT(self):
+		self._dispatch('PUT')
+
+	def do_DELETE(self):
+		self._dispatch('DELETE')
+
+	def _dispatch(self, method):
+		mock = self.server.mock
+		path = self.path.split('?')[0]
+		details = self._read_body() if method in ('POST', 'PUT') else None
+
+		with mock.lock:
+			mock.calls += 1
+			fail = mock.random.random() < mock.error_rate
+
+		if mock.latency > 0:
+			time.sleep(mock.latency)
+
+		if fail == True:
+			return self._send(mock.error_code, { 'type' : 'ApiError', 'message' : 'injected error' })
+
+		if path.startswith('/api/') == False:
+			return self._send(404, { 'message' : "not found: %s" % path })
+
+		(code, obj, body) = self._route(mock.state, method, path[5:].rstrip('/'), details)
+
+		m = re.match(r'^/api/(streams|users|dashboards|system/inputs)/?$', path)
+		if m != None and method == 'GET' and mock.etags == True:
+			etag = mock.state.get_list_etag(m.group(1).split('/')[-1])
+
+			if self.headers.get('If-None-Match') == etag:
+				return self._send(304, etag=etag)
+
+			return self._send(code, obj, body, etag)
+
+		self._send(code, obj, body)
+
+	## Returns the (status code, object, encoded body) of a call.
+	def _route(self, state, method, path, details):
+		if path == 'system' and method == 'GET':
+			return (200, { 'version' : '2.4.0', 'cluster_id' : 'mock' }, None)
+
+		m = re.match(r'^api-docs/(\w+)$', path)
+		if m != None:
+			if m.group(1) not in SCHEMAS:
+				return (404, { 'message' : 'no schema' }, None)
+			return (200, SCHEMAS[m.group(1)], None)
+
+		if path in EMPTY_LISTS and method == 'GET':
+			return (200, { 'total' : 0, EMPTY_LISTS[path] : [] }, None)
+
+		if path == 'system/throughput':
+			return (200, { 'throughput' : 100 }, None)
+
+		if path == 'system/journal':
+			return (200, { 'enabled' : True, 'journal_size' : 1024, 'journal_size_limit' : 1048576, 'uncommitted_journal_entries' : 0 }, None)
+
+		if path == 'system/buffers':
+			return (200, { 'buffers' : dict([ (name, { 'utilization_percent' : 1.0, 'utilization' : 1 }) for name in [ 'input', 'process', 'output' ] ]) }, None)
+
+		if path == 'system/ldap/settings':
+			return (204, None, None)
+
+		m = re.match(r'^system/inputs/([^/]+)/extractors$', path)
+		if m != None:
+			return (200, { 'total' : 0, 'extractors' : [] }, None)
+
+		if path == 'system/indices/index_sets' and method == 'POST':
+			# the prefixes are unique
+			if len([ i for i in state.resources['index_sets'].values() if i['index_prefix'] == (details or {}).get('index_prefix') ]) > 0:
+				return (400, { 'type' : 'ApiError', 'message' : 'Index prefix already exists' }, None)
+
+			_id = state.add('index_sets', details or {})
+			return (200, state.resources['index_sets'][_id], None)
+
+		m = re.match(r'^(streams|users|dashboards|system/inputs|system/indices/index_sets)$', path)
+		if m != None:
+			resource = m.group(1).split('/')[-1]
+
+			if method == 'GET':
+				return (200, None, state.get_list_body(resource))
+
+			if method == 'POST':
+				_id = state.add(resource, details or {})
+
+				if resource == 'streams':
+					return (201, { 'stream_id' : _id }, None)
+				if resource == 'dashboards':
+					return (201, { 'dashboard_id' : _id }, None)
+				if resource == 'users':
+					return (201, None, None)
+				return (201, { 'id' : _id }, None)
+
+		m = re.match(r'^streams/([^/]+)/(throughput|pause|resume|rules)$', path)
+		if m != None:
+			if m.group(1) not in state.resources['streams']:
+				return (404, { 'message' : 'stream not found' }, None)
+
+			if m.group(2) == 'throughput':
+				return (200, { 'throughput' : len(m.group(1)) % 7 }, None)
+
+			if m.group(2) == 'rules':
+				rule = dict(details or {})
+				rule['id'] = state.new_id()
+				with state.lock:
+					state.resources['streams'][m.group(1)]['rules'].append(rule)
+					state._bodies.pop('streams', None)
+					state._etags.pop('streams', None)
+				return (201, { 'streamrule_id' : rule['id'] }, None)
+
+			state.update('streams', m.group(1), { 'disabled' : m.group(2) == 'pause' })
+			return (204, None, None)
+
+		m = re.match(r'^streams/([^/]+)/rules/([^/]+)$', path)
+		if m != None and method in ('PUT', 'DELETE'):
+			with state.lock:
+				rules = state.resources['streams'].get(m.group(1), {}).get('rules', [])
+				found = [ rule for rule in rules if rule['id'] == m.group(2) ]
+
+				if len(found) == 0:
+					return (404, { 'message' : 'stream rule not found' }, None)
+
+				if method == 'PUT':
+					found[0].update(details or {})
+				else:
+					rules.remove(found[0])
+
+				state._bodies.pop('streams', None)
+				state._etags.pop('streams', None)
+
+			if method == 'PUT':
+				return (200, { 'streamrule_id' : m.group(2) }, None)
+			return (204, None, None)
+
+		m = re.match(r'^(streams|users|dashboards|system/inputs)/([^/]+)$', path)
+		if m != None:
+			resource = m.group(1).split('/')[-1]
+			_id = m.group(2)
+
+			if method == 'GET':
+				if _id not in state.resources[resource]:
+					return (404, { 'message' : 'not found' }, None)
+				return (200, state.resources[resource][_id], None)
+
+			if method == 'PUT':
+				if state.update(resource, _id, details or {}) == False:
+					return (404, { 'message' : 'not found' }, None)
+				return (204, None, None)
+
+			if method == 'DELETE':
+				if state.remove(resource, _id) == False:
+					return (404, { 'message' : 'not found' }, None)
+				return (204, None, None)
+
+		m = re.match(r'^system/inputs/([^/]+)/(launch|stop|restart)$', path)
+		if m != None and method == 'POST':
+			if state.update('inputs', m.group(1), { 'state' : 'STOPPED' if m.group(2) == 'stop' else 'RUNNING' }) == False:
+				return (404, { 'message' : 'input not found' }, None)
+			return (202, None, None)
+
+		if path == 'system/metrics/multiple' and method == 'POST':
+			return (200, state.get_meters((details or {}).get('metrics', [])), None)
+
+		m = re.match(r'^users/([^/]+)/password$', path)
+		if m != None:
+			return (204, None, None)
+
+		return (404, { 'message' : "not found: %s" % path }, None)
+
+## The HTTP server, one thread per connection.
+class _Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+	# the concurrent benchmarks open more connections than the default backlog of 5,
+	# the others would wait for the SYN retries
+	request_queue_size = 128
+
+## A mock Graylog server running in a background thread.
+class MockGraylog:
+	## This is the constructor.
+	# @param streams the number of generated streams
+	# @param users the number of generated users
+	# @param dashboards the number of generated dashboards
+	# @param inputs the number of generated inputs
+	# @param latency the delay added to every call in seconds
+	# @param error_rate the part of the calls failing, between 0 and 1
+	# @param error_code the status code of the failing calls
+	# @param seed the seed choosing the failing calls
+	# @param etags True to send an ETag with the lists and to answer their conditional calls
+	def __init__(self, streams=100, users=100, dashboards=100, inputs=10, latency=0, error_rate=0, error_code=500, seed=0, etags=False):
+		self.state = MockState(streams, users, dashboards, inputs)
+		self.latency = latency
+		self.error_rate = error_rate
+		self.error_code = error_code
+		self.etags = etags
+
+		## The number of calls received
+		self.calls = 0
+
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+
+		self._server = None
+
+	## Starts the server.
+	# @param port the listening port, 0 to choose a free one
+	# @return the listening port
+	def start(self, port=0):
+		self._server = _Server(('127.0.0.1', port), _Handler)
+		self._server.mock = self
+
+		thread = threading.Thread(target=self._server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+		return self._server.server_address[1]
+
+	## Stops the server.
+	def stop(self):
+		if self._server != None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+
+if __name__ == '__main__':
+	options, remainder = getopt.gnu_getopt(sys.argv[1:], '', [ 'port=', 'streams=', 'users=', 'dashboards=', 'inputs=', 'latency=', 'error-rate=' ])
+	params = dict([ (opt[2:].replace('-', '_'), float(arg) if opt in ('--latency', '--error-rate') else int(arg)) for (opt, arg) in options ])
+	port = params.pop('port', 12900)
+
+	mock = MockGraylog(**params)
+	print("listening on http://127.0.0.1:%i/api" % (mock.start(port)))
+
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		mock.stop()
@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+
+import asyncio, unittest
+
+from mock_server import MockGraylog
+from pygraylog.aio import AsyncServer, AsyncStream
+
+class AsyncTitleIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(5, 0, 0, 0)
+		self.port = self.mock.start()
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_find_by_title(self):
+		async def run():
+			async with AsyncServer('127.0.0.1', self.port, version='2.4.0') as server:
+				server.auth_by_auth_basic('admin', 'admin')
+				stream = AsyncStream(server)
+
+				found = await stream.find_by_title('stream 3')
+				missing = await stream.find_by_title('unknown')
+
+				await stream.create({ 'title' : 'created', 'description' : 'test' })
+				calls = self.mock.calls
+				created = await stream.find_by_title('created')
+
+				return (found, missing, created == stream._data['id'], self.mock.calls - calls)
+
+		(found, missing, created, calls) = asyncio.run(run())
+
+		self.assertEqual(found, [ id for (id, s) in self.mock.state.resources['streams'].items() if s['title'] == 'stream 3' ][0])
+		self.assertEqual(missing, None)
+		# the created stream was added to the index by the create hook
+		self.assertEqual(created, True)
+		self.assertEqual(calls, 0)
+
+	def test_delete_then_find(self):
+		async def run():
+			async with AsyncServer('127.0.0.1', self.port, version='2.4.0') as server:
+				server.auth_by_auth_basic('admin', 'admin')
+				stream = AsyncStream(server)
+
+				await stream.load_from_server(await stream.find_by_title('stream 3'))
+				deleted = await stream.delete()
+				calls = self.mock.calls
+
+				return (deleted, await stream.find_by_title('stream 3'), self.mock.calls - calls)
+
+		(deleted, found, calls) = asyncio.run(run())
+
+		self.assertEqual(deleted, True)
+		# the deleted stream was removed from the index without reloading it
+		self.assertEqual(found, None)
+		self.assertEqual(calls, 0)
+
+if __name__ == '__main__':
+	unittest.main()
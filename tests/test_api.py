@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+
+import unittest
+
+from mock_server import MockGraylog
+from pygraylog.server import Server
+from pygraylog.streams import Stream
+
+class CreateTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(0, 0, 0, 0)
+		self.server = Server('127.0.0.1', self.mock.start(), object_cache_size=100)
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_created_object_not_cached(self):
+		stream = Stream(self.server)
+		stream.create({ 'title' : 'new', 'description' : 'created' })
+		id = stream._data['id']
+
+		self.assertEqual(self.server.objects.contains('streams', id), False)
+
+		loaded = Stream(self.server)
+		loaded.load_from_server(id)
+
+		# the server's defaults are loaded, not the request body
+		self.assertEqual(loaded._data['disabled'], True)
+		self.assertEqual(self.server.objects.get('streams', id)['disabled'], True)
+
+class UpdateTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(3, 0, 0, 0)
+		self.server = Server('127.0.0.1', self.mock.start())
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	## Returns the ids of the generated streams.
+	def _generated(self):
+		return [ id for (id, stream) in self.mock.state.resources['streams'].items() if stream['is_default'] == False ]
+
+	def test_unchanged(self):
+		stream = Stream(self.server)
+		stream.load_from_server(self._generated()[0])
+
+		self.assertEqual(stream.update({ 'description' : 'generated' }), None)
+		self.assertEqual(stream.update({ 'description' : 'changed' }), True)
+
+	def test_bulk_unchanged(self):
+		items = [ { 'id' : id, 'description' : 'generated' } for id in self._generated() ]
+		results = self.server.bulk(Stream, 'update', items)
+
+		self.assertEqual([ result.success for result in results ], [ True ] * 3)
+
+	def test_empty(self):
+		stream = Stream(self.server)
+
+		self.assertRaises(ValueError, stream.update, { 'description' : 'changed' })
+		self.assertEqual(stream.error_msg, "The object is empty")
+		self.assertEqual(self.mock.calls, 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+
+import json, os, shutil, tempfile, unittest
+
+from mock_server import MockGraylog
+from pygraylog.backup import Backup, MANIFEST, RESOURCES, object_key, read_ndjson
+from pygraylog.server import Server
+
+## The mock server and the backup's directory used by the tests.
+class _BackupTestCase(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+		self.mock = MockGraylog(20, 5, 3, 4)
+		self.server = Server('127.0.0.1', self.mock.start(), pool_maxsize=4)
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+		shutil.rmtree(self.directory)
+
+	## Returns the objects of a resource read back from the backup, sorted by key.
+	def _read(self, backup, resource):
+		return sorted(backup.read(self.directory, resource), key=lambda item: object_key(resource, item))
+
+	## Returns the objects of a resource held by the mock server, sorted by key.
+	def _get(self, resource):
+		return sorted(self.mock.state.resources[resource].values(), key=lambda item: object_key(resource, item))
+
+class BackupTest(_BackupTestCase):
+	def test_backup(self):
+		backup = Backup(self.server)
+
+		self.assertEqual(backup.backup(self.directory), True, backup.report)
+		self.assertEqual(backup.list_resources(self.directory), RESOURCES)
+
+		self.assertEqual(backup.report['streams']['count'], 21)
+		self.assertEqual(backup.report['stream_rules']['count'], 20)
+		self.assertEqual(backup.report['users']['count'], 5)
+		self.assertEqual(backup.report['ldap']['count'], 0)
+		self.assertEqual(backup.report['streams']['file'], os.path.join(self.directory, 'streams.ndjson.gz'))
+
+		for resource in [ 'index_sets', 'streams', 'dashboards', 'users', 'inputs' ]:
+			self.assertEqual(self._read(backup, resource), self._get(resource), resource)
+
+		rules = self._read(backup, 'stream_rules')
+		self.assertEqual(sorted([ rule['value'] for rule in rules ]), sorted([ "host%i" % i for i in range(20) ]))
+
+		with open(os.path.join(self.directory, MANIFEST)) as f:
+			manifest = json.load(f)
+
+		self.assertEqual(manifest['resources']['streams']['base'], 'streams.ndjson.gz')
+		self.assertEqual(len(manifest['resources']['streams']['hashes']), 21)
+
+	def test_uncompressed(self):
+		backup = Backup(self.server, compression=None)
+
+		self.assertEqual(backup.backup(self.directory, [ 'users' ]), True)
+
+		path = os.path.join(self.directory, 'users.ndjson')
+		with open(path) as f:
+			self.assertEqual(len(f.read().strip().split('\n')), 5)
+
+		self.assertEqual(sorted([ user['username'] for user in read_ndjson(path) ]), sorted(self.mock.state.resources['users'].keys()))
+
+	def test_without_manifest(self):
+		backup = Backup(self.server)
+		backup.backup(self.directory, [ 'users', 'dashboards' ])
+		os.remove(os.path.join(self.directory, MANIFEST))
+
+		self.assertEqual(backup.list_resources(self.directory), [ 'dashboards', 'users' ])
+		self.assertEqual(self._read(backup, 'users'), self._get('users'))
+
+	def test_partial_failure(self):
+		backup = Backup(self.server)
+
+		self.assertEqual(backup.backup(self.directory, [ 'users', 'unknown', 'dashboards' ]), False)
+		self.assertEqual(backup.error_msg, "failed to export: unknown")
+		self.assertTrue(backup.report['unknown']['error'] != None)
+		self.assertEqual(backup.report['dashboards']['count'], 3)
+		self.assertEqual(backup.list_resources(self.directory), [ 'dashboards', 'users' ])
+
+	def test_missing(self):
+		backup = Backup(self.server)
+
+		self.assertRaises(IOError, list, backup.read(self.directory, 'users'))
+
+	def test_bad_compression(self):
+		self.assertRaises(ValueError, Backup, self.server, 4, 'lzma')
+
+class IncrementalBackupTest(_BackupTestCase):
+	## Returns the delta files of the backup.
+	def _deltas(self):
+		return sorted([ name for name in os.listdir(self.directory) if name.startswith('delta-') ])
+
+	def test_incremental(self):
+		backup = Backup(self.server)
+		resources = [ 'streams', 'dashboards', 'users' ]
+		backup.backup(self.directory, resources)
+
+		state = self.mock.state
+		stream_id = [ id for (id, stream) in state.resources['streams'].items() if stream['title'] == 'stream 3' ][0]
+
+		state.add('streams', { 'title' : 'added', 'description' : 'test', 'rules' : [] })
+		state.update('streams', stream_id, { 'title' : 'changed' })
+		state.remove('dashboards', list(state.resources['dashboards'].keys())[0])
+		# a volatile key is not a change
+		state.update('users', 'user0', { 'last_activity' : '2026-10-18T10:00:00.000Z' })
+
+		self.assertEqual(backup.backup_incremental(self.directory, resources), True, backup.report)
+
+		self.assertEqual((backup.report['streams']['added'], backup.report['streams']['changed'], backup.report['streams']['deleted']), (1, 1, 0))
+		self.assertEqual(backup.report['dashboards']['deleted'], 1)
+		self.assertEqual(backup.report['users']['file'], None)
+		self.assertEqual(len(self._deltas()), 1)
+
+		# the base files are replayed with the delta
+		self.assertEqual(self._read(backup, 'streams'), self._get('streams'))
+		self.assertEqual(self._read(backup, 'dashboards'), self._get('dashboards'))
+		self.assertEqual(self._read(backup, 'users')[0].get('last_activity'), None)
+
+		# a run without change writes no delta
+		self.assertEqual(backup.backup_incremental(self.directory, resources), True)
+		self.assertEqual(len(self._deltas()), 1)
+
+		state.remove('streams', stream_id)
+		backup.backup_incremental(self.directory, resources)
+
+		self.assertEqual(len(self._deltas()), 2)
+		self.assertEqual(self._read(backup, 'streams'), self._get('streams'))
+
+		# a full backup drops the deltas
+		backup.backup(self.directory, resources)
+		self.assertEqual(self._deltas(), [])
+		self.assertEqual(self._read(backup, 'streams'), self._get('streams'))
+
+	def test_new_resource(self):
+		backup = Backup(self.server)
+		backup.backup(self.directory, [ 'users' ])
+
+		self.assertEqual(backup.backup_incremental(self.directory, [ 'users', 'dashboards' ]), True)
+		self.assertEqual(backup.report['dashboards']['count'], 3)
+		self.assertEqual(backup.report['users']['file'], None)
+		self.assertEqual(self._read(backup, 'dashboards'), self._get('dashboards'))
+
+	def test_first_run(self):
+		backup = Backup(self.server)
+
+		self.assertEqual(backup.backup_incremental(self.directory, [ 'users' ]), True)
+		self.assertEqual(self._deltas(), [])
+		self.assertEqual(self._read(backup, 'users'), self._get('users'))
+
+if __name__ == '__main__':
+	unittest.main()
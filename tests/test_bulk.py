@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+
+import threading, time, unittest
+
+from mock_server import MockGraylog, DEFAULT_STREAM_ID
+from pygraylog.bulk import BulkEngine, RateLimiter
+from pygraylog.dashboards import Dashboard
+from pygraylog.server import Server
+from pygraylog.streams import Stream
+
+class BulkEngineTest(unittest.TestCase):
+	def test_order(self):
+		results = BulkEngine(4).run(lambda i: i * 2, range(50))
+
+		self.assertEqual([ result.index for result in results ], list(range(50)))
+		self.assertEqual([ result.result for result in results ], [ i * 2 for i in range(50) ])
+		self.assertEqual([ result.success for result in results ], [ True ] * 50)
+
+	def test_failures(self):
+		def func(i):
+			if i % 3 == 0:
+				e = IOError()
+				e.error_msg = "item %i failed" % (i)
+				raise e
+
+			return i != 4 and None
+
+		results = BulkEngine(2).run(func, range(6))
+
+		self.assertEqual([ result.success for result in results ], [ False, True, True, False, False, True ])
+		self.assertEqual(results[3].error_msg, "item 3 failed")
+		self.assertTrue(isinstance(results[3].error, IOError))
+		# False fails, None is an update without change
+		self.assertEqual((results[4].error, results[5].error), (None, None))
+
+	def test_lazy(self):
+		consumed = []
+
+		def items():
+			for i in range(100):
+				consumed.append(i)
+				yield i
+
+		seen = []
+		engine = BulkEngine(2)
+
+		def func(i):
+			# the queue holds twice the workers, the generator is not drained upfront
+			seen.append(len(consumed))
+			time.sleep(0.001)
+
+		engine.run(func, items())
+
+		self.assertEqual(len(consumed), 100)
+		self.assertTrue(min(seen[:4]) < 10)
+
+	def test_bad_workers(self):
+		self.assertRaises(ValueError, BulkEngine, 0)
+
+class RateLimiterTest(unittest.TestCase):
+	def test_rate(self):
+		limiter = RateLimiter(50)
+		start = time.time()
+
+		threads = [ threading.Thread(target=limiter.acquire) for i in range(11) ]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertTrue(time.time() - start >= 0.19)
+
+	def test_bad_rate(self):
+		self.assertRaises(ValueError, RateLimiter, 0)
+
+class ServerBulkTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(0, 0, 2, 0)
+		self.server = Server('127.0.0.1', self.mock.start(), pool_maxsize=4)
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	## Returns the titles of the generated streams.
+	def _titles(self):
+		return sorted([ stream['title'] for (id, stream) in self.mock.state.resources['streams'].items() if id != DEFAULT_STREAM_ID ])
+
+	def test_streams(self):
+		items = [ { 'title' : "bulk %02i" % i, 'description' : 'bulk', 'rules' : [] } for i in range(20) ]
+		results = Stream.create_many(self.server, items, workers=4)
+
+		self.assertEqual([ result.success for result in results ], [ True ] * 20)
+		self.assertEqual(self._titles(), [ "bulk %02i" % i for i in range(20) ])
+
+		ids = [ id for id in self.mock.state.resources['streams'].keys() if id != DEFAULT_STREAM_ID ]
+
+		results = Stream.update_many(self.server, [ { 'id' : id, 'description' : 'updated' } for id in ids ], workers=4)
+		self.assertEqual([ result.success for result in results ], [ True ] * 20)
+		self.assertEqual(set([ self.mock.state.resources['streams'][id]['description'] for id in ids ]), set([ 'updated' ]))
+
+		results = Stream.delete_many(self.server, [ { 'id' : id } for id in ids[:10] ], workers=4)
+		self.assertEqual([ result.success for result in results ], [ True ] * 10)
+		self.assertEqual(len(self._titles()), 10)
+
+	def test_partial_failure(self):
+		items = [ { 'title' : 'first', 'description' : 'bulk' }, { 'title' : 'no description' }, 'not a dict', { 'title' : 'last', 'description' : 'bulk' } ]
+		results = Stream.create_many(self.server, items)
+
+		self.assertEqual([ result.success for result in results ], [ True, False, False, True ])
+		self.assertTrue(isinstance(results[1].error, ValueError))
+		self.assertTrue(isinstance(results[2].error, TypeError))
+		self.assertEqual(results[2].error_msg, "given item must be a dict.")
+		self.assertEqual(self._titles(), [ 'first', 'last' ])
+
+	def test_update_missing(self):
+		results = Dashboard.update_many(self.server, [ { 'id' : 'f' * 24, 'title' : 'gone' } ])
+
+		self.assertEqual(results[0].success, False)
+		self.assertEqual(results[0].error_msg, "%s not found." % ('f' * 24))
+
+	def test_bad_action(self):
+		self.assertRaises(ValueError, self.server.bulk, Stream, 'merge', [])
+		self.assertEqual(self.server.error_msg, "bad action given: merge")
+
+		self.assertRaises(ValueError, self.server.bulk, Stream, 'create', [], 0)
+		self.assertEqual(self.server.error_msg, "bad number of workers given: 0")
+
+if __name__ == '__main__':
+	unittest.main()
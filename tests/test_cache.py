@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+
+import json, os, shutil, tempfile, time, unittest
+
+from mock_server import MockGraylog
+from pygraylog.cache import ObjectCache, SchemaCache
+from pygraylog.dashboards import Dashboard
+from pygraylog.server import Server
+from pygraylog.streams import Stream
+
+class SchemaCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'schemas.json')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_load_expired(self):
+		with open(self.path, 'w') as f:
+			json.dump({ '2.4.0' : {
+				'streams' : { 'fetched' : time.time() - 7200, 'schema' : { 'models' : {} } },
+				'users' : { 'fetched' : time.time(), 'schema' : { 'models' : { 'UserSummary' : {} } } },
+			} }, f)
+
+		cache = SchemaCache(3600, self.path)
+
+		self.assertEqual(cache.get('2.4.0', 'streams'), None)
+		self.assertEqual(cache.get('2.4.0', 'users'), { 'models' : { 'UserSummary' : {} } })
+
+	def test_save_and_load(self):
+		SchemaCache(3600, self.path).set('2.4.0', 'streams', { 'models' : {} })
+
+		self.assertEqual(SchemaCache(3600, self.path).get('2.4.0', 'streams'), { 'models' : {} })
+
+class ObjectCacheTest(unittest.TestCase):
+	def test_password_not_stored(self):
+		cache = ObjectCache(10)
+		cache.put('users', 'john', { 'username' : 'john', 'password' : 'secret' })
+
+		self.assertEqual(cache.get('users', 'john'), { 'username' : 'john' })
+
+class TitleIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(20, 0, 3, 0)
+		self.port = self.mock.start()
+		self.server = self._get_server()
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def _get_server(self, title_ttl=60):
+		server = Server('127.0.0.1', self.port, title_ttl=title_ttl)
+		server.auth_by_auth_basic('admin', 'admin')
+
+		return server
+
+	## Returns the id of the mock's object having the given title.
+	def _get_id(self, resource, title):
+		return [ id for (id, item) in self.mock.state.resources[resource].items() if item['title'] == title ][0]
+
+	def test_one_list_call(self):
+		stream = Stream(self.server)
+
+		for i in range(20):
+			self.assertEqual(stream.find_by_title("stream %i" % i), self._get_id('streams', "stream %i" % i))
+
+		self.assertEqual(stream.find_by_title('unknown'), None)
+		self.assertEqual(self.mock.calls, 1)
+
+	def test_hooks(self):
+		stream = Stream(self.server)
+		stream.find_by_title('stream 0')
+		finds = []
+
+		## Finds a title and counts the calls it made.
+		def find(title):
+			calls = self.mock.calls
+			id = Stream(self.server).find_by_title(title)
+			finds.append(self.mock.calls - calls)
+			return id
+
+		stream.create({ 'title' : 'created', 'description' : 'test' })
+		created = stream._data['id']
+		self.assertEqual(find('created'), created)
+
+		stream.update({ 'title' : 'renamed' })
+		self.assertEqual(find('created'), None)
+		self.assertEqual(find('renamed'), created)
+
+		stream.delete()
+		self.assertEqual(find('renamed'), None)
+
+		# the index was patched by the hooks, not rebuilt
+		self.assertEqual(finds, [ 0 ] * 4)
+
+	def test_dashboards(self):
+		dashboard = Dashboard(self.server)
+
+		self.assertEqual(dashboard.find_by_title('dashboard 2'), self._get_id('dashboards', 'dashboard 2'))
+
+		dashboard.load_from_server(self._get_id('dashboards', 'dashboard 2'))
+		dashboard.delete()
+
+		self.assertEqual(dashboard.find_by_title('dashboard 2'), None)
+		self.assertEqual(dashboard.find_by_title('dashboard 1'), self._get_id('dashboards', 'dashboard 1'))
+
+	def test_expired(self):
+		server = self._get_server(title_ttl=0)
+		stream = Stream(server)
+
+		stream.find_by_title('stream 0')
+		# an object created by another client is seen once the index expired
+		self.mock.state.add('streams', { 'title' : 'external', 'description' : 'test', 'rules' : [] })
+
+		self.assertEqual(stream.find_by_title('external'), self._get_id('streams', 'external'))
+		self.assertEqual(self.mock.calls, 2)
+
+	def test_invalidate(self):
+		stream = Stream(self.server)
+		stream.find_by_title('stream 0')
+
+		self.mock.state.add('streams', { 'title' : 'external', 'description' : 'test', 'rules' : [] })
+		self.assertEqual(stream.find_by_title('external'), None)
+
+		self.server.title_index('streams').invalidate()
+		self.assertEqual(stream.find_by_title('external'), self._get_id('streams', 'external'))
+
+	def test_empty_title(self):
+		stream = Stream(self.server)
+
+		self.assertRaises(ValueError, stream.find_by_title, '')
+		self.assertEqual(stream.error_msg, "given title is too short.")
+
+if __name__ == '__main__':
+	unittest.main()
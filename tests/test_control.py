@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+
+import time, unittest
+
+from mock_server import MockGraylog
+from pygraylog.control import ClusterControl, InputControl, RollingRestart, Selector
+from pygraylog.server import Server
+
+class RollingRestartTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(0, 0, 0, 4)
+		self.server = Server('127.0.0.1', self.mock.start())
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_restart_gated_on_rates(self):
+		restart = RollingRestart([ self.server ], batch_size=2, timeout=1, poll_interval=0.1)
+
+		results = restart.perform()
+
+		self.assertEqual([ result.status for result in results ], [ 'ok' ] * 4)
+		self.assertEqual(restart.error_msg, "")
+
+	def test_missing_rate_aborts(self):
+		self.mock.state.get_meters = lambda names: { 'total' : 0, 'metrics' : [] }
+		for input in self.mock.state.resources['inputs'].values():
+			input['state'] = 'STOPPED'
+		restart = RollingRestart([ self.server ], batch_size=2, timeout=1, poll_interval=0.1)
+
+		results = restart.perform()
+
+		self.assertEqual([ result.status for result in results ], [ 'failed', 'failed', 'skipped', 'skipped' ])
+		# nothing was restarted
+		self.assertEqual(set([ input['state'] for input in self.mock.state.resources['inputs'].values() ]), set([ 'STOPPED' ]))
+		self.assertNotEqual(restart.error_msg, "")
+
+class SelectorTest(unittest.TestCase):
+	def test_match(self):
+		input = { 'id' : 'a', 'state' : 'RUNNING', 'message_input' : { 'id' : 'a', 'title' : 'gelf udp', 'type' : 'GELFUDPInput' } }
+
+		self.assertEqual(Selector().match(input), True)
+		self.assertEqual(Selector(type='GELFUDPInput', title='^gelf').match(input), True)
+		self.assertEqual(Selector(type='GELFTCPInput').match(input), False)
+		self.assertEqual(Selector(title='tcp').match(input), False)
+		self.assertEqual(Selector(ids=[ 'a', 'b' ]).match(input), True)
+		self.assertEqual(Selector(ids=[ 'b' ], title='gelf').match(input), False)
+
+class ClusterControlTest(unittest.TestCase):
+	def setUp(self):
+		self.mocks = [ MockGraylog(5, 0, 0, 5), MockGraylog(5, 0, 0, 5) ]
+		self.servers = []
+
+		for mock in self.mocks:
+			server = Server('127.0.0.1', mock.start())
+			server.auth_by_auth_basic('admin', 'admin')
+			self.servers.append(server)
+
+	def tearDown(self):
+		for mock in self.mocks:
+			mock.stop()
+
+	## Returns the titles of the inputs of a node having the given state.
+	def _get_titles(self, mock, state):
+		return sorted([ input['title'] for input in mock.state.resources['inputs'].values() if input['state'] == state ])
+
+	def test_inputs(self):
+		control = ClusterControl(self.servers, 'inputs', 'stop', Selector(title='input [0-2]$'), workers=4)
+		results = control.perform()
+
+		# every node runs its own copy of the inputs
+		self.assertEqual(len(results), 6)
+		self.assertEqual(set([ result.status for result in results ]), set([ 'ok' ]))
+		self.assertEqual(sorted(set([ result.node for result in results ])), sorted([ server.url for server in self.servers ]))
+
+		for mock in self.mocks:
+			self.assertEqual(self._get_titles(mock, 'STOPPED'), [ 'input 0', 'input 1', 'input 2' ])
+
+	def test_streams(self):
+		results = ClusterControl(self.servers, 'streams', 'pause', Selector(title='^stream [34]$')).perform()
+
+		# the streams are shared, they are controlled through the first node
+		self.assertEqual(sorted([ result.title for result in results ]), [ 'stream 3', 'stream 4' ])
+		self.assertEqual(set([ result.node for result in results ]), set([ self.servers[0].url ]))
+		self.assertEqual(sorted([ s['title'] for s in self.mocks[0].state.resources['streams'].values() if s['disabled'] == True ]), [ 'stream 3', 'stream 4' ])
+
+	def test_stop_on_failure(self):
+		control = ClusterControl(self.servers[:1], 'inputs', 'stop', batch_size=2, stop_on_failure=True)
+
+		# an input removed after being listed fails
+		targets = control.resolve()
+		control.resolve = lambda: [ (self.servers[0], { 'id' : 'f' * 24, 'title' : 'removed' }) ] + targets
+
+		results = control.perform()
+
+		self.assertEqual([ result.status for result in results ], [ 'failed', 'ok', 'skipped', 'skipped', 'skipped', 'skipped' ])
+		self.assertTrue('input not found' in results[0].error_msg)
+		self.assertEqual(self._get_titles(self.mocks[0], 'STOPPED'), [ targets[0][1]['title'] ])
+
+	def test_rate(self):
+		start = time.time()
+		results = ClusterControl(self.servers, 'inputs', 'restart', rate=20).perform()
+
+		self.assertEqual(len(results), 10)
+		self.assertTrue(time.time() - start >= 0.45)
+
+	def test_bad_parameters(self):
+		self.assertRaises(ValueError, ClusterControl, [], 'inputs', 'stop')
+		self.assertRaises(ValueError, ClusterControl, self.servers, 'outputs', 'stop')
+		self.assertRaises(ValueError, ClusterControl, self.servers, 'streams', 'restart')
+
+class MetaControlTest(unittest.TestCase):
+	def test_same_url(self):
+		legacy = InputControl('graylog', 12900, 'admin', 'secret', 'abc', 'restart')
+		shared = InputControl(None, None, None, None, 'abc', 'restart', server=Server('graylog', 12900))
+
+		self.assertEqual(legacy._url, 'http://graylog:12900/api/system/inputs/abc/restart')
+		self.assertEqual(legacy._url, shared._url)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+
+import os, shutil, socket, tempfile, threading, unittest
+
+from pygraylog.daemon import query
+
+class QueryTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'daemon.sock')
+
+		self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.listener.bind(self.path)
+		self.listener.listen(1)
+
+	def tearDown(self):
+		self.listener.close()
+		shutil.rmtree(self.directory)
+
+	## Answers the next query with the given bytes and closes the connection.
+	def _reply(self, reply):
+		def serve():
+			(connection, address) = self.listener.accept()
+			connection.recv(4096)
+			connection.sendall(reply)
+			connection.close()
+
+		thread = threading.Thread(target=serve)
+		thread.daemon = True
+		thread.start()
+
+	def test_reply(self):
+		self._reply(b'0\nOK - all good\n')
+
+		self.assertEqual(query(path=self.path), (0, 'OK - all good'))
+
+	def test_empty_reply(self):
+		self._reply(b'')
+
+		self.assertEqual(query(path=self.path), (3, 'UNKNOWN - empty/invalid reply from daemon'))
+
+	def test_reply_without_newline(self):
+		self._reply(b'2')
+
+		self.assertEqual(query(path=self.path), (3, 'UNKNOWN - empty/invalid reply from daemon'))
+
+	def test_unreachable(self):
+		self.assertEqual(query(path=os.path.join(self.directory, 'missing.sock'))[0], 3)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+
+import time, unittest
+
+try:
+	from urllib.request import urlopen
+except ImportError:
+	from urllib2 import urlopen
+
+from mock_server import MockGraylog
+from pygraylog.exporter import CONTENT_TYPE, Collector, Exporter, render
+from pygraylog.server import Server
+
+class RenderTest(unittest.TestCase):
+	def test_render(self):
+		text = render([ ('graylog_up', {}, 1), ('graylog_stream_disabled', { 'title' : 'a "b"\nc' }, 0) ])
+
+		self.assertEqual(text, str.join('\n', [
+			'# TYPE graylog_stream_disabled gauge',
+			'# HELP graylog_stream_disabled Whether the stream is paused.',
+			'graylog_stream_disabled{title="a \\"b\\"\\nc"} 0.0',
+			'# TYPE graylog_up gauge',
+			'# HELP graylog_up Whether the cluster answered the last collection.',
+			'graylog_up 1.0',
+			'# EOF' ]) + '\n')
+
+	def test_empty(self):
+		self.assertEqual(render([]), '# EOF\n')
+
+class CollectorTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(10, 0, 0, 10)
+		self.server = Server('127.0.0.1', self.mock.start())
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	## Returns the collected samples: name -> list of (labels, value).
+	def _collect(self, collector):
+		samples = {}
+
+		for (name, labels, value) in collector.collect():
+			samples.setdefault(name, []).append((labels, value))
+
+		return samples
+
+	def test_collect(self):
+		samples = self._collect(Collector(self.server, 'prod', workers=4))
+
+		self.assertEqual(samples['graylog_up'], [ ({ 'cluster' : 'prod' }, 1) ])
+		self.assertEqual(samples['graylog_collect_errors'], [ ({ 'cluster' : 'prod' }, 0) ])
+		self.assertEqual(samples['graylog_throughput'], [ ({ 'cluster' : 'prod' }, 100) ])
+		self.assertEqual(samples['graylog_journal_size_bytes'], [ ({ 'cluster' : 'prod' }, 1024) ])
+		self.assertEqual(sorted([ labels['buffer'] for (labels, value) in samples['graylog_buffer_utilization_percent'] ]), [ 'input', 'output', 'process' ])
+
+		running = dict([ (labels['title'], value) for (labels, value) in samples['graylog_input_running'] ])
+		self.assertEqual(len(running), 10)
+		self.assertEqual(running['input 9'], 0)
+		self.assertEqual(running['input 0'], 1)
+
+		# the paused streams have no throughput
+		self.assertEqual(len(samples['graylog_stream_disabled']), 11)
+		self.assertEqual(sorted([ labels['title'] for (labels, value) in samples['graylog_stream_disabled'] if value == 1 ]), [ 'stream 9' ])
+		self.assertEqual(len(samples['graylog_stream_throughput']), 10)
+
+		for (labels, value) in samples['graylog_stream_throughput']:
+			self.assertEqual(labels['cluster'], 'prod')
+			self.assertEqual(value, len(labels['stream']) % 7)
+
+	def test_one_call_per_stream(self):
+		Collector(self.server, 'prod').collect()
+
+		# inputs, streams, throughput, journal, buffers and the 10 enabled streams
+		self.assertEqual(self.mock.calls, 15)
+
+	def test_unreachable(self):
+		self.mock.stop()
+
+		collector = Collector(self.server, 'prod')
+		samples = self._collect(collector)
+
+		self.assertEqual(samples['graylog_up'], [ ({ 'cluster' : 'prod' }, 0) ])
+		self.assertEqual(samples['graylog_collect_errors'], [ ({ 'cluster' : 'prod' }, 3) ])
+		self.assertTrue('graylog_input_running' not in samples)
+
+class ExporterTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(2, 0, 0, 2)
+		server = Server('127.0.0.1', self.mock.start())
+		server.auth_by_auth_basic('admin', 'admin')
+
+		self.exporter = Exporter([ Collector(server, 'prod') ], refresh=60)
+
+	def tearDown(self):
+		self.exporter.stop()
+		self.mock.stop()
+
+	def test_serve(self):
+		self.exporter.start(0, '127.0.0.1')
+		url = "http://127.0.0.1:%i/metrics" % self.exporter._server.server_address[1]
+
+		for i in range(50):
+			if 'graylog_up' in self.exporter.get_metrics():
+				break
+			time.sleep(0.1)
+
+		calls = self.mock.calls
+		r = urlopen(url)
+		body = r.read().decode('utf-8')
+
+		self.assertEqual(r.headers['Content-Type'], CONTENT_TYPE)
+		self.assertTrue('graylog_up{cluster="prod"} 1.0\n' in body)
+		self.assertTrue(body.endswith('# EOF\n'))
+
+		# the scrapes are served from the cache
+		urlopen(url).read()
+		self.assertEqual(self.mock.calls, calls)
+
+if __name__ == '__main__':
+	unittest.main()
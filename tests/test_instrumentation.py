@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+
+import unittest
+
+from mock_server import MockGraylog
+from pygraylog.instrumentation import RequestStats, get_endpoint
+from pygraylog.server import Server
+from pygraylog.streams import Stream
+
+class GetEndpointTest(unittest.TestCase):
+	def test_ids(self):
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/streams'), 'streams')
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/streams/%s/rules/%s' % ('a' * 24, 'b' * 24)), 'streams/{id}/rules/{id}')
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/system/inputs/12345678-abcd-1234-abcd-123456789012'), 'system/inputs/{id}')
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/dashboards/42?limit=10'), 'dashboards/{id}')
+
+	def test_names(self):
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/users/john'), 'users/{name}')
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/roles/Admin/members'), 'roles/{name}/members')
+		self.assertEqual(get_endpoint('http://127.0.0.1:9000/api/system/journal'), 'system/journal')
+
+class RequestStatsTest(unittest.TestCase):
+	def test_summary(self):
+		stats = RequestStats()
+		stats.record('GET', 'streams', 200, 0.002, 0, 100, 0)
+		stats.record('GET', 'streams', 503, 0.2, 0, 10, 2)
+		stats.record('PUT', 'streams/{id}', None, 20.0, 50, 0, 0)
+		stats.record_cached('GET', 'streams')
+
+		summary = stats.summary()
+		streams = summary['endpoints']['GET streams']
+
+		self.assertEqual((streams['count'], streams['errors'], streams['retries'], streams['cached']), (2, 1, 2, 1))
+		self.assertEqual(streams['status_codes'], { 200 : 1, 503 : 1 })
+		self.assertEqual((streams['histogram']['<=5ms'], streams['histogram']['<=250ms']), (1, 1))
+		self.assertAlmostEqual(streams['mean_seconds'], 0.101)
+		self.assertEqual(summary['endpoints']['PUT streams/{id}']['histogram']['>10000ms'], 1)
+		self.assertEqual((summary['total']['count'], summary['total']['errors'], summary['total']['bytes_received']), (3, 2, 110))
+
+		stats.reset()
+		self.assertEqual(stats.summary()['endpoints'], {})
+
+	def test_hooks(self):
+		stats = RequestStats()
+		calls = []
+
+		def trace(method, endpoint, url):
+			calls.append((method, endpoint, url))
+			return lambda status_code, seconds, error: calls.append((status_code, seconds, error))
+
+		# a hook may not trace the end of the call
+		stats.add_hook(lambda method, endpoint, url: None)
+		stats.add_hook(trace)
+
+		ends = stats.start('GET', 'streams', 'http://127.0.0.1/api/streams')
+		self.assertEqual(len(ends), 1)
+
+		error = IOError('refused')
+		stats.record('GET', 'streams', None, 0.5, 0, 0, 0, ends, error)
+
+		self.assertEqual(calls, [ ('GET', 'streams', 'http://127.0.0.1/api/streams'), (None, 0.5, error) ])
+
+		stats.remove_hook(trace)
+		self.assertEqual(stats.start('GET', 'streams', 'http://127.0.0.1/api/streams'), [])
+
+class ServerStatsTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(5, 0, 0, 0)
+		self.server = Server('127.0.0.1', self.mock.start())
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_n_plus_one(self):
+		ids = [ id for id in self.mock.state.resources['streams'].keys() ]
+
+		for id in ids:
+			Stream(self.server).load_from_server(id)
+
+		# the calls are summed per endpoint
+		summary = self.server.stats()
+		self.assertEqual(summary['endpoints']['GET streams/{id}']['count'], len(ids))
+		self.assertEqual(summary['endpoints']['GET streams/{id}']['status_codes'], { 200 : len(ids) })
+		self.assertTrue(summary['total']['bytes_received'] > 0)
+
+		self.server.reset_stats()
+		self.assertEqual(self.server.stats()['total']['count'], 0)
+
+	def test_hooks(self):
+		spans = []
+
+		def trace(method, endpoint, url):
+			span = [ method, endpoint ]
+			spans.append(span)
+			return lambda status_code, seconds, error: span.extend([ status_code, error ])
+
+		self.server.add_hook(trace)
+		Stream(self.server).load_from_server(list(self.mock.state.resources['streams'].keys())[0])
+		self.server.remove_hook(trace)
+		Stream(self.server).find_by_title('stream 0')
+
+		self.assertEqual(spans, [ [ 'GET', 'streams/{id}', 200, None ] ])
+
+if __name__ == '__main__':
+	unittest.main()
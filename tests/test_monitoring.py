@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+
+import functools, unittest
+
+from mock_server import MockGraylog
+from pygraylog.monitoring import CheckRunner, InputCheck, InputRateCheck, JournalCheck, StreamCheck, ThroughputCheck
+from pygraylog.monitoring import OK, CRITICAL, UNKNOWN, format_nagios, get_input_type, get_worst_state
+from pygraylog.server import Server
+
+## The id of the checked input.
+INPUT_ID = '5a1c0fbd6dbb5800019a5a21'
+
+## The type of the checked input.
+INPUT_TYPE = 'org.graylog2.inputs.gelf.tcp.GELFTCPInput'
+
+## An item of system/inputs, as returned by Graylog.
+INPUT = {
+	'id' : INPUT_ID,
+	'state' : 'RUNNING',
+	'started_at' : '2017-11-27T13:30:05.000Z',
+	'detailed_message' : None,
+	'message_input' : {
+		'id' : INPUT_ID,
+		'title' : 'gelf tcp',
+		'type' : INPUT_TYPE,
+		'name' : 'GELF TCP',
+		'global' : True,
+		'node' : None,
+		'attributes' : { 'port' : 12201 },
+		'static_fields' : {},
+		'content_pack' : None,
+		'created_at' : '2017-11-27T13:30:05.000Z',
+		'creator_user_id' : 'admin',
+	},
+}
+
+## A meter of system/metrics/multiple, as returned by Graylog.
+def meter(full_name, one_minute):
+	return {
+		'full_name' : full_name,
+		'name' : full_name.split('.')[-1],
+		'type' : 'meter',
+		'metric' : {
+			'rate' : { 'total' : 1234, 'mean' : 3.1, 'one_minute' : one_minute, 'five_minute' : 4.2, 'fifteen_minute' : 4.0 },
+			'rate_unit' : 'events/second',
+		},
+	}
+
+class _Response:
+	def __init__(self, obj):
+		self.status_code = 200
+		self.text = ''
+		self._obj = obj
+
+	def json(self):
+		return self._obj
+
+class _Session:
+	def __init__(self):
+		self.posted = []
+
+	def post(self, url, json=None):
+		self.posted.append(json)
+
+		return _Response({ 'total' : 2, 'metrics' : [
+			meter("%s.%s.incomingMessages" % (INPUT_TYPE, INPUT_ID), 5.5),
+			meter("%s.%s.open_connections" % (INPUT_TYPE, INPUT_ID), 2),
+		] })
+
+class _Server:
+	url = 'http://graylog:12900/api'
+
+	def __init__(self):
+		self.session = _Session()
+
+	def build_url(self, *parts):
+		return "/".join([ self.url ] + list(parts))
+
+class InputRateCheckTest(unittest.TestCase):
+	def test_get_input_type(self):
+		self.assertEqual(get_input_type(INPUT), INPUT_TYPE)
+
+	def test_get_rates(self):
+		server = _Server()
+		check = InputRateCheck(None, None, None, None, server=server)
+
+		self.assertEqual(check.get_rates({ INPUT_ID : get_input_type(INPUT) }), { INPUT_ID : 5.5 })
+		self.assertEqual(server.session.posted, [ { 'metrics' : [ "%s.%s.incomingMessages" % (INPUT_TYPE, INPUT_ID) ] } ])
+
+	def test_get_rates_missing_meter(self):
+		check = InputRateCheck(None, None, None, None, server=_Server())
+
+		self.assertEqual(check.get_rates({ 'ffffffffffffffffffffffff' : INPUT_TYPE }), {})
+
+class MetaCheckTest(unittest.TestCase):
+	def test_same_url(self):
+		legacy = InputCheck('graylog', 12900, 'admin', 'secret')
+		shared = InputCheck(None, None, None, None, server=Server('graylog', 12900))
+
+		self.assertEqual(legacy._url, 'http://graylog:12900/api/system/inputs')
+		self.assertEqual(legacy._url, shared._url)
+
+class CheckRunnerTest(unittest.TestCase):
+	def setUp(self):
+		self.mocks = [ MockGraylog(10, 0, 0, 10), MockGraylog(5, 0, 0, 5) ]
+		self.nodes = [ ('127.0.0.1', mock.start()) for mock in self.mocks ]
+
+	def tearDown(self):
+		for mock in self.mocks:
+			mock.stop()
+
+	def test_run(self):
+		runner = CheckRunner(self.nodes, [ InputCheck, StreamCheck, ThroughputCheck ], 'admin', 'admin', workers=4)
+		results = runner.run()
+
+		names = [ "127.0.0.1:%i" % port for (hostname, port) in self.nodes ]
+
+		self.assertEqual([ (result.node, result.check) for result in results ],
+			[ (node, check) for node in sorted(names) for check in [ 'InputCheck', 'StreamCheck', 'ThroughputCheck' ] ])
+
+		states = dict([ ((result.node, result.check), result) for result in results ])
+
+		# the 10th input and stream of the first node failed
+		self.assertEqual(states[(names[0], 'InputCheck')].state, CRITICAL)
+		self.assertEqual(states[(names[0], 'InputCheck')].failed_stuff, [ 'input 9' ])
+		self.assertEqual(states[(names[0], 'StreamCheck')].failed_stuff, [ 'stream 9' ])
+		self.assertEqual(states[(names[1], 'InputCheck')].state, OK)
+		self.assertEqual(states[(names[1], 'ThroughputCheck')].state, OK)
+
+		(code, text) = format_nagios(results)
+		self.assertEqual(code, CRITICAL)
+		self.assertEqual(text.split('\n')[0], "CRITICAL - 2/6 checks failed")
+		self.assertTrue("%s InputCheck: CRITICAL - input 9" % (names[0]) in text)
+
+	def test_unreachable(self):
+		self.mocks[1].stop()
+
+		results = CheckRunner(self.nodes, [ InputCheck ], 'admin', 'admin').run()
+		down = [ result for result in results if result.node == "127.0.0.1:%i" % self.nodes[1][1] ][0]
+
+		self.assertEqual(down.state, UNKNOWN)
+		self.assertTrue(len(down.error_msg) > 0)
+		# a critical check wins over an unknown one
+		self.assertEqual(get_worst_state(results), CRITICAL)
+		self.assertEqual(get_worst_state([ down ]), UNKNOWN)
+
+	def test_windows_kept(self):
+		# the journal is filled at 0.1%, the third failed sample is reported
+		check = functools.partial(JournalCheck, critical=0.05, samples=5, required=3)
+		runner = CheckRunner(self.nodes[:1], [ check ], 'admin', 'admin')
+
+		self.assertEqual([ runner.run()[0].state for i in range(3) ], [ OK, OK, CRITICAL ])
+		self.assertEqual(runner.run()[0].failed_stuff, [ 'journal=0.1%' ])
+
+	def test_bad_parameters(self):
+		self.assertRaises(ValueError, CheckRunner, self.nodes, [ InputCheck ], 'admin', '')
+		self.assertRaises(ValueError, CheckRunner, [], [ InputCheck ], 'admin', 'admin')
+
+if __name__ == '__main__':
+	unittest.main()
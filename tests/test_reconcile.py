@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+
+import unittest
+
+from mock_server import MockGraylog, DEFAULT_STREAM_ID
+from pygraylog.reconcile import Change, Reconciler, CREATE, UPDATE, format_plan
+from pygraylog.server import Server
+
+## The desired state applied to the mock server.
+DESIRED = {
+	'streams' : [
+		{ 'title' : 'stream 0', 'description' : 'changed' },
+		{ 'title' : 'stream 1', 'rules' : [ { 'field' : 'source', 'type' : 1, 'value' : 'other', 'inverted' : False } ] },
+		{ 'title' : 'stream 2', 'disabled' : True },
+		{ 'title' : 'new', 'description' : 'new', 'matching_type' : 'AND', 'disabled' : False,
+			'rules' : [ { 'field' : 'level', 'type' : 1, 'value' : '3' } ] },
+	],
+	'users' : [
+		{ 'username' : 'user0', 'full_name' : 'User 0' },
+		{ 'username' : 'john', 'full_name' : 'John', 'email' : 'john@example.org', 'password' : 'secret', 'permissions' : [] },
+	],
+	'dashboards' : [ { 'title' : 'dashboard 0', 'description' : 'generated' } ],
+}
+
+class ReconcilerTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(4, 2, 2, 0)
+		self.server = Server('127.0.0.1', self.mock.start(), pool_maxsize=8)
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	## Returns the mock's stream having the given title.
+	def _get_stream(self, title):
+		return [ stream for stream in self.mock.state.resources['streams'].values() if stream['title'] == title ][0]
+
+	def test_plan(self):
+		changes = Reconciler(self.server).plan(DESIRED)
+
+		self.assertEqual(sorted(format_plan(changes).split('\n')), sorted([
+			'~ streams stream 0 (description)',
+			'~ streams stream 2 (disabled)',
+			'+ stream_rules stream 1: source 1 other False',
+			'- stream_rules stream 1: source 1 host1 False',
+			'+ streams new',
+			'+ users john',
+		]))
+
+		# nothing was written
+		self.assertEqual(self._get_stream('stream 0')['description'], 'generated')
+
+	def test_apply(self):
+		reconciler = Reconciler(self.server)
+		changes = reconciler.reconcile(DESIRED)
+
+		self.assertEqual(reconciler.failed, [])
+		self.assertEqual(len(changes), 6)
+
+		self.assertEqual(self._get_stream('stream 0')['description'], 'changed')
+		self.assertEqual(self._get_stream('stream 2')['disabled'], True)
+		self.assertEqual([ rule['value'] for rule in self._get_stream('stream 1')['rules'] ], [ 'other' ])
+		self.assertEqual(self._get_stream('new')['disabled'], False)
+		self.assertEqual([ rule['value'] for rule in self._get_stream('new')['rules'] ], [ '3' ])
+		self.assertTrue('john' in self.mock.state.resources['users'])
+
+		# the desired state is reached
+		self.assertEqual(format_plan(reconciler.plan(DESIRED)), "no changes")
+
+	def test_resume(self):
+		self.mock.state.update('streams', self._get_stream('stream 3')['id'], { 'disabled' : True })
+
+		reconciler = Reconciler(self.server)
+		changes = reconciler.reconcile({ 'streams' : [ { 'title' : 'stream 3', 'disabled' : False, 'description' : 'resumed' } ] })
+
+		self.assertEqual([ str(change) for change in changes ], [ '~ streams stream 3 (description, disabled)' ])
+		self.assertEqual(self._get_stream('stream 3')['disabled'], False)
+		self.assertEqual(self._get_stream('stream 3')['description'], 'resumed')
+
+	def test_prune(self):
+		self.mock.state.add('users', { 'username' : 'admin', 'read_only' : True })
+
+		reconciler = Reconciler(self.server, prune=True)
+		changes = reconciler.reconcile({ 'streams' : [ { 'title' : 'stream 0' } ], 'users' : [ { 'username' : 'user0' } ] })
+
+		self.assertEqual(sorted([ str(change) for change in changes ]), [ '- streams stream 1', '- streams stream 2', '- streams stream 3', '- users user1' ])
+
+		# the default stream and the read-only users are kept
+		self.assertEqual(sorted(self.mock.state.resources['streams'].keys()), sorted([ DEFAULT_STREAM_ID, self._get_stream('stream 0')['id'] ]))
+		self.assertEqual(sorted(self.mock.state.resources['users'].keys()), [ 'admin', 'user0' ])
+
+	def test_dry_run(self):
+		calls = self.mock.calls
+		changes = Reconciler(self.server).reconcile(DESIRED, dry_run=True)
+
+		self.assertEqual(len(changes), 6)
+		self.assertEqual(self._get_stream('stream 0')['description'], 'generated')
+		# one list call per resource
+		self.assertEqual(self.mock.calls - calls, 3)
+
+	def test_failure(self):
+		reconciler = Reconciler(self.server)
+		changes = [ Change(UPDATE, 'streams', 'gone', { 'description' : 'x' }, 'f' * 24), Change(CREATE, 'dashboards', 'created', { 'title' : 'created', 'description' : 'x' }) ]
+
+		self.assertEqual(reconciler.apply(changes), False)
+		self.assertEqual(reconciler.error_msg, "1 changes failed")
+		self.assertEqual(len(reconciler.failed), 1)
+		self.assertTrue(reconciler.failed[0][1].startswith("PUT streams/%s: " % ('f' * 24)))
+		self.assertEqual(len([ d for d in self.mock.state.resources['dashboards'].values() if d['title'] == 'created' ]), 1)
+
+	def test_bad_state(self):
+		reconciler = Reconciler(self.server)
+
+		self.assertRaises(ValueError, reconciler.plan, { 'inputs' : [] })
+		self.assertEqual(reconciler.error_msg, "unknown resource: inputs")
+
+		self.assertRaises(ValueError, reconciler.plan, { 'users' : [ { 'username' : 'a' }, { 'username' : 'a' } ] })
+		self.assertEqual(reconciler.error_msg, "duplicated users: a")
+
+if __name__ == '__main__':
+	unittest.main()
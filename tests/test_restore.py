@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+
+import shutil, tempfile, unittest
+
+from mock_server import MockGraylog, DEFAULT_STREAM_ID
+from pygraylog.backup import Backup
+from pygraylog.restore import Restore, get_waves
+from pygraylog.server import Server
+
+class RestoreTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(0, 0, 0, 0)
+		self.server = Server('127.0.0.1', self.mock.start())
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_get_waves(self):
+		self.assertEqual(get_waves([ 'stream_rules', 'streams', 'users' ]), [ [ 'streams', 'users' ], [ 'stream_rules' ] ])
+
+	def test_get_new_id(self):
+		restore = Restore(self.server)
+		restore._set_new_id('streams', 'old', 'new')
+
+		self.assertEqual(restore.get_new_id('streams', 'old'), 'new')
+		# the built-in "All messages" stream is never restored
+		self.assertEqual(restore.get_new_id('streams', '000000000000000000000001'), '000000000000000000000001')
+		self.assertEqual(restore.missing, { 'streams' : set([ '000000000000000000000001' ]) })
+
+	def test_get_new_id_failed(self):
+		restore = Restore(self.server)
+		restore._failed = { 'streams' : set([ 'old' ]) }
+
+		self.assertRaises(ValueError, restore.get_new_id, 'streams', 'old')
+
+class RoundTripTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+		self.source = MockGraylog(5, 3, 2, 0)
+		self.target = MockGraylog(0, 0, 0, 0)
+
+		# a second index set, used by one stream
+		self.index_set_id = self.source.state.add('index_sets', { 'title' : 'Audit', 'index_prefix' : 'audit', 'default' : False })
+		stream = [ stream for stream in self.source.state.resources['streams'].values() if stream['title'] == 'stream 0' ][0]
+		stream['index_set_id'] = self.index_set_id
+
+		self.servers = []
+		for mock in (self.source, self.target):
+			server = Server('127.0.0.1', mock.start())
+			server.auth_by_auth_basic('admin', 'admin')
+			self.servers.append(server)
+
+	def tearDown(self):
+		self.source.stop()
+		self.target.stop()
+		shutil.rmtree(self.directory)
+
+	def test_round_trip(self):
+		resources = [ 'index_sets', 'streams', 'stream_rules', 'users', 'dashboards' ]
+
+		self.assertEqual(Backup(self.servers[0]).backup(self.directory, resources), True)
+
+		restore = Restore(self.servers[1])
+		self.assertEqual(restore.restore(self.directory, resources), True, restore.report)
+
+		target = self.target.state.resources
+		index_sets = dict([ (index_set['index_prefix'], index_set['id']) for index_set in target['index_sets'].values() ])
+
+		# the default index set and stream were matched, not created again
+		self.assertEqual(sorted(index_sets.keys()), [ 'audit', 'graylog' ])
+		self.assertEqual(sorted([ stream['title'] for stream in target['streams'].values() ]), [ 'All messages' ] + [ "stream %i" % i for i in range(5) ])
+		self.assertEqual(restore.get_new_id('streams', DEFAULT_STREAM_ID), DEFAULT_STREAM_ID)
+		self.assertEqual(target['streams'][DEFAULT_STREAM_ID]['rules'], [])
+
+		for stream in target['streams'].values():
+			if stream['title'] == 'stream 0':
+				self.assertEqual(stream['index_set_id'], index_sets['audit'])
+			elif stream['title'] != 'All messages':
+				self.assertEqual(stream['index_set_id'], index_sets['graylog'])
+				self.assertEqual([ rule['value'] for rule in stream['rules'] ], [ "host%s" % stream['title'].split(' ')[1] ])
+				# the paused streams stay paused
+				self.assertEqual(stream['disabled'], stream['title'] == 'stream 9')
+
+		self.assertEqual(sorted(target['users'].keys()), [ 'user0', 'user1', 'user2' ])
+		self.assertEqual(sorted([ dashboard['title'] for dashboard in target['dashboards'].values() ]), [ 'dashboard 0', 'dashboard 1' ])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+
+import unittest
+
+from mock_server import MockGraylog
+from pygraylog.sampler import RingBuffer, Sampler, mean, percentile
+from pygraylog.server import Server
+
+class RingBufferTest(unittest.TestCase):
+	def test_wrap(self):
+		buf = RingBuffer(3)
+
+		self.assertEqual(buf.last(), None)
+
+		for i in range(5):
+			buf.append(i, i * 10)
+
+		self.assertEqual(len(buf), 3)
+		self.assertEqual(buf.samples(), [ (2, 20), (3, 30), (4, 40) ])
+		self.assertEqual(buf.last(), (4, 40))
+
+	def test_window(self):
+		buf = RingBuffer(10)
+
+		for i in range(10):
+			buf.append(i, i)
+
+		self.assertEqual(buf.values(2), [ 7, 8, 9 ])
+
+	def test_bad_size(self):
+		self.assertRaises(ValueError, RingBuffer, 0)
+
+	def test_stats(self):
+		self.assertEqual(mean([]), None)
+		self.assertEqual(mean([ 1, 2, 3, 6 ]), 3)
+		self.assertEqual(percentile([ 5, 1, 4, 2, 3 ], 50), 3)
+		self.assertEqual(percentile([ 5, 1, 4, 2, 3 ], 100), 5)
+
+class SamplerTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(10, 0, 0, 0)
+		server = Server('127.0.0.1', self.mock.start())
+		server.auth_by_auth_basic('admin', 'admin')
+
+		self.sampler = Sampler(server, size=4, workers=4)
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_poll(self):
+		for i in range(6):
+			self.sampler.poll()
+
+		# the paused stream is not sampled
+		self.assertEqual(len(self.sampler.titles), 10)
+		self.assertEqual(self.sampler.errors, {})
+
+		for id in self.sampler.titles.keys():
+			self.assertEqual(len(self.sampler.get_buffer(id)), 4)
+			self.assertEqual(self.sampler.get_rate(id), len(id) % 7)
+			self.assertEqual(self.sampler.get_average(id), len(id) % 7)
+			self.assertEqual(self.sampler.get_percentile(id, 90), len(id) % 7)
+
+	def test_errors(self):
+		# the first poll loads the streams list
+		self.sampler.poll()
+		self.mock.error_rate = 1
+
+		self.sampler.poll()
+
+		self.assertEqual(sorted(self.sampler.errors.keys()), sorted(self.sampler.titles.keys()))
+
+		for error_msg in self.sampler.errors.values():
+			self.assertTrue('injected error' in error_msg)
+
+		# the failed streams got no sample
+		id = list(self.sampler.titles.keys())[0]
+		self.assertEqual(len(self.sampler.get_buffer(id)), 1)
+
+	def test_silent_streams(self):
+		self.sampler.refresh_streams()
+		(loud, silent) = list(self.sampler.titles.keys())[:2]
+
+		for i in range(4):
+			self.sampler.get_buffer(loud).append(i * 10, 5)
+			self.sampler.get_buffer(silent).append(i * 10, 5 if i == 0 else 0)
+
+		self.assertEqual(self.sampler.get_silent_streams(15), [ silent ])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+
+import threading, unittest
+
+from mock_server import MockGraylog
+from pygraylog.server import Server
+
+class CoalescingTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(0, 10, 0, 0, latency=0.1)
+		self.port = self.mock.start()
+
+	def tearDown(self):
+		self.mock.stop()
+
+	## Gets the users from 8 threads at once and returns the number of calls received.
+	def _get_users(self, server):
+		threads = [ threading.Thread(target=server.get_users) for i in range(8) ]
+
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		return self.mock.calls
+
+	def test_disabled_by_default(self):
+		server = Server('127.0.0.1', self.port)
+		server.auth_by_auth_basic('admin', 'admin')
+
+		self.assertEqual(self._get_users(server), 8)
+
+	def test_enabled(self):
+		server = Server('127.0.0.1', self.port, coalesce_gets=True)
+		server.auth_by_auth_basic('admin', 'admin')
+
+		self.assertTrue(self._get_users(server) < 8)
+		self.assertTrue(server.stats()['total']['coalesced'] > 0)
+
+	def test_timeouts_not_coalesced(self):
+		server = Server('127.0.0.1', self.port, coalesce_gets=True)
+		server.auth_by_auth_basic('admin', 'admin')
+		url = server.build_url('users')
+
+		threads = [ threading.Thread(target=server.session.get, args=(url,), kwargs={ 'timeout' : t }) for t in (5, 5, 10, 10) ]
+
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(self.mock.calls, 2)
+
+if __name__ == '__main__':
+	unittest.main()
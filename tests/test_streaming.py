@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json, unittest
+
+from mock_server import MockGraylog
+from pygraylog.server import Server
+from pygraylog.streaming import iter_json_list
+
+## A streamed response giving its body in chunks of the asked size.
+class _Response:
+	def __init__(self, body, encoding='utf-8'):
+		self.body = body.encode('utf-8') if type(body) is not bytes else body
+		self.encoding = encoding
+		self.closed = False
+
+	def iter_content(self, chunk_size):
+		return iter([ self.body[i:i + chunk_size] for i in range(0, len(self.body), chunk_size) ])
+
+	def close(self):
+		self.closed = True
+
+DOCUMENT = { 'total' : 3, 'meta' : { 'streams' : [ 'not', 'this', 'one' ], 'text' : '[{"}]' },
+	'streams' : [ { 'id' : 1, 'title' : u'café ☃' }, { 'id' : 123456789, 'rules' : [ { 'value' : -1.5e3 } ] }, [], 'last' ],
+	'after' : None }
+
+class IterJsonListTest(unittest.TestCase):
+	def test_chunk_sizes(self):
+		body = json.dumps(DOCUMENT, indent=2)
+
+		# the values, the numbers and the multi-byte characters are split across chunks
+		for chunk_size in (1, 2, 3, 7, 64, 65536):
+			response = _Response(body)
+
+			self.assertEqual(list(iter_json_list(response, 'streams', chunk_size)), DOCUMENT['streams'], chunk_size)
+			self.assertEqual(response.closed, True)
+
+	def test_empty_list(self):
+		self.assertEqual(list(iter_json_list(_Response('{"total": 0, "users": [ ]}'), 'users')), [])
+
+	def test_missing_key(self):
+		response = _Response('{"total": 0, "users": []}')
+
+		self.assertRaises(KeyError, list, iter_json_list(response, 'streams'))
+		self.assertEqual(response.closed, True)
+
+	def test_invalid(self):
+		self.assertRaises(ValueError, list, iter_json_list(_Response('{"streams": [1, 2'), 'streams', 2))
+		self.assertRaises(ValueError, list, iter_json_list(_Response('["streams"]'), 'streams'))
+
+	def test_stopped_early(self):
+		response = _Response(json.dumps(DOCUMENT))
+		items = iter_json_list(response, 'streams', 4)
+
+		self.assertEqual(next(items), DOCUMENT['streams'][0])
+		items.close()
+
+		self.assertEqual(response.closed, True)
+
+	def test_latin1(self):
+		body = u'{"users": ["été"]}'.encode('latin-1')
+
+		self.assertEqual(list(iter_json_list(_Response(body, 'latin-1'), 'users', 1)), [ u'été' ])
+
+class IterListTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(500, 50, 0, 0)
+		self.server = Server('127.0.0.1', self.mock.start())
+		self.server.auth_by_auth_basic('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+
+	def test_iter_streams(self):
+		titles = [ stream._data['title'] for stream in self.server.iter_streams() ]
+
+		self.assertEqual(len(titles), 501)
+		self.assertEqual(sorted(titles), sorted([ stream['title'] for stream in self.mock.state.resources['streams'].values() ]))
+
+	def test_iter_users(self):
+		self.assertEqual(sorted([ user._data['username'] for user in self.server.iter_users() ]), sorted(self.mock.state.resources['users'].keys()))
+
+if __name__ == '__main__':
+	unittest.main()
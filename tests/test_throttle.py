@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+
+import unittest
+
+from mock_server import MockGraylog
+from pygraylog.session import Session
+from pygraylog.throttle import AdaptiveLimiter
+
+class AdaptiveLimiterTest(unittest.TestCase):
+	def test_can_retry(self):
+		limiter = AdaptiveLimiter(retries=2)
+
+		self.assertEqual(limiter.can_retry('get', 0), True)
+		self.assertEqual(limiter.can_retry('GET', 2), False)
+		self.assertEqual(limiter.can_retry('POST', 0), False)
+
+	def test_get_delay(self):
+		limiter = AdaptiveLimiter(backoff=1, max_backoff=10)
+
+		self.assertEqual(limiter.get_delay(0, '3'), 3)
+		self.assertEqual(limiter.get_delay(0, '60'), 10)
+		self.assertTrue(0 <= limiter.get_delay(8, 'soon') <= 10)
+
+	def test_decrease(self):
+		limiter = AdaptiveLimiter(rate=100, concurrency=8)
+
+		limiter.acquire()
+		limiter.release(0, True)
+		self.assertEqual((limiter.rate, limiter.concurrency), (50, 4))
+
+		# a burst of failures counts once
+		limiter.acquire()
+		limiter.release(0, True)
+		self.assertEqual((limiter.rate, limiter.concurrency), (50, 4))
+
+		limiter.acquire()
+		limiter.release(0)
+		self.assertEqual(limiter.rate, 51)
+
+	def test_slow_call(self):
+		limiter = AdaptiveLimiter(concurrency=8, latency_target=1)
+
+		limiter.acquire()
+		limiter.release(2)
+		self.assertEqual(limiter.concurrency, 4)
+
+	def test_bad_limits(self):
+		self.assertRaises(ValueError, AdaptiveLimiter, 0)
+		self.assertRaises(ValueError, AdaptiveLimiter, None, 0)
+
+class ThrottledSessionTest(unittest.TestCase):
+	def setUp(self):
+		self.mock = MockGraylog(0, 0, 0, 0, error_rate=1, error_code=503)
+		self.url = "http://127.0.0.1:%i/api/users" % self.mock.start()
+
+		self.limiter = AdaptiveLimiter(concurrency=1, retries=2, backoff=0)
+		self.session = Session(5, self.limiter)
+		self.session.auth = ('admin', 'admin')
+
+	def tearDown(self):
+		self.mock.stop()
+		self.session.close()
+
+	def test_retried(self):
+		r = self.session.get(self.url)
+
+		self.assertEqual(r.status_code, 503)
+		self.assertEqual(self.mock.calls, 3)
+		self.assertEqual(self.session.stats.summary()['total']['retries'], 2)
+		self.assertEqual(self.limiter._in_flight, 0)
+
+	def test_not_idempotent(self):
+		self.assertEqual(self.session.post(self.url, json={}).status_code, 503)
+		self.assertEqual(self.mock.calls, 1)
+		self.assertEqual(self.limiter._in_flight, 0)
+
+	def test_recovered(self):
+		self.mock.error_rate = 0
+
+		self.assertEqual(self.session.get(self.url).status_code, 200)
+		self.assertEqual(self.mock.calls, 1)
+
+	def test_released_on_error(self):
+		def hook(r, *args, **kwargs):
+			raise RuntimeError("broken hook")
+
+		for i in range(2):
+			self.assertRaises(RuntimeError, self.session.get, self.url, hooks={ 'response' : hook })
+
+		# the only slot has been given back each time
+		self.assertEqual(self.limiter._in_flight, 0)
+
+	def test_unreachable(self):
+		self.mock.stop()
+
+		self.assertRaises(IOError, self.session.get, self.url)
+		self.assertEqual(self.limiter._in_flight, 0)
+
+if __name__ == '__main__':
+	unittest.main()
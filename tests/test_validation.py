@@ -0,0 +1,56 @@
+#! /usr/bin/env python
+
+import copy, unittest
+
+import jsonschema
+
+from pygraylog.validation import ValidatorRegistry, OFF, STRICT
+
+SCHEMA = { 'id' : 'CreateStreamRequest', 'properties' : { 'title' : { 'type' : 'string' } } }
+
+class ValidatorRegistryTest(unittest.TestCase):
+	def test_validate(self):
+		registry = ValidatorRegistry()
+
+		self.assertEqual(registry.validate({ 'title' : 'a' }, SCHEMA), True)
+		self.assertRaises(jsonschema.ValidationError, registry.validate, { 'title' : 1 }, SCHEMA)
+		self.assertEqual(registry.validate({ 'title' : 1 }, SCHEMA, OFF), False)
+		self.assertEqual(registry.validate({ 'title' : 1 }, {}), False)
+
+	def test_fetched_again(self):
+		registry = ValidatorRegistry()
+		validator = registry.get(SCHEMA)
+
+		# the copies of a refetched schema share one entry
+		for i in range(10):
+			self.assertTrue(registry.get(copy.deepcopy(SCHEMA)) is validator)
+
+		self.assertEqual(len(registry._validators), 1)
+
+	def test_changed(self):
+		registry = ValidatorRegistry()
+		registry.get(SCHEMA)
+
+		schema = copy.deepcopy(SCHEMA)
+		schema['properties']['title']['type'] = 'integer'
+
+		self.assertEqual(registry.validate({ 'title' : 1 }, schema), True)
+		self.assertEqual(len(registry._validators), 1)
+
+	def test_anonymous(self):
+		registry = ValidatorRegistry()
+		schema = { 'properties' : { 'title' : { 'type' : 'string' } } }
+
+		self.assertTrue(registry.get(copy.deepcopy(schema)) is registry.get(schema))
+
+	def test_bad_mode(self):
+		registry = ValidatorRegistry()
+
+		self.assertRaises(ValueError, registry.set_mode, 'lax')
+		self.assertEqual(registry.error_msg, "bad validation mode given: lax")
+		self.assertRaises(ValueError, registry.set_mode, STRICT, 2)
+		self.assertEqual(registry.error_msg, "bad sample rate given: 2")
+		self.assertEqual(registry.mode, STRICT)
+
+if __name__ == '__main__':
+	unittest.main()